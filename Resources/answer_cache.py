@@ -0,0 +1,199 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.models import ChatResponse
+
+PartitionKey = Tuple[str, str]
+
+
+# --- Index Generation Markers ---
+# The ingestion script runs in a different process from the chat service, so it cannot
+# reach into this cache directly. Instead it touches a per-(user, vehicle) marker file
+# after re-indexing, and the cache drops any answers stored under an older generation.
+
+def _marker_path(directory: str, user_id: str, vehicle_id: str) -> str:
+    digest = hashlib.sha256(f"{user_id}:{vehicle_id}".encode()).hexdigest()
+    return os.path.join(directory, f"{digest}.gen")
+
+def mark_reindexed(directory: str, user_id: str, vehicle_id: str) -> None:
+    """Signals that a vehicle's manuals were re-indexed, invalidating cached answers."""
+    os.makedirs(directory, exist_ok=True)
+    path = _marker_path(directory, user_id, vehicle_id)
+    with open(path, "a"):
+        pass
+    os.utime(path, ns=(time.time_ns(), time.time_ns()))
+
+def read_generation(directory: str, user_id: str, vehicle_id: str) -> int:
+    """Returns the current index generation for a vehicle (0 if never re-indexed)."""
+    try:
+        return os.stat(_marker_path(directory, user_id, vehicle_id)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+class _Entry:
+    __slots__ = ("partition", "vector", "response", "expires_at")
+
+    def __init__(self, partition: PartitionKey, vector: np.ndarray, response: ChatResponse, expires_at: float):
+        self.partition = partition
+        self.vector = vector
+        self.response = response
+        self.expires_at = expires_at
+
+
+class _Partition:
+    """All cached answers for a single (user_id, vehicle_id) pair."""
+    __slots__ = ("entry_ids", "generation", "_matrix", "_matrix_ids")
+
+    def __init__(self, generation: int):
+        self.entry_ids: List[int] = []
+        self.generation = generation
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+    def add(self, entry_id: int) -> None:
+        self.entry_ids.append(entry_id)
+        self._matrix = None
+
+    def remove(self, entry_id: int) -> None:
+        self.entry_ids.remove(entry_id)
+        self._matrix = None
+
+    def matrix(self, entries: "OrderedDict[int, _Entry]") -> Tuple[np.ndarray, List[int]]:
+        # Stacked lazily so a burst of stores only pays for one rebuild on the next lookup.
+        if self._matrix is None:
+            self._matrix_ids = list(self.entry_ids)
+            self._matrix = np.stack([entries[i].vector for i in self._matrix_ids])
+        return self._matrix, self._matrix_ids
+
+
+class SemanticAnswerCache:
+    """
+    Caches final ChatResponses per (user_id, vehicle_id), keyed by the query embedding.
+    A lookup is a hit when a stored query's cosine similarity to the new one meets the threshold,
+    letting near-identical questions skip retrieval and generation entirely.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 3600,
+        generation_dir: Optional[str] = None,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation_dir = generation_dir
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._partitions: Dict[PartitionKey, _Partition] = {}
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # --- Public API ---
+
+    def lookup(self, user_id: str, vehicle_id: str, embedding: List[float]) -> Optional[ChatResponse]:
+        """Returns a cached response for a semantically equivalent query, if one exists."""
+        partition = self._get_partition((user_id, vehicle_id))
+        if partition is None or not partition.entry_ids:
+            self.misses += 1
+            return None
+
+        matrix, ids = partition.matrix(self._entries)
+        scores = matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        entry_id = ids[best]
+        entry = self._entries[entry_id]
+
+        if scores[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(entry_id)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return entry.response
+
+    def store(self, user_id: str, vehicle_id: str, embedding: List[float], response: ChatResponse) -> None:
+        """Adds a freshly generated response to the cache."""
+        key = (user_id, vehicle_id)
+        partition = self._get_partition(key)
+        if partition is None:
+            partition = _Partition(self._current_generation(key))
+            self._partitions[key] = partition
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(
+            partition=key,
+            vector=self._normalize(embedding),
+            response=response,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        partition.add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str, vehicle_id: str) -> None:
+        """Drops every cached answer for a vehicle."""
+        partition = self._partitions.pop((user_id, vehicle_id), None)
+        if partition is None:
+            return
+        for entry_id in partition.entry_ids:
+            del self._entries[entry_id]
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "partitions": len(self._partitions),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    # --- Internals ---
+
+    def _get_partition(self, key: PartitionKey) -> Optional[_Partition]:
+        partition = self._partitions.get(key)
+        if partition is not None and partition.generation != self._current_generation(key):
+            self.invalidate(*key)
+            return None
+        return partition
+
+    def _current_generation(self, key: PartitionKey) -> int:
+        if not self.generation_dir:
+            return 0
+        return read_generation(self.generation_dir, *key)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        partition = self._partitions[entry.partition]
+        partition.remove(entry_id)
+        if not partition.entry_ids:
+            del self._partitions[entry.partition]
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,175 @@
+import asyncio
+import datetime
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.models import ContextSource, KnowledgeAttestation
+
+
+def hash_context(context: Sequence[ContextSource]) -> List[str]:
+    """Returns the sorted sha256 hashes of the context contents, as committed to in attestations."""
+    return sorted(hashlib.sha256(src.content.encode()).hexdigest() for src in context)
+
+def attestation_message(timestamp: str, query: str, response: str, context_hashes: Sequence[str]) -> str:
+    """The canonical text that is signed (or committed to as a Merkle leaf) for a response."""
+    return f"""
+        Gear AI Knowledge Attestation
+        Timestamp: {timestamp}
+        Query: {query}
+        Response: {response}
+        Context Hashes: {','.join(context_hashes)}
+        """
+
+def by_reference(attestation: KnowledgeAttestation, query: str) -> KnowledgeAttestation:
+    """
+    The attestation with its copy of the response, and of the query when it is `query`,
+    replaced by sha256 hashes. A query that differs from the request's (an answer-cache hit
+    attested for the original asker) stays verbatim so the signature can still be checked.
+    """
+    if attestation.response is None:
+        return attestation
+    update = {"response": None, "response_hash": hashlib.sha256(attestation.response.encode()).hexdigest()}
+    if attestation.query == query:
+        update.update(query=None, query_hash=hashlib.sha256(query.encode()).hexdigest())
+    return attestation.model_copy(update=update)
+
+def _utc_now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class AttestationSigner:
+    """Holds the attestation key, derived once at startup rather than on every signature."""
+
+    def __init__(self, private_key: str):
+        # eth_account is slow to import; deferring it keeps it out of module import (and cold start)
+        from eth_account import Account
+
+        self._account = Account.from_key(private_key)
+
+    @property
+    def address(self) -> str:
+        return self._account.address
+
+    def sign_text(self, message: str) -> str:
+        from eth_account.messages import encode_defunct
+
+        return self._account.sign_message(encode_defunct(text=message)).signature.hex()
+
+    def sign(self, query: str, response: str, context_hashes: Sequence[str]) -> Tuple[str, str, str]:
+        """Signs a single response. Returns (timestamp, signature, signed message)."""
+        timestamp = _utc_now()
+        message = attestation_message(timestamp, query, response, context_hashes)
+        return timestamp, self.sign_text(message), message
+
+
+# --- Merkle Batching ---
+
+def _hash_pair(left: str, right: str) -> str:
+    return hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+def merkle_root_and_proofs(leaves: Sequence[str]) -> Tuple[str, List[List[Dict[str, str]]]]:
+    """
+    Builds a sha256 Merkle tree over hex leaf hashes. Odd levels duplicate their last node.
+    Returns the root and, per leaf, its inclusion proof as a list of {"position", "hash"}
+    siblings from the leaf up.
+    """
+    proofs: List[List[Dict[str, str]]] = [[] for _ in leaves]
+    positions = list(range(len(leaves)))  # Index of each leaf's ancestor in the current level
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        for leaf_index, node_index in enumerate(positions):
+            sibling_index = node_index ^ 1
+            proofs[leaf_index].append({
+                "position": "left" if sibling_index < node_index else "right",
+                "hash": level[sibling_index],
+            })
+            positions[leaf_index] = node_index // 2
+        level = [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0], proofs
+
+def verify_merkle_proof(leaf: str, proof: Sequence[Dict[str, str]], root: str) -> bool:
+    node = leaf
+    for step in proof:
+        node = _hash_pair(step["hash"], node) if step["position"] == "left" else _hash_pair(node, step["hash"])
+    return node == root
+
+def batch_root_message(root: str, timestamp: str) -> str:
+    """The text signed for a batch: verifiers rebuild it from `merkle_root` and `batch_timestamp`."""
+    return f"Gear AI Knowledge Attestation Batch\nTimestamp: {timestamp}\nMerkle Root: {root}"
+
+
+class MerkleAttestationBatcher:
+    """
+    Collects response attestations into a Merkle tree and signs one root per interval.
+    Each caller waits at most `interval_seconds` (less when the batch fills up) and gets
+    back the signed root plus its own inclusion proof. The batch roots are what would be
+    anchored on-chain.
+    """
+
+    def __init__(self, signer: AttestationSigner, interval_seconds: float = 0.2, max_batch_size: int = 256):
+        self.signer = signer
+        self.interval_seconds = interval_seconds
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set = set()
+        self.batches_signed = 0
+
+    async def attest(self, query: str, response: str, context_hashes: List[str]) -> KnowledgeAttestation:
+        timestamp = _utc_now()
+        leaf = hashlib.sha256(attestation_message(timestamp, query, response, context_hashes).encode()).hexdigest()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((leaf, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush(loop, delay=0)
+        elif self._flush_handle is None:
+            self._schedule_flush(loop, delay=self.interval_seconds)
+
+        root, signature, batch_timestamp, proof = await future
+        return KnowledgeAttestation(
+            query=query,
+            response=response,
+            context_hashes=context_hashes,
+            timestamp=timestamp,
+            signature=signature,
+            mode="merkle_batch",
+            leaf_hash=leaf,
+            merkle_root=root,
+            merkle_proof=proof,
+            batch_timestamp=batch_timestamp,
+        )
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        # Hold a reference so the flush task is not garbage collected mid-signature
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self) -> None:
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            leaves = [leaf for leaf, _ in batch]
+            root, proofs = merkle_root_and_proofs(leaves)
+            timestamp = _utc_now()
+            # One signature for the whole batch, kept off the event loop
+            signature = await asyncio.to_thread(self.signer.sign_text, batch_root_message(root, timestamp))
+            self.batches_signed += 1
+            for (_, future), proof in zip(batch, proofs):
+                if not future.done():
+                    future.set_result((root, signature, timestamp, proof))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
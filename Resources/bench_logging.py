@@ -0,0 +1,128 @@
+"""
+Measures what request logging costs the request path: the time a request spends in
+its log calls, before and after moving to the queue-based setup in logging_config.
+
+"before" is the old middleware: two f-string INFO calls per request through
+synchronous stream and file handlers. "after" is one access record per request,
+handed to the background writer and sampled by LOG_SAMPLE_RATES. Handlers write to
+temp files; --stall-ms makes every --stall-every'th write stall, like a slow disk
+or a blocked stdout pipe.
+
+Run from the chat service root:
+    python bench_logging.py --requests 20000 --stall-ms 5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.logging_config import setup_logging, stop_logging
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+def stalling(handler: logging.Handler, stall_seconds: float, every: int) -> logging.Handler:
+    """Makes every `every`th emit of `handler` sleep for `stall_seconds`."""
+    emit, count = handler.emit, [0]
+
+    def stalled_emit(record: logging.LogRecord) -> None:
+        count[0] += 1
+        if stall_seconds and count[0] % every == 0:
+            time.sleep(stall_seconds)
+        emit(record)
+
+    handler.emit = stalled_emit
+    return handler
+
+def measure(log_request: Callable[[int], None], requests: int) -> Dict[str, float]:
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        log_request(i)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "mean_us": round(sum(latencies) / len(latencies) * 1e6, 2),
+        "p50_us": round(percentile(latencies, 0.50) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 2),
+        "max_us": round(max(latencies) * 1e6, 2),
+    }
+
+
+def bench_before(workdir: str, requests: int, stall_seconds: float, stall_every: int) -> Dict[str, float]:
+    # Equivalent of logging.basicConfig plus the app.log FileHandler, writing on the caller's thread
+    stream = open(os.path.join(workdir, "before-stream.log"), "w")
+    handlers = [logging.StreamHandler(stream), logging.FileHandler(os.path.join(workdir, "before-file.log"))]
+    root = logging.getLogger()
+    root.handlers = [stalling(handler, stall_seconds, stall_every) for handler in handlers]
+    root.setLevel(logging.INFO)
+    logger = logging.getLogger("src.main")
+
+    def log_request(i: int) -> None:
+        logger.info(f"Incoming request: POST /chat")
+        logger.info(f"Outgoing response: {200}")
+
+    try:
+        return measure(log_request, requests)
+    finally:
+        for handler in handlers:
+            handler.close()
+        stream.close()
+        root.handlers = []
+
+def bench_after(workdir: str, requests: int, stall_seconds: float, stall_every: int, sample_rate: float) -> Dict[str, float]:
+    stderr, sys.stderr = sys.stderr, open(os.path.join(workdir, f"after-{sample_rate}-stream.log"), "w")
+    try:
+        listener = setup_logging(
+            "INFO",
+            log_file=os.path.join(workdir, f"after-{sample_rate}-file.log"),
+            sample_rates={"src.access": sample_rate},
+        )
+        for handler in listener.handlers:
+            stalling(handler, stall_seconds, stall_every)
+        access_logger = logging.getLogger("src.access")
+
+        def log_request(i: int) -> None:
+            access_logger.log(logging.INFO, "%s %s %s %.1fms", "POST", "/chat", 200, 12.5)
+
+        result = measure(log_request, requests)
+        stop_logging()
+        return result
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Per-request logging overhead, before and after queue-based logging.")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--stall-ms", type=float, default=5.0, help="Simulated handler stall (0 = none)")
+    parser.add_argument("--stall-every", type=int, default=500, help="Stall on every Nth write per handler")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    workdir = tempfile.mkdtemp(prefix="gear-ai-log-bench-")
+    stall = args.stall_ms / 1000
+    try:
+        results = {
+            "requests": args.requests,
+            "stall_ms": args.stall_ms,
+            "stall_every": args.stall_every,
+            "before": bench_before(workdir, args.requests, stall, args.stall_every),
+            "after_sampled_1.0": bench_after(workdir, args.requests, stall, args.stall_every, 1.0),
+            "after_sampled_0.1": bench_after(workdir, args.requests, stall, args.stall_every, 0.1),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
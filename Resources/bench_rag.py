@@ -0,0 +1,453 @@
+"""
+Offline benchmark and load-test harness for the chat service.
+
+Drives the FastAPI app in-process with concurrent /chat traffic and runs the ingestion
+pipeline over synthetic PDFs, with every upstream swapped for a local stand-in:
+the stub LLM client (deterministic embeddings, chat with configurable latency and
+token rate) and the local vector store. No network or credentials are needed.
+
+Run from the chat service root:
+    python bench_rag.py --concurrency 1 8 32 --requests 200 --pages 10 100 500 --out bench.json
+    python bench_rag.py --baseline bench.json   # fails if results regress past --tolerance
+    python bench_rag.py --fleet-vehicles 200    # one question across a fleet: serial /chat vs /chat/batch
+    python bench_rag.py --response-requests 200 # CPU and bytes per large /chat answer, by encoding option
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+from typing import Dict, List
+
+# Stand-ins must be configured before any service module reads its settings
+_WORKDIR = tempfile.mkdtemp(prefix="gear-ai-bench-")
+atexit.register(shutil.rmtree, _WORKDIR, ignore_errors=True)
+os.environ.update({
+    "OPENAI_API_KEY": "bench",
+    "PINECONE_API_KEY": "bench",
+    "ATTESTATION_PRIVATE_KEY": "0x" + "11" * 32,
+    "LLM_BACKEND": "stub",
+    "VECTOR_STORE_BACKEND": "local",
+    "LOCAL_VECTOR_STORE_DIR": os.path.join(_WORKDIR, "vectors"),
+    "EMBEDDING_CACHE_PATH": os.path.join(_WORKDIR, "embeddings.sqlite3"),
+    "CHUNK_STORE_PATH": os.path.join(_WORKDIR, "chunks.sqlite3"),
+    "INGEST_MANIFEST_DIR": os.path.join(_WORKDIR, "manifests"),
+    "INDEX_GENERATION_DIR": os.path.join(_WORKDIR, "generations"),
+    "TRACE_SAMPLE_RATE": "0",
+    "LOG_LEVEL": "WARNING",
+})
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fitz  # PyMuPDF
+import httpx
+
+BENCH_USER = "bench-user"
+BENCH_VEHICLE = "bench-vehicle"
+
+# Vocabulary for synthetic manuals: generic filler plus automotive terms queries can hit
+_FILLER = [f"word{i}" for i in range(2000)]
+_TERMS = [
+    "engine", "oil", "0W-20", "synthetic", "torque", "lug", "nut", "tire", "pressure", "psi",
+    "coolant", "brake", "fluid", "DOT3", "transmission", "filter", "P0420", "catalyst", "battery",
+    "spark", "plug", "wiper", "headlight", "fuse", "capacity", "quarts", "interval", "miles",
+]
+_QUESTIONS = [
+    "What engine oil does my car take?",
+    "What is the tire pressure in psi?",
+    "How often should I change the transmission fluid?",
+    "What does code P0420 mean?",
+    "What is the lug nut torque?",
+    "Which brake fluid should I use?",
+    "What is the oil capacity in quarts?",
+    "Where is the headlight fuse?",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+def max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def make_synthetic_pdf(path: str, pages: int, words_per_page: int = 450, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        words = [rng.choice(_TERMS) if rng.random() < 0.15 else rng.choice(_FILLER) for _ in range(words_per_page)]
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), " ".join(words), fontsize=7)
+    doc.save(path)
+    doc.close()
+
+
+# --- Ingestion ---
+
+async def bench_ingestion(page_counts: List[int]) -> List[Dict]:
+    from process_pdf import ingest_pdf
+
+    results = []
+    for pages in page_counts:
+        path = os.path.join(_WORKDIR, f"synthetic-{pages}p.pdf")
+        make_synthetic_pdf(path, pages, seed=pages)
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        stats = await ingest_pdf(path, BENCH_USER, f"{BENCH_VEHICLE}-{pages}")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({
+            "pages": pages,
+            "chunks": stats.chunks,
+            "seconds": round(stats.seconds, 3),
+            "pages_per_sec": round(stats.pages_per_sec, 1),
+            "peak_python_mb": round(peak / (1024 * 1024), 2),
+        })
+    return results
+
+
+# --- Chat ---
+
+async def bench_chat(concurrency_levels: List[int], requests: int, path: str, unique_messages: bool) -> List[Dict]:
+    from src.main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in concurrency_levels:
+            latencies: List[float] = []
+            errors = 0
+            counter = iter(range(requests))
+
+            async def worker():
+                nonlocal errors
+                for i in counter:
+                    message = _QUESTIONS[i % len(_QUESTIONS)]
+                    if unique_messages:
+                        # Defeat the answer cache so every request exercises the full pipeline
+                        message = f"{message} (request {concurrency}-{i})"
+                    started = time.perf_counter()
+                    response = await client.post(path, json={
+                        "user_id": BENCH_USER,
+                        "vehicle_id": f"{BENCH_VEHICLE}-chat",
+                        "message": message,
+                    })
+                    await response.aread()
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            results.append({
+                "endpoint": path,
+                "concurrency": concurrency,
+                "requests": requests,
+                "errors": errors,
+                "throughput_rps": round(requests / elapsed, 1),
+                **latency_summary(latencies),
+                "max_rss_mb": max_rss_mb(),
+            })
+    return results
+
+
+# --- Fleet ---
+
+async def bench_fleet(vehicles: int) -> Dict:
+    """Asks one question about every vehicle in a fleet, first as serial /chat calls, then as one /chat/batch."""
+    from src.main import app
+    from process_pdf import ingest_pdf
+
+    manual = os.path.join(_WORKDIR, "fleet-manual.pdf")
+    make_synthetic_pdf(manual, 5, seed=7)
+    vehicle_ids = [f"{BENCH_VEHICLE}-fleet-{i}" for i in range(vehicles)]
+    for vehicle_id in vehicle_ids:
+        await ingest_pdf(manual, BENCH_USER, vehicle_id)
+
+    def fleet_requests(phase: str) -> List[Dict]:
+        # A distinct message per phase keeps the batch from being served by the serial run's answer cache
+        message = f"What engine oil does my car take? ({phase})"
+        return [{"user_id": BENCH_USER, "vehicle_id": vehicle_id, "message": message} for vehicle_id in vehicle_ids]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        errors = 0
+        started = time.perf_counter()
+        for request in fleet_requests("serial"):
+            response = await client.post("/chat", json=request)
+            errors += response.status_code != 200
+        serial_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = await client.post("/chat/batch", json={"requests": fleet_requests("batch")})
+        results = [json.loads(line) for line in response.text.splitlines() if line]
+        batch_seconds = time.perf_counter() - started
+        errors += sum(not result["success"] for result in results) + vehicles - len(results)
+
+    return {
+        "vehicles": vehicles,
+        "errors": errors,
+        "serial_seconds": round(serial_seconds, 3),
+        "batch_seconds": round(batch_seconds, 3),
+        "speedup": round(serial_seconds / batch_seconds, 1) if batch_seconds else 0.0,
+    }
+
+
+# --- Response Encoding ---
+
+_COMPLEX_QUESTIONS = [
+    "Compare the engine oil and transmission fluid service intervals",
+    "Walk me through checking tire pressure and lug nut torque",
+    "Troubleshoot code P0420 and the catalyst step by step",
+    "What is the difference between the brake fluid and coolant capacity?",
+]
+
+async def bench_response(requests: int) -> List[Dict]:
+    """
+    Bytes on the wire per /chat answer on the complex route (the largest context), and the
+    CPU spent turning one such answer into a response, for the old endpoint (FastAPI
+    serializing through `response_model`) and the current one with each attestation and
+    encoding option.
+    """
+    from fastapi.routing import serialize_response
+    from starlette.requests import Request
+    from src.main import app, _answer_chat, _outgoing, _json_response
+    from src.models import ChatRequest, ChatResponse
+    from src.services.compression import brotli
+    from process_pdf import ingest_pdf
+
+    manual = os.path.join(_WORKDIR, "response-manual.pdf")
+    make_synthetic_pdf(manual, 50, seed=11)
+    vehicle_id = f"{BENCH_VEHICLE}-response"
+    await ingest_pdf(manual, BENCH_USER, vehicle_id)
+
+    # The old endpoint, mounted beside the new one so both pass through the same middleware
+    async def legacy_chat(request: ChatRequest):
+        return await _answer_chat(request)
+    app.add_api_route("/bench/legacy-chat", legacy_chat, methods=["POST"], response_model=ChatResponse)
+    legacy_field = app.router.routes[-1].response_field
+
+    variants = [
+        ("legacy", "identity", None),
+        ("current", "identity", False),
+        ("reference", "identity", True),
+        ("gzip", "gzip", False),
+        ("reference+gzip", "gzip", True),
+    ]
+    if brotli is not None:
+        variants.append(("reference+br", "br", True))
+
+    def chat_request(i: int, reference) -> Dict:
+        payload = {
+            "user_id": BENCH_USER,
+            "vehicle_id": vehicle_id,
+            # Unique so each request runs the whole pipeline rather than the answer cache
+            "message": f"{_COMPLEX_QUESTIONS[i % len(_COMPLEX_QUESTIONS)]} (response {i})",
+        }
+        if reference is not None:
+            payload["attestation_by_reference"] = reference
+        return payload
+
+    sample = await _answer_chat(ChatRequest(**chat_request(0, None)))
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, accept_encoding, reference in variants:
+            path = "/bench/legacy-chat" if reference is None else "/chat"
+            wire_bytes = 0
+            errors = 0
+            for i in range(requests):
+                # Raw bytes, so the client neither decompresses nor counts decoded size
+                headers = {"Accept-Encoding": accept_encoding}
+                async with client.stream("POST", path, json=chat_request(i, reference), headers=headers) as response:
+                    wire_bytes += sum([len(chunk) async for chunk in response.aiter_raw()])
+                    errors += response.status_code != 200
+
+            # Encoding alone: the rest of the pipeline is the same for every variant
+            http_request = Request({"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]})
+            request = ChatRequest(**chat_request(0, reference))
+            started_cpu = time.process_time()
+            for _ in range(requests):
+                if reference is None:
+                    await serialize_response(field=legacy_field, response_content=sample, dump_json=True)
+                else:
+                    _json_response(http_request, _outgoing(request, sample).model_dump_json().encode())
+            encode_seconds = time.process_time() - started_cpu
+
+            results.append({
+                "variant": name,
+                "requests": requests,
+                "errors": errors,
+                "encode_cpu_us": round(encode_seconds / requests * 1e6, 1),
+                "bytes_per_response": round(wire_bytes / requests),
+            })
+    return results
+
+
+# --- Cold Start ---
+
+# Runs in a fresh interpreter: import the app, run its startup, then serve /ready and a first /chat
+_COLD_START_SCRIPT = """
+import sys, time, json, asyncio
+started = time.perf_counter()
+sys.path[:0] = {paths!r}
+from src.main import app
+imported = time.perf_counter()
+import httpx
+
+async def main():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            ready_status = (await client.get("/ready")).status_code
+            chat_started = time.perf_counter()
+            await client.post("/chat", json={{"user_id": "cold", "vehicle_id": "cold", "message": "What engine oil does my car take?"}})
+            chat_finished = time.perf_counter()
+    print(json.dumps({{
+        "import_ms": round((imported - started) * 1000, 1),
+        "ready_ms": round((ready - started) * 1000, 1),
+        "ready_status": ready_status,
+        "first_chat_ms": round((chat_finished - chat_started) * 1000, 1),
+    }}))
+
+asyncio.run(main())
+"""
+
+def bench_cold_start() -> List[Dict]:
+    """Measures import, startup and first-request latency in fresh processes, with and without warmup."""
+    results = []
+    script = _COLD_START_SCRIPT.format(paths=sys.path[:2])
+    for warmup in (False, True):
+        env = {**os.environ, "WARMUP_ENABLED": str(warmup).lower()}
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+        process_ms = round((time.perf_counter() - started) * 1000, 1)
+        results.append({"warmup": warmup, "process_ms": process_ms, **json.loads(completed.stdout.strip().splitlines()[-1])})
+    return results
+
+
+# --- Baseline Comparison ---
+
+# Metrics where bigger is better; everything else compared is a latency
+_HIGHER_IS_BETTER = {"throughput_rps", "pages_per_sec"}
+_COMPARED = {"throughput_rps", "p50_ms", "p95_ms", "p99_ms", "pages_per_sec"}
+
+def compare_to_baseline(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Returns a description of every metric that regressed by more than `tolerance` (a fraction)."""
+    regressions = []
+    for section, key_field in (("chat", "concurrency"), ("ingestion", "pages")):
+        previous = {row[key_field]: row for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            base = previous.get(row[key_field])
+            if base is None:
+                continue
+            for metric in _COMPARED & row.keys() & base.keys():
+                old, new = base[metric], row[metric]
+                if not old:
+                    continue
+                change = (new - old) / old
+                regressed = change < -tolerance if metric in _HIGHER_IS_BETTER else change > tolerance
+                if regressed:
+                    regressions.append(f"{section}[{key_field}={row[key_field]}].{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    from src.services.rag_service import rag_service
+    from src.services.stub_llm import StubLLMClient
+
+    rag_service.llm_client = StubLLMClient(
+        latency_seconds=args.llm_latency_ms / 1000,
+        tokens_per_second=args.llm_tokens_per_sec,
+    )
+
+    # The chat corpus is ingested first so queries have something to retrieve
+    ingestion = await bench_ingestion(args.pages)
+    chat_manual = os.path.join(_WORKDIR, "chat-manual.pdf")
+    make_synthetic_pdf(chat_manual, 50, seed=42)
+    from process_pdf import ingest_pdf
+    await ingest_pdf(chat_manual, BENCH_USER, f"{BENCH_VEHICLE}-chat")
+
+    chat = await bench_chat(args.concurrency, args.requests, args.endpoint, unique_messages=not args.allow_cache_hits)
+    fleet = await bench_fleet(args.fleet_vehicles) if args.fleet_vehicles else None
+    response = await bench_response(args.response_requests) if args.response_requests else None
+    cold_start = bench_cold_start()
+    return {
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "config": {
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_tokens_per_sec": args.llm_tokens_per_sec,
+            "endpoint": args.endpoint,
+            "allow_cache_hits": args.allow_cache_hits,
+        },
+        "ingestion": ingestion,
+        "chat": chat,
+        "fleet": fleet,
+        "response": response,
+        "cold_start": cold_start,
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the chat service.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--endpoint", default="/chat", choices=["/chat", "/chat/stream"])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500], help="Synthetic PDF sizes to ingest")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Stub LLM time to first byte")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=0.0, help="Stub LLM generation rate (0 = instant)")
+    parser.add_argument("--allow-cache-hits", action="store_true", help="Repeat questions verbatim so the answer cache can serve them")
+    parser.add_argument("--fleet-vehicles", type=int, default=100, help="Fleet size for the batch benchmark (0 = skip)")
+    parser.add_argument("--response-requests", type=int, default=100, help="Requests per variant for the response encoding benchmark (0 = skip)")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previous results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression vs. baseline, as a fraction")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    # Ingestion progress goes to stderr so stdout stays parseable JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run(args))
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
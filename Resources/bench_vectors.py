@@ -0,0 +1,173 @@
+"""
+Recall, latency and memory of the local vector store's search modes, measured against
+exact full-precision search at the embeddings' native dimension.
+
+Each configuration is a (dimensions, quantization, rerank factor) combination:
+shortened embeddings are approximated by truncating and renormalizing the native ones,
+which is how text-embedding-3 models shorten; "int8" and "binary" search compact codes
+and rerank the best top_k * factor rows exactly. Recall@k is the fraction of the
+baseline's top k that a configuration returns.
+
+The corpus is either real embeddings from the embedding store (every vector in it, with
+a held-out sample as queries) or synthetic clustered vectors.
+
+Run from the chat service root:
+    python bench_vectors.py --vectors 50000 --dims 1536 --dimensions 512 1024
+    python bench_vectors.py --from-cache .cache/embeddings.sqlite3 --model text-embedding-3-small
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.services.vector_store import LocalVectorStore
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def synthetic_corpus(vectors: int, queries: int, dims: int, clusters: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Clustered unit vectors around a shared offset, roughly like embeddings of related text.
+    Variance decays along the dimensions, as in text-embedding-3 vectors, whose leading
+    dimensions carry the most information so that truncated ones stay usable.
+    """
+    rng = np.random.default_rng(seed)
+    spectrum = 1 / np.sqrt(1 + np.arange(dims) / 32)
+    offset = rng.normal(size=dims) * spectrum
+    centroids = offset + rng.normal(size=(clusters, dims)) * spectrum * 1.5
+
+    def sample(n: int) -> np.ndarray:
+        noise = rng.normal(size=(n, dims)) * spectrum
+        return normalize(centroids[rng.integers(clusters, size=n)] + noise).astype(np.float32)
+
+    return sample(vectors), sample(queries)
+
+def cached_corpus(path: str, model: str, queries: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Every embedding of `model` in an embedding store, with `queries` of them held out."""
+    db = sqlite3.connect(path)
+    rows = [np.frombuffer(blob, dtype=np.float32) for (blob,) in db.execute("SELECT vector FROM embeddings WHERE model = ?", [model])]
+    db.close()
+    if len(rows) <= queries:
+        raise SystemExit(f"{path} holds {len(rows)} {model} embeddings; need more than --queries ({queries})")
+    matrix = normalize(np.stack(rows)).astype(np.float32)
+    order = np.random.default_rng(seed).permutation(len(matrix))
+    return matrix[order[queries:]], matrix[order[:queries]]
+
+
+async def evaluate(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    baseline: Optional[List[List[str]]],
+    dimensions: int,
+    quantization: str,
+    rerank_factor: int,
+    top_k: int,
+) -> Tuple[Dict, List[List[str]]]:
+    directory = tempfile.mkdtemp(prefix="gear-ai-vector-bench-")
+    try:
+        corpus, queries = normalize(corpus[:, :dimensions]), normalize(queries[:, :dimensions])
+        store = LocalVectorStore(directory, quantization, rerank_factor)
+        for start in range(0, len(corpus), 10_000):
+            await store.upsert("bench", "bench", [
+                {"id": str(start + i), "values": row} for i, row in enumerate(corpus[start:start + 10_000])
+            ])
+        # A fresh store, as a service worker would open it
+        store = LocalVectorStore(directory, quantization, rerank_factor)
+        await store.query("bench", "bench", queries[0].tolist(), top_k)
+
+        latencies, results = [], []
+        for query in queries:
+            vector = query.tolist()
+            started = time.perf_counter()
+            matches = await store.query("bench", "bench", vector, top_k)
+            latencies.append(time.perf_counter() - started)
+            results.append([match["id"] for match in matches])
+
+        stats = store.stats()
+        row = {
+            "dimensions": dimensions,
+            "quantization": quantization,
+            "rerank_factor": rerank_factor if quantization != "none" else None,
+            # What a query scans: codes when quantized, otherwise the full-precision matrix
+            "search_bytes": stats["code_bytes"] or stats["vector_bytes"],
+            "vector_bytes": stats["vector_bytes"],
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        }
+        if baseline is not None:
+            row[f"recall@{top_k}"] = round(float(np.mean([
+                len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, baseline)
+            ])), 4)
+        return row, results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+async def run(args: argparse.Namespace) -> Dict:
+    if args.from_cache:
+        corpus, queries = cached_corpus(args.from_cache, args.model, args.queries, args.seed)
+    else:
+        corpus, queries = synthetic_corpus(args.vectors, args.queries, args.dims, args.clusters, args.seed)
+    native = corpus.shape[1]
+
+    reference, baseline = await evaluate(corpus, queries, None, native, "none", 1, args.top_k)
+    reference[f"recall@{args.top_k}"] = 1.0
+    rows = [reference]
+    for dimensions in [native] + [d for d in args.dimensions if d < native]:
+        for quantization in ["none", "int8", "binary"]:
+            for rerank_factor in (args.rerank_factors if quantization != "none" else [1]):
+                if dimensions == native and quantization == "none":
+                    continue
+                row, _ = await evaluate(corpus, queries, baseline, dimensions, quantization, rerank_factor, args.top_k)
+                rows.append(row)
+                print(json.dumps(row), file=sys.stderr)
+    return {
+        "corpus": args.from_cache or "synthetic",
+        "vectors": len(corpus),
+        "queries": len(queries),
+        "native_dimensions": native,
+        "top_k": args.top_k,
+        "results": rows,
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Recall and latency of reduced-dimension and quantized vector search.")
+    parser.add_argument("--from-cache", help="Embedding store (sqlite) to take the corpus from")
+    parser.add_argument("--model", default="text-embedding-3-small", help="Embedding store model key to read")
+    parser.add_argument("--vectors", type=int, default=50_000, help="Synthetic corpus size")
+    parser.add_argument("--dims", type=int, default=1536, help="Synthetic native dimension")
+    parser.add_argument("--clusters", type=int, default=200, help="Synthetic topic clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--dimensions", type=int, nargs="*", default=[512, 1024], help="Shortened dimensions to compare")
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 4, 10, 25])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    results = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
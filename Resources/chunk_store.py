@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Sequence
+
+
+class ChunkStore:
+    """
+    Local store of chunk text and page spans, written by the ingestion script and batch-read
+    by retrieval. Keeping the text here rather than in vector metadata keeps the index small;
+    a query fetches the text for all of its matches in a single lookup by vector id.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " user_id TEXT NOT NULL, vehicle_id TEXT NOT NULL, chunk_id TEXT NOT NULL,"
+            " source_file TEXT NOT NULL, page_start INTEGER, page_end INTEGER, text TEXT NOT NULL,"
+            " PRIMARY KEY (user_id, vehicle_id, chunk_id))"
+        )
+        self._db.commit()
+
+    def put_many(self, user_id: str, vehicle_id: str, chunks: Sequence[Dict]) -> None:
+        """Stores chunks as produced by the ingestion chunker."""
+        rows = [
+            (
+                user_id,
+                vehicle_id,
+                chunk["id"],
+                chunk["metadata"]["source_file"],
+                chunk["metadata"].get("page_number"),
+                chunk["metadata"].get("page_end"),
+                chunk["text"],
+            )
+            for chunk in chunks
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def get_many(self, user_id: str, vehicle_id: str, chunk_ids: Sequence[str]) -> Dict[str, Dict]:
+        """Returns {chunk_id: {"source_file", "page_start", "page_end", "text"}} for the ids that exist."""
+        found: Dict[str, Dict] = {}
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = list(chunk_ids[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    "SELECT chunk_id, source_file, page_start, page_end, text FROM chunks"
+                    f" WHERE user_id = ? AND vehicle_id = ? AND chunk_id IN ({placeholders})",
+                    [user_id, vehicle_id, *batch],
+                )
+                for chunk_id, source_file, page_start, page_end, text in rows:
+                    found[chunk_id] = {
+                        "source_file": source_file,
+                        "page_start": page_start,
+                        "page_end": page_end,
+                        "text": text,
+                    }
+        return found
+
+    def delete_many(self, user_id: str, vehicle_id: str, chunk_ids: Sequence[str]) -> None:
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM chunks WHERE user_id = ? AND vehicle_id = ? AND chunk_id = ?",
+                [(user_id, vehicle_id, chunk_id) for chunk_id in chunk_ids],
+            )
+            self._db.commit()
+
+    def delete_partition(self, user_id: str, vehicle_id: str) -> int:
+        """Deletes every chunk of a (user, vehicle); returns how many there were."""
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM chunks WHERE user_id = ? AND vehicle_id = ?", (user_id, vehicle_id))
+            self._db.commit()
+            return cursor.rowcount
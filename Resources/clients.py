@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Optional
+
+import httpx
+
+if TYPE_CHECKING:
+    import openai
+
+
+def create_openai_client(
+    api_key: str,
+    timeout_seconds: float = 30.0,
+    max_retries: int = 2,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry_seconds: float = 30.0,
+) -> "openai.AsyncOpenAI":
+    """
+    Builds an async OpenAI client on a pooled, keep-alive HTTP connection pool
+    so concurrent requests reuse TLS connections instead of opening new ones.
+    """
+    # Imported here: the SDK takes about half a second to import, which cold starts only pay when building the client
+    import openai
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(timeout_seconds, connect=min(timeout_seconds, 5.0)),
+    )
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        timeout=timeout_seconds,
+        max_retries=max_retries,
+        http_client=http_client,
+    )
+
+
+def create_llm_client(backend: str, api_key: Optional[str] = None, **pool_options) -> Any:
+    """Builds the configured LLM client: "openai" (pooled AsyncOpenAI) or "stub" (offline, deterministic)."""
+    if backend == "stub":
+        from src.services.stub_llm import StubLLMClient
+
+        return StubLLMClient()
+    if backend == "openai":
+        return create_openai_client(api_key=api_key, **pool_options)
+    raise ValueError(f"Unknown LLM backend: {backend!r}")
+
+
+class AsyncPineconeIndex:
+    """
+    Async facade over a synchronous Pinecone index handle.
+    Calls run on a dedicated thread pool so they never block the event loop, are capped at
+    `max_concurrency` in flight, and are abandoned after `timeout_seconds`.
+    """
+
+    def __init__(self, index: Any, max_concurrency: int = 16, timeout_seconds: float = 10.0):
+        self._index = index
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="pinecone")
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _call(self, method: str, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            # Semaphores are bound to the loop they first wait on; scripts may run several loops
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        async with self._semaphore:
+            call = loop.run_in_executor(self._executor, lambda: getattr(self._index, method)(**kwargs))
+            return await asyncio.wait_for(call, timeout=self.timeout_seconds)
+
+    async def query(self, **kwargs) -> Any:
+        return await self._call("query", **kwargs)
+
+    async def upsert(self, **kwargs) -> Any:
+        return await self._call("upsert", **kwargs)
+
+    async def delete(self, **kwargs) -> Any:
+        return await self._call("delete", **kwargs)
+
+    async def fetch(self, **kwargs) -> Any:
+        return await self._call("fetch", **kwargs)
+
+    async def describe_index_stats(self, **kwargs) -> Any:
+        return await self._call("describe_index_stats", **kwargs)
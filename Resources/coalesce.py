@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from src.telemetry import metrics
+
+coalesce_calls_total = metrics.counter(
+    "gear_ai_coalesce_calls_total",
+    "Calls through single-flight groups, by stage and outcome (leader = went upstream, joined = shared a leader's result)",
+)
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical calls: the first caller for a key runs the call,
+    and everyone arriving while it is in flight awaits the same result (or exception).
+    Nothing is cached; the key is released as soon as the call finishes.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, joined), where `joined` is True if another caller's call was reused."""
+        task = self._in_flight.get(key)
+        joined = task is not None
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+        coalesce_calls_total.inc(stage=self.stage, outcome="joined" if joined else "leader")
+        # Shielded so one caller disconnecting does not cancel the call for the others
+        return await asyncio.shield(task), joined
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Dict, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -10,19 +13,174 @@ class Settings(BaseSettings):
     # Service Configuration
     SERVICE_NAME: str = "Gear AI Chat Service"
     LOG_LEVEL: str = "INFO"
+    # Log records are formatted and written by a background thread, never on the event loop.
+    # LOG_SAMPLE_RATES keeps a fraction of a logger's sub-WARNING records; "src.access" is
+    # the one-line-per-request access log. LOG_FILE rotates at LOG_FILE_MAX_BYTES, or on
+    # LOG_ROTATE_WHEN (e.g. "midnight") if set.
+    LOG_JSON: bool = False
+    LOG_FILE: Optional[str] = None
+    LOG_FILE_MAX_BYTES: int = 50 * 1024 * 1024
+    LOG_FILE_BACKUP_COUNT: int = 5
+    LOG_ROTATE_WHEN: Optional[str] = None
+    LOG_SAMPLE_RATES: Dict[str, float] = {"src.access": 0.1}
+    # Open upstream connections and prime caches at startup, before /ready reports ready
+    WARMUP_ENABLED: bool = True
+    # Fraction of requests whose per-stage spans are logged; latency histograms always record
+    TRACE_SAMPLE_RATE: float = 0.01
+
+    # Backends
+    # "openai" / "pinecone" in production; "stub" / "local" run the whole pipeline offline.
+    LLM_BACKEND: str = "openai"
+    VECTOR_STORE_BACKEND: str = "pinecone"
+    LOCAL_VECTOR_STORE_DIR: str = ".cache/vectors"
+    # Local store only: "int8" or "binary" searches compact in-memory codes, then reranks the
+    # best top_k * VECTOR_RERANK_FACTOR chunks with the full-precision vectors ("none" = exact).
+    VECTOR_QUANTIZATION: str = "none"
+    VECTOR_RERANK_FACTOR: int = 25
 
     # OpenAI Configuration
     OPENAI_API_KEY: str
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    # Shortened embeddings (text-embedding-3 models accept e.g. 256, 512 or 1024); None keeps
+    # the model's native size. Changing it means re-ingesting manuals (process_pdf --full)
+    # into an index of the new dimension.
+    OPENAI_EMBEDDING_DIMENSIONS: Optional[int] = None
     OPENAI_CHAT_MODEL: str = "gpt-4o-mini"
+    OPENAI_TIMEOUT_SECONDS: float = 30.0
+    # The upstream layer (see "Upstream Resilience") retries; SDK retries would multiply its attempts
+    OPENAI_MAX_RETRIES: int = 0
 
     # Pinecone Configuration
     PINECONE_API_KEY: str
     PINECONE_INDEX_NAME: str = "gear-ai-manuals"
+    PINECONE_TIMEOUT_SECONDS: float = 10.0
+    # Upper bound on concurrent Pinecone calls per worker (also sizes its thread pool)
+    PINECONE_MAX_CONCURRENCY: int = 16
+    # "namespace" gives each (user_id, vehicle_id) its own namespace, so query cost follows the
+    # tenant's size rather than the whole index; "metadata" is the old shared, filtered layout.
+    # PINECONE_LEGACY_FALLBACK answers tenants not yet moved by migrate_namespaces.py from the
+    # shared namespace; turn it off once the migration has run.
+    PINECONE_PARTITIONING: str = "namespace"
+    PINECONE_LEGACY_FALLBACK: bool = True
+
+    # Outbound HTTP Connection Pool
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+
+    # Upstream Resilience
+    # OpenAI and Pinecone calls retry timeouts, rate limits and 5xx responses with jittered
+    # exponential backoff, waiting at least as long as any Retry-After the provider sends.
+    # After CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive failures a dependency's breaker
+    # opens and chat requests get a 503 until a probe succeeds after the reset period.
+    # Embedding and vector queries still pending after UPSTREAM_HEDGE_AFTER_MS are sent a
+    # second time and the first answer wins (0 disables hedging).
+    UPSTREAM_MAX_ATTEMPTS: int = 3
+    UPSTREAM_BACKOFF_BASE_MS: float = 100
+    UPSTREAM_BACKOFF_MAX_MS: float = 2000
+    UPSTREAM_HEDGE_AFTER_MS: float = 250
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 30
 
     # Attestation Configuration
     # This private key is used to sign the AI's responses, creating a verifiable attestation.
     # In production, this should be loaded from a secure vault.
     ATTESTATION_PRIVATE_KEY: str
+    # "single" signs every response; "merkle_batch" signs one Merkle root per interval
+    # and returns each response with its inclusion proof.
+    ATTESTATION_MODE: str = "single"
+    ATTESTATION_BATCH_INTERVAL_MS: int = 200
+    ATTESTATION_BATCH_MAX_SIZE: int = 256
+    # Send attestations with hashes of the query and response rather than repeating their text
+    # (the body already carries both); a request's `attestation_by_reference` overrides it.
+    ATTESTATION_BY_REFERENCE: bool = False
+
+    # Semantic Answer Cache
+    # Near-identical questions about the same vehicle are answered from cache when the
+    # cosine similarity of their query embeddings meets the threshold.
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 10000
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    # Shared with the ingestion script, which marks vehicles as re-indexed here.
+    INDEX_GENERATION_DIR: str = ".cache/index_generations"
+
+    # Context Assembly
+    # Retrieved chunks are merged, deduplicated, reranked (BM25 fused with vector rank) and
+    # packed into this many prompt tokens.
+    RETRIEVAL_TOP_K: int = 8
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    CONTEXT_RERANK: bool = True
+
+    # Query Routing
+    # Small talk is answered without retrieval, exact codes go to the keyword index, and
+    # complex questions retrieve deeper. The classifier (nearest centroid over exemplar
+    # embeddings) reroutes messages no rule matched when it is confident by this margin.
+    COMPLEX_TOP_K: int = 16
+    COMPLEX_CONTEXT_TOKEN_BUDGET: int = 3000
+    ROUTER_CLASSIFIER_ENABLED: bool = True
+    ROUTER_CLASSIFIER_MARGIN: float = 0.05
+
+    # Conversation Memory
+    # Threads (ChatRequest.thread_id) keep their last CONVERSATION_RECENT_TURNS exchanges
+    # verbatim and a summary of older ones; "sqlite" persists them, "memory" keeps them
+    # in the in-process LRU only.
+    CONVERSATION_BACKEND: str = "sqlite"
+    CONVERSATION_DB_PATH: str = ".cache/conversations.sqlite3"
+    CONVERSATION_MEMORY_THREADS: int = 10000
+    CONVERSATION_TTL_SECONDS: int = 1800
+    CONVERSATION_RECENT_TURNS: int = 4
+    CONVERSATION_SUMMARY_TOKEN_BUDGET: int = 300
+
+    # Response Encoding
+    # /chat bodies of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed for clients that
+    # accept it: br when the brotli package is installed, otherwise gzip (0 disables).
+    RESPONSE_COMPRESSION_MIN_BYTES: int = 4096
+
+    # Batch Chat
+    # /chat/batch answers up to CHAT_BATCH_MAX_SIZE requests, CHAT_BATCH_CONCURRENCY at a time.
+    CHAT_BATCH_MAX_SIZE: int = 1000
+    CHAT_BATCH_CONCURRENCY: int = 64
+
+    # Request Coalescing
+    # Concurrent requests with identical embedding text, vector query or prompt share one upstream call.
+    COALESCING_ENABLED: bool = True
+
+    # Query Embedding Micro-Batching
+    # Query texts from concurrent requests arriving within the window are embedded in one
+    # API call (sent early once the batch is full). A window of 0 embeds each query alone.
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+
+    # Embedding Store
+    # Content-addressed memo of embeddings, shared with the ingestion script.
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MEMORY_ENTRIES: int = 10000
+
+    # Chunk Store
+    # Chunk text and page spans written by the ingestion script; retrieval reads it by vector id.
+    CHUNK_STORE_PATH: str = ".cache/chunks.sqlite3"
+
+    # Hybrid Retrieval
+    # BM25 keyword index written by the ingestion script; its matches are fused with the
+    # vector matches. Queries about exact codes (P0420, 0W-20, part numbers) found in the
+    # index skip the embedding call and vector query entirely.
+    HYBRID_RETRIEVAL_ENABLED: bool = True
+    LEXICAL_INDEX_PATH: str = ".cache/lexical.sqlite3"
+    EXACT_CODE_SHORTCUT: bool = True
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Reads the environment once, on first use."""
+    return Settings()
+
+class _LazySettings:
+    """
+    Stands in for the Settings instance until an attribute is read, so modules can be
+    imported (by tests, tools, or a cold-starting worker) without the environment being set.
+    """
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
 
-settings = Settings()
\ No newline at end of file
+settings = _LazySettings()
\ No newline at end of file
@@ -0,0 +1,23 @@
+import os
+import shutil
+import atexit
+import tempfile
+
+# The offline stand-ins must be configured before any service module reads its settings
+_WORKDIR = tempfile.mkdtemp(prefix="gear-ai-test-")
+atexit.register(shutil.rmtree, _WORKDIR, ignore_errors=True)
+os.environ.update({
+    "OPENAI_API_KEY": "test",
+    "PINECONE_API_KEY": "test",
+    "ATTESTATION_PRIVATE_KEY": "0x" + "11" * 32,
+    "LLM_BACKEND": "stub",
+    "VECTOR_STORE_BACKEND": "local",
+    "LOCAL_VECTOR_STORE_DIR": os.path.join(_WORKDIR, "vectors"),
+    "EMBEDDING_CACHE_PATH": os.path.join(_WORKDIR, "embeddings.sqlite3"),
+    "CHUNK_STORE_PATH": os.path.join(_WORKDIR, "chunks.sqlite3"),
+    "LEXICAL_INDEX_PATH": os.path.join(_WORKDIR, "lexical.sqlite3"),
+    "CONVERSATION_DB_PATH": os.path.join(_WORKDIR, "conversations.sqlite3"),
+    "INGEST_MANIFEST_DIR": os.path.join(_WORKDIR, "manifests"),
+    "INDEX_GENERATION_DIR": os.path.join(_WORKDIR, "generations"),
+    "TRACE_SAMPLE_RATE": "0",
+})
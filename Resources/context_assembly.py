@@ -0,0 +1,185 @@
+import re
+import math
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from src.models import ContextSource
+
+_WORD_RE = re.compile(r"\w[\w\-]*")
+# Rough BPE piece pattern: words, numbers and punctuation runs; close to cl100k counts for manual text
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]+")
+
+
+def _load_tokenizer() -> Optional[Callable[[str], int]]:
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken is optional (and may need to download its tables); fall back to the estimate
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+_tiktoken_count = _load_tokenizer()
+
+def count_tokens(text: str) -> int:
+    """Counts prompt tokens locally: exactly with tiktoken if installed, otherwise a close estimate."""
+    if _tiktoken_count is not None:
+        return _tiktoken_count(text)
+    return len(_PIECE_RE.findall(text))
+
+def _terms(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+def _shingles(words: Sequence[str], size: int = 5) -> Set[tuple]:
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+# --- Merging & Deduplication ---
+
+def merge_adjacent(sources: List[ContextSource]) -> List[ContextSource]:
+    """
+    Merges chunks from the same manual whose word ranges overlap or touch (neighbouring
+    chunks share an overlap of words), dropping the repeated words. Each merged chunk
+    takes the rank of its best member.
+    """
+    groups: Dict[str, List[int]] = {}
+    for rank, src in enumerate(sources):
+        if src.metadata.get("start_word") is not None:
+            groups.setdefault(src.source_name, []).append(rank)
+
+    replacements: Dict[int, ContextSource] = {}
+    absorbed: Set[int] = set()
+    for ranks in groups.values():
+        ranks.sort(key=lambda rank: sources[rank].metadata["start_word"])
+        run: List[int] = []
+        run_words: List[str] = []
+        run_start = 0
+        for rank in ranks + [None]:
+            src = sources[rank] if rank is not None else None
+            if src is not None and run and src.metadata["start_word"] <= run_start + len(run_words):
+                run.append(rank)
+                run_words += src.content.split()[run_start + len(run_words) - src.metadata["start_word"]:]
+                continue
+            if len(run) > 1:
+                head = min(run)
+                replacements[head] = _merged_source(sources, sorted(run), run_words, run_start)
+                absorbed.update(member for member in run if member != head)
+            if src is not None:
+                run, run_words, run_start = [rank], src.content.split(), src.metadata["start_word"]
+
+    return [replacements.get(rank, src) for rank, src in enumerate(sources) if rank not in absorbed]
+
+def _merged_source(sources: List[ContextSource], members: List[int], words: List[str], start_word: int) -> ContextSource:
+    best = sources[min(members)]
+    pages = [sources[m].metadata.get("page") for m in members if sources[m].metadata.get("page") is not None]
+    page_ends = [sources[m].metadata.get("page_end") for m in members if sources[m].metadata.get("page_end") is not None]
+    return ContextSource(
+        source_type=best.source_type,
+        source_name=best.source_name,
+        content=" ".join(words),
+        metadata={
+            **best.metadata,
+            "page": min(pages) if pages else None,
+            "page_end": max(page_ends) if page_ends else None,
+            "start_word": start_word,
+            "merged_chunk_ids": [sources[m].metadata.get("chunk_id") for m in members],
+        },
+    )
+
+def drop_near_duplicates(sources: List[ContextSource], threshold: float = 0.8) -> List[ContextSource]:
+    """Drops chunks whose word 5-shingles mostly repeat a better-ranked chunk (repeated boilerplate, reprinted tables)."""
+    kept: List[ContextSource] = []
+    kept_shingles: List[Set[tuple]] = []
+    for src in sources:
+        shingles = _shingles(_terms(src.content))
+        duplicate = any(
+            len(shingles & other) / max(1, min(len(shingles), len(other))) >= threshold
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(src)
+            kept_shingles.append(shingles)
+    return kept
+
+
+# --- Reranking ---
+
+def bm25_scores(query: str, documents: Sequence[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """Okapi BM25 of each document against the query, with IDF taken over the candidate set."""
+    query_terms = set(_terms(query))
+    doc_terms = [_terms(doc) for doc in documents]
+    if not query_terms or not doc_terms:
+        return [0.0] * len(documents)
+    n = len(doc_terms)
+    average_length = sum(len(terms) for terms in doc_terms) / n or 1.0
+    document_frequency = Counter(term for terms in doc_terms for term in set(terms) & query_terms)
+    scores = []
+    for terms in doc_terms:
+        frequencies = Counter(terms)
+        score = 0.0
+        for term in query_terms:
+            tf = frequencies.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(terms) / average_length))
+        scores.append(score)
+    return scores
+
+def rerank(query: str, sources: List[ContextSource], k: int = 60) -> List[ContextSource]:
+    """Reorders by reciprocal rank fusion of the retrieval order and BM25 against the query."""
+    lexical = bm25_scores(query, [src.content for src in sources])
+    # Only chunks that share a term with the query get lexical credit
+    matching = sorted((i for i in range(len(sources)) if lexical[i] > 0), key=lambda i: -lexical[i])
+    fused_scores = [1 / (k + i) for i in range(len(sources))]
+    for rank, i in enumerate(matching):
+        fused_scores[i] += 1 / (k + rank)
+    return [sources[i] for i in sorted(range(len(sources)), key=lambda i: -fused_scores[i])]
+
+
+# --- Packing ---
+
+def _total_tokens(sources: Sequence[ContextSource]) -> int:
+    return sum(count_tokens(src.content) for src in sources)
+
+def pack(sources: List[ContextSource], token_budget: int, min_fragment_tokens: int = 64) -> List[ContextSource]:
+    """
+    Takes sources best-first until the token budget is spent, merging neighbouring chunks
+    as it goes so shared overlap words are only paid for once. A source that does not fit
+    is cut to the remaining budget if that leaves a useful fragment.
+    """
+    packed: List[ContextSource] = []
+    used = 0
+    for src in sources:
+        cost = _total_tokens(merge_adjacent(packed + [src]))
+        if cost <= token_budget:
+            packed.append(src)
+            used = cost
+        elif token_budget - used >= min_fragment_tokens:
+            content = _truncate(src.content, token_budget - used)
+            packed.append(src.model_copy(update={"content": content, "metadata": {**src.metadata, "truncated": True}}))
+            break
+        if token_budget - used < min_fragment_tokens:
+            break
+    return [
+        src.model_copy(update={"metadata": {**src.metadata, "tokens": count_tokens(src.content)}})
+        for src in merge_adjacent(packed)
+    ]
+
+def _truncate(text: str, token_budget: int) -> str:
+    words = text.split()
+    # Shrink proportionally, then trim until the count fits
+    keep = max(1, int(len(words) * token_budget / max(1, count_tokens(text))))
+    while keep > 1 and count_tokens(" ".join(words[:keep])) > token_budget:
+        keep = int(keep * 0.9)
+    return " ".join(words[:keep])
+
+
+def assemble_context(query: str, sources: List[ContextSource], token_budget: int, use_rerank: bool = True) -> List[ContextSource]:
+    """Dedupes, optionally reranks, and packs retrieved chunks into the prompt's token budget, merging neighbours."""
+    sources = drop_near_duplicates(sources)
+    if use_rerank and len(sources) > 1:
+        sources = rerank(query, sources)
+    return pack(sources, token_budget)
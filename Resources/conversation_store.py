@@ -0,0 +1,234 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from src.models import ContextSource
+from src.services.context_assembly import count_tokens
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+class Conversation:
+    """
+    One chat thread: the most recent turns verbatim, a compact summary of everything
+    older, and the context the last answer was built from (for reuse by follow-ups).
+    """
+    __slots__ = ("user_id", "thread_id", "vehicle_id", "summary", "turns", "sources", "updated_at")
+
+    def __init__(self, user_id: str, thread_id: str, vehicle_id: str):
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.vehicle_id = vehicle_id
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []   # Chat messages: {"role", "content"}
+        self.sources: List[ContextSource] = []
+        self.updated_at = time.time()
+
+    @property
+    def has_history(self) -> bool:
+        return bool(self.turns or self.summary)
+
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "thread_id": self.thread_id,
+            "vehicle_id": self.vehicle_id,
+            "summary": self.summary,
+            "turns": list(self.turns),
+            "sources": [src.model_dump() for src in self.sources],
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Conversation":
+        conversation = cls(data["user_id"], data["thread_id"], data["vehicle_id"])
+        conversation.summary = data.get("summary", "")
+        conversation.turns = data.get("turns", [])
+        conversation.sources = [ContextSource(**src) for src in data.get("sources", [])]
+        conversation.updated_at = data.get("updated_at", 0.0)
+        return conversation
+
+
+# --- Persistent Tier ---
+
+class ConversationBackend:
+    """Durable storage for conversations, keyed by (user_id, thread_id)."""
+
+    def load(self, user_id: str, thread_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def save(self, state: Dict) -> None:
+        """Writes a `Conversation.to_dict()` snapshot. Runs in a worker thread."""
+        raise NotImplementedError
+
+
+class SqliteConversationBackend(ConversationBackend):
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " user_id TEXT NOT NULL, thread_id TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, thread_id))"
+        )
+        self._db.commit()
+
+    def load(self, user_id: str, thread_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM conversations WHERE user_id = ? AND thread_id = ?", (user_id, thread_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, state: Dict) -> None:
+        with self._lock:
+            # Writes of one thread can finish out of order; never replace a newer state
+            self._db.execute(
+                "INSERT INTO conversations VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (user_id, thread_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at"
+                " WHERE excluded.updated_at >= conversations.updated_at",
+                (state["user_id"], state["thread_id"], json.dumps(state), state["updated_at"]),
+            )
+            self._db.commit()
+
+
+def create_conversation_backend(backend: str, db_path: str = ".cache/conversations.sqlite3") -> Optional[ConversationBackend]:
+    """Builds the persistent tier: "sqlite", or "memory" for none (threads live only in the LRU)."""
+    if backend == "sqlite":
+        return SqliteConversationBackend(db_path)
+    if backend == "memory":
+        return None
+    raise ValueError(f"Unknown conversation backend: {backend!r}")
+
+
+# --- Compaction ---
+
+def _first_sentences(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundaries = [match.start() for match in _SENTENCE_END_RE.finditer(cut)]
+    return cut[:boundaries[-1]] if boundaries else cut.rsplit(" ", 1)[0] + "..."
+
+def summarize_turns(turns: Sequence[Dict[str, str]]) -> List[str]:
+    """Extractive summary, one line per turn; runs locally so compaction costs no LLM call."""
+    return [
+        f"{'User' if turn['role'] == 'user' else 'Assistant'}: {_first_sentences(turn['content'], 160)}"
+        for turn in turns
+    ]
+
+
+class ConversationStore:
+    """
+    Conversation memory keyed by thread. A bounded in-memory tier (LRU with a TTL) fronts
+    an optional persistent backend; threads that expire or are evicted from memory are
+    reloaded from the backend on their next message.
+
+    Only the last `recent_turns` exchanges are kept verbatim. Older ones are folded into
+    an extractive summary capped at `summary_token_budget` tokens, so the history a
+    prompt carries stays bounded however long the thread runs.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[ConversationBackend] = None,
+        max_memory_threads: int = 10_000,
+        ttl_seconds: float = 1800,
+        recent_turns: int = 4,
+        summary_token_budget: int = 300,
+    ):
+        self.backend = backend
+        self.max_memory_threads = max_memory_threads
+        self.ttl_seconds = ttl_seconds
+        self.recent_turns = recent_turns
+        self.summary_token_budget = summary_token_budget
+        self._memory: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (conversation, expires_at)
+
+        self.memory_hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str, thread_id: str, vehicle_id: str) -> Conversation:
+        """
+        Returns the thread (a new, empty one if unknown). Threads are scoped to their user.
+        A thread missing from memory is read from the backend in a worker thread.
+        """
+        key = (user_id, thread_id)
+        cached = self._memory.get(key)
+        if (cached is None or cached[1] <= time.monotonic()) and self.backend is not None:
+            data = await asyncio.to_thread(self.backend.load, user_id, thread_id)
+            # Another request may have loaded or updated the thread during the read
+            cached = self._memory.get(key)
+        else:
+            data = None
+        if cached is not None and cached[1] > time.monotonic():
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            conversation = cached[0]
+        else:
+            if data is not None:
+                self.backend_hits += 1
+                conversation = Conversation.from_dict(data)
+            else:
+                self.misses += 1
+                conversation = Conversation(user_id, thread_id, vehicle_id)
+            self._remember(key, conversation)
+
+        if conversation.vehicle_id != vehicle_id:
+            # The thread moved to another vehicle; its retrieved context no longer applies
+            conversation.vehicle_id = vehicle_id
+            conversation.sources = []
+        return conversation
+
+    async def append(self, conversation: Conversation, user_message: str, assistant_message: str, sources: List[ContextSource]) -> None:
+        """
+        Records an exchange, compacts older turns, and writes the thread through to the
+        backend from a worker thread, so a slow commit does not stall the event loop.
+        """
+        conversation.turns += [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_message},
+        ]
+        if sources:
+            # Replies built without retrieval (small talk) keep the last grounded context
+            conversation.sources = list(sources)
+        conversation.updated_at = time.time()
+        self._compact(conversation)
+        self._remember((conversation.user_id, conversation.thread_id), conversation)
+        if self.backend is not None:
+            # Snapshot on the loop; the next turn may change the thread while the write runs
+            await asyncio.to_thread(self.backend.save, conversation.to_dict())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "threads_in_memory": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "backend_hits": self.backend_hits,
+            "misses": self.misses,
+        }
+
+    def _compact(self, conversation: Conversation) -> None:
+        keep = 2 * self.recent_turns
+        if len(conversation.turns) <= keep:
+            return
+        older, conversation.turns = conversation.turns[:-keep], conversation.turns[-keep:]
+        lines = [line for line in conversation.summary.split("\n") if line] + summarize_turns(older)
+        # Oldest summary lines go first once the summary outgrows its budget
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > self.summary_token_budget:
+            lines.pop(0)
+        conversation.summary = "\n".join(lines)
+
+    def _remember(self, key: tuple, conversation: Conversation) -> None:
+        self._memory[key] = (conversation, time.monotonic() + self.ttl_seconds)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_threads:
+            self._memory.popitem(last=False)
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.telemetry import metrics
+
+embedding_batch_size = metrics.histogram(
+    "gear_ai_embedding_batch_size",
+    "Texts per batched embedding request",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+
+class EmbeddingBatcher:
+    """
+    Collects embedding requests from concurrent callers for up to `window_seconds`
+    (or until `max_batch_size` distinct texts are waiting) and sends them upstream as
+    one batched call, resolving each caller with its own vector.
+    """
+
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_seconds: float = 0.005,
+        max_batch_size: int = 64,
+    ):
+        self.embed_many = embed_many
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set = set()
+        self.batches_sent = 0
+
+    async def embed(self, text: str) -> List[float]:
+        future = self._pending.get(text)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[text] = loop.create_future()
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+        # Shielded so a cancelled caller does not cancel the future other callers share
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        # Takes the batch synchronously so it never grows past max_batch_size
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch: List[Tuple[str, asyncio.Future]] = list(self._pending.items())
+        self._pending = {}
+        if not batch:
+            return
+        # Hold a reference so the request task is not garbage collected mid-flight
+        task = asyncio.ensure_future(self._send(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        embedding_batch_size.observe(len(batch))
+        self.batches_sent += 1
+        try:
+            embeddings = await self.embed_many([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
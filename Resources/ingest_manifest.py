@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+from typing import Dict, Iterator, Optional
+
+
+class IngestManifest:
+    """
+    Local record of which chunks of a manual are currently indexed for a (file, user, vehicle).
+    Maps vector id -> chunk hash, so a re-ingestion can diff the new chunking against it and
+    only upsert new chunks and delete orphaned ones.
+
+    `layout` is the vector store layout the chunks were written in (see VectorStore.layout);
+    manifests from before it was recorded have None, meaning the shared, metadata-filtered one.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_name: str,
+        user_id: str,
+        vehicle_id: str,
+        chunks: Optional[Dict[str, str]] = None,
+        layout: Optional[str] = None,
+    ):
+        self.path = path
+        self.file_name = file_name
+        self.user_id = user_id
+        self.vehicle_id = vehicle_id
+        self.chunks: Dict[str, str] = chunks or {}
+        self.layout = layout
+
+    @classmethod
+    def load(cls, directory: str, file_name: str, user_id: str, vehicle_id: str) -> Optional["IngestManifest"]:
+        """Loads the manifest for a manual, or returns None if it has never been ingested."""
+        path = cls.path_for(directory, file_name, user_id, vehicle_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(path, file_name, user_id, vehicle_id, data.get("chunks", {}), data.get("layout"))
+
+    @classmethod
+    def for_vehicle(cls, directory: str, user_id: str, vehicle_id: str) -> Iterator["IngestManifest"]:
+        """Every manual's manifest for a (user, vehicle)."""
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("user_id") == user_id and data.get("vehicle_id") == vehicle_id:
+                yield cls(path, data["file_name"], user_id, vehicle_id, data.get("chunks", {}), data.get("layout"))
+
+    @classmethod
+    def empty(cls, directory: str, file_name: str, user_id: str, vehicle_id: str) -> "IngestManifest":
+        return cls(cls.path_for(directory, file_name, user_id, vehicle_id), file_name, user_id, vehicle_id)
+
+    @staticmethod
+    def path_for(directory: str, file_name: str, user_id: str, vehicle_id: str) -> str:
+        digest = hashlib.sha256(f"{user_id}:{vehicle_id}:{file_name}".encode()).hexdigest()
+        return os.path.join(directory, f"{digest}.json")
+
+    def save(self) -> None:
+        """Writes the manifest atomically so an interrupted run never leaves a torn file."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "file_name": self.file_name,
+                "user_id": self.user_id,
+                "vehicle_id": self.vehicle_id,
+                "chunks": self.chunks,
+                "layout": self.layout,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
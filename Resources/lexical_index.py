@@ -0,0 +1,151 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Sequence
+
+_TERM_RE = re.compile(r"\w[\w\-]*")
+# Tokens that must match verbatim: diagnostic trouble codes (P0420), oil grades (0W-20),
+# and part numbers. A part number needs more digits than a model name has, so RAV4,
+# F-150, CX-5 and 328i still go to semantic retrieval: 5-5 groups (90915-YZZD1,
+# 90919-01253), other separated groups with 5+ digits and a letter (15400-PLM-A02),
+# or 8+ unseparated characters with 6+ digits and a letter (MZ690072)
+_CODE_PATTERNS = [
+    re.compile(r"^[PBCU][0-3][0-9A-F]{3}$", re.IGNORECASE),
+    re.compile(r"^\d{1,2}W-?\d{1,2}$", re.IGNORECASE),
+    re.compile(r"^\d{5}-[0-9A-Z]{5}$", re.IGNORECASE),
+    re.compile(r"^(?=[\w\-]*[A-Za-z])(?=(?:\D*\d){5})[A-Za-z0-9]+(?:-[A-Za-z0-9]+)+$"),
+    re.compile(r"^(?=[A-Za-z0-9]*[A-Za-z])(?=(?:[A-Za-z]*\d){6})[A-Za-z0-9]{8,}$"),
+]
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or should "
+    "the this to what when where which who why with".split()
+)
+_MAX_QUERY_TERMS = 32
+
+
+def find_codes(text: str) -> List[str]:
+    """Returns the exact-match tokens (DTCs, fluid grades, part numbers) in a query."""
+    return [term for term in _TERM_RE.findall(text) if any(pattern.match(term) for pattern in _CODE_PATTERNS)]
+
+def _partition_key(user_id: str, vehicle_id: str) -> str:
+    # Hex keeps the partition a single FTS token regardless of the ids' characters
+    return hashlib.sha256(f"{user_id}:{vehicle_id}".encode()).hexdigest()[:32]
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+class LexicalIndex:
+    """
+    BM25 keyword index over chunk text, partitioned by (user_id, vehicle_id), backed by
+    SQLite FTS5. Written by the ingestion script alongside the vector upsert; catches the
+    exact tokens (codes, grades, part numbers) that dense embeddings tend to blur.
+    Matches come back in the same {"id", "score", "metadata"} shape as the vector store.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_chunks ("
+            " doc_id INTEGER PRIMARY KEY, partition TEXT NOT NULL, chunk_id TEXT NOT NULL,"
+            " source_file TEXT, page_start INTEGER, page_end INTEGER, start_word INTEGER,"
+            " UNIQUE (partition, chunk_id))"
+        )
+        # unicode61 splits "0W-20" into "0w" "20"; queries use phrases so those still match adjacently
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS lexical_fts USING fts5(partition, text)")
+        self._db.commit()
+
+    def put_many(self, user_id: str, vehicle_id: str, chunks: Sequence[Dict]) -> None:
+        """Indexes chunks as produced by the ingestion chunker, replacing any with the same id."""
+        partition = _partition_key(user_id, vehicle_id)
+        with self._lock:
+            self._delete(partition, [chunk["id"] for chunk in chunks])
+            for chunk in chunks:
+                metadata = chunk["metadata"]
+                cursor = self._db.execute(
+                    "INSERT INTO lexical_chunks (partition, chunk_id, source_file, page_start, page_end, start_word)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (partition, chunk["id"], metadata.get("source_file"), metadata.get("page_number"),
+                     metadata.get("page_end"), metadata.get("start_word")),
+                )
+                self._db.execute(
+                    "INSERT INTO lexical_fts (rowid, partition, text) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, partition, chunk["text"]),
+                )
+            self._db.commit()
+
+    def delete_many(self, user_id: str, vehicle_id: str, chunk_ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete(_partition_key(user_id, vehicle_id), chunk_ids)
+            self._db.commit()
+
+    def delete_partition(self, user_id: str, vehicle_id: str) -> None:
+        """Deletes every chunk of a (user, vehicle)."""
+        partition = _partition_key(user_id, vehicle_id)
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM lexical_fts WHERE rowid IN (SELECT doc_id FROM lexical_chunks WHERE partition = ?)",
+                (partition,),
+            )
+            self._db.execute("DELETE FROM lexical_chunks WHERE partition = ?", (partition,))
+            self._db.commit()
+
+    def _delete(self, partition: str, chunk_ids: Sequence[str]) -> None:
+        for start in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            doc_ids = [(row[0],) for row in self._db.execute(
+                f"SELECT doc_id FROM lexical_chunks WHERE partition = ? AND chunk_id IN ({placeholders})",
+                [partition, *batch],
+            )]
+            self._db.executemany("DELETE FROM lexical_fts WHERE rowid = ?", doc_ids)
+            self._db.executemany("DELETE FROM lexical_chunks WHERE doc_id = ?", doc_ids)
+
+    def search(self, user_id: str, vehicle_id: str, query: str, top_k: int = 5, require_all: bool = False) -> List[Dict]:
+        """
+        Ranks the partition's chunks by BM25 against the query terms (any term, or every
+        term with `require_all`). Scores are positive, higher is better.
+        """
+        terms = [term for term in dict.fromkeys(_TERM_RE.findall(query.lower())) if term not in _STOPWORDS]
+        if not terms:
+            return []
+        joiner = " AND " if require_all else " OR "
+        expression = (
+            f"partition : {_phrase(_partition_key(user_id, vehicle_id))}"
+            f" AND text : ({joiner.join(_phrase(term) for term in terms[:_MAX_QUERY_TERMS])})"
+        )
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT c.chunk_id, c.source_file, c.page_start, c.page_end, c.start_word, -bm25(lexical_fts, 0.0, 1.0)"
+                " FROM lexical_fts JOIN lexical_chunks c ON c.doc_id = lexical_fts.rowid"
+                " WHERE lexical_fts MATCH ? ORDER BY bm25(lexical_fts, 0.0, 1.0) LIMIT ?",
+                (expression, top_k),
+            ).fetchall()
+        return [
+            {
+                "id": chunk_id,
+                "score": score,
+                "metadata": {"source_file": source_file, "page_number": page_start, "page_end": page_end, "start_word": start_word},
+            }
+            for chunk_id, source_file, page_start, page_end, start_word, score in rows
+        ]
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[Sequence[Dict]], k: int = 60) -> List[Dict]:
+    """
+    Fuses ranked match lists by summing 1 / (k + rank) per id. The first list's copy of a
+    match is kept (metadata included); its score becomes the fused score.
+    """
+    fused: Dict[str, Dict] = {}
+    scores: Dict[str, float] = {}
+    for results in result_lists:
+        for rank, match in enumerate(results):
+            fused.setdefault(match["id"], match)
+            scores[match["id"]] = scores.get(match["id"], 0.0) + 1 / (k + rank)
+    ordered = sorted(fused, key=lambda match_id: -scores[match_id])
+    return [{**fused[match_id], "score": scores[match_id]} for match_id in ordered]
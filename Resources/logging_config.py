@@ -0,0 +1,135 @@
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Dict, List, Optional
+
+from src.telemetry import current_trace_id, metrics
+
+log_records_dropped_total = metrics.counter(
+    "gear_ai_log_records_dropped_total", "Log records dropped because the background log queue was full"
+)
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and goes into JSON output
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, trace id and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", "-") != "-":
+            entry["trace_id"] = record.trace_id
+        entry.update((key, value) for key, value in vars(record).items() if key not in _STANDARD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of a logger's records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread as they are. The stock QueueHandler formats the
+    message on the calling thread (for pickling to other processes); here the listener's
+    handlers do it, so the request path only pays for creating the record.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The trace lives in a contextvar, which the listener thread cannot see
+        record.trace_id = current_trace_id() or "-"
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropping a log line beats blocking the event loop behind a stalled disk
+            log_records_dropped_total.inc()
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # At shutdown, wait for room in a full queue instead of failing to stop
+        self.queue.put(self._sentinel)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(
+    level: str = "INFO",
+    json_output: bool = False,
+    log_file: Optional[str] = None,
+    max_bytes: int = 50 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: Optional[str] = None,
+    sample_rates: Optional[Dict[str, float]] = None,
+    queue_size: int = 10_000,
+) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a bounded queue to a background thread that does the
+    formatting and I/O (stderr, plus `log_file` if given). The file rotates by size, or
+    by time when `rotate_when` is set (a TimedRotatingFileHandler `when`, e.g. "midnight").
+    `sample_rates` maps logger names to the fraction of their sub-WARNING records kept.
+    Calling it again replaces the previous setup.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JsonFormatter() if json_output else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"
+    )
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        if rotate_when:
+            handlers.append(logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    for name, rate in (sample_rates or {}).items():
+        sampled_logger = logging.getLogger(name)
+        sampled_logger.filters = [f for f in sampled_logger.filters if not isinstance(f, SamplingFilter)]
+        if rate < 1.0:
+            sampled_logger.addFilter(SamplingFilter(rate))
+
+    _listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging() -> None:
+    """Flushes the queue and stops the background writer, if running."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(stop_logging)
@@ -1,27 +1,85 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # Cold start is measured from here
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
 import logging
+import math
+
+import orjson
 
 from src.config import settings
-from src.models import ChatRequest, ChatResponse, KnowledgeAttestation
+from src.logging_config import setup_logging, stop_logging
+from src.models import ChatBatchRequest, ChatBatchResult, ChatRequest, ChatResponse, ContextSource, KnowledgeAttestation
+from src.services.attestation import by_reference
+from src.services.compression import compress
+from src.services.conversation_store import Conversation
+from src.services.query_router import LEXICAL, SMALL_TALK, RouteDecision
 from src.services.rag_service import rag_service
+from src.services.resilience import UpstreamUnavailable
+from src.telemetry import bytes_total, finish_trace, metrics, request_latency, span, start_trace
+
+logger = logging.getLogger(__name__)
+# One line per request; sampled through LOG_SAMPLE_RATES
+access_logger = logging.getLogger("src.access")
 
 # --- Application Setup ---
+# Settings and clients are read and built here, at startup, rather than at import
+_startup: Dict[str, Any] = {"ready": False}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging(
+        settings.LOG_LEVEL,
+        json_output=settings.LOG_JSON,
+        log_file=settings.LOG_FILE,
+        max_bytes=settings.LOG_FILE_MAX_BYTES,
+        backup_count=settings.LOG_FILE_BACKUP_COUNT,
+        rotate_when=settings.LOG_ROTATE_WHEN,
+        sample_rates=settings.LOG_SAMPLE_RATES,
+    )
+    if settings.WARMUP_ENABLED:
+        _startup["warmup"] = await rag_service.warmup()
+    _startup["import_seconds"] = round(_IMPORT_FINISHED - _IMPORT_STARTED, 3)
+    _startup["startup_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+    _startup["ready"] = True
+    logger.info("Ready after %.3fs (import %.3fs)", _startup["startup_seconds"], _startup["import_seconds"])
+    yield
+    _startup["ready"] = False
+    await rag_service.close()
+    stop_logging()
+
 app = FastAPI(
     title="Gear AI Chat Service",
     description="The AI/ML core for the Gear AI ecosystem, acting as a decentralized knowledge oracle.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-logging.basicConfig(level=settings.LOG_LEVEL)
-logger = logging.getLogger(__name__)
-
 # --- Middleware ---
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"Incoming request: {request.method} {request.url.path}")
+    trace = start_trace(request.headers.get("x-request-id"), settings.TRACE_SAMPLE_RATE)
+    started = time.perf_counter()
     response = await call_next(request)
-    logger.info(f"Outgoing response: {response.status_code}")
+    elapsed = time.perf_counter() - started
+
+    # Label by route template, not raw path, to keep metric cardinality bounded
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    # Arguments are formatted on the log writer thread, and only for records that are kept
+    access_logger.log(
+        logging.WARNING if response.status_code >= 500 else logging.INFO,
+        "%s %s %s %.1fms", request.method, request.url.path, response.status_code, elapsed * 1000,
+    )
+    request_latency.observe(elapsed, method=request.method, path=path, status=str(response.status_code))
+    bytes_total.inc(int(request.headers.get("content-length") or 0), direction="in")
+    bytes_total.inc(int(response.headers.get("content-length") or 0), direction="out")
+    response.headers["X-Trace-Id"] = trace.trace_id
+    finish_trace(trace, request.method, path, response.status_code, elapsed)
     return response
 
 # --- API Endpoints ---
@@ -31,55 +89,330 @@ async def health_check():
     """Provides a health check endpoint for monitoring."""
     return {"status": "UP", "service": settings.SERVICE_NAME}
 
-@app.post("/chat", response_model=ChatResponse, tags=["AI"])
-async def process_chat_message(request: ChatRequest):
+@app.get("/ready", tags=["Monitoring"])
+async def readiness_check():
     """
-    The main endpoint for processing a user's chat message.
-    This endpoint orchestrates the entire RAG and Attestation pipeline.
+    Reports whether the service should receive traffic: 503 until startup (including any
+    warmup) has finished, then 200 with the cold-start timings. /health only says the process is up.
+    """
+    if not _startup["ready"]:
+        return JSONResponse(status_code=503, content={"status": "STARTING"})
+    return {"status": "READY", **_startup}
+
+@app.get("/metrics", tags=["Monitoring"])
+async def prometheus_metrics():
+    """Exposes request, stage latency, token and cache metrics in Prometheus text format."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def _collect_cache_metrics() -> dict:
+    gauges = {f"gear_ai_embedding_store_{name}": value for name, value in rag_service.embedding_store.stats().items()}
+    if rag_service.answer_cache is not None:
+        gauges.update({f"gear_ai_answer_cache_{name}": value for name, value in rag_service.answer_cache.stats().items()})
+    gauges.update({f"gear_ai_conversations_{name}": value for name, value in rag_service.conversations.stats().items()})
+    for role, upstream in (("llm", rag_service.llm_upstream), ("vector_store", rag_service.vector_upstream)):
+        gauges.update({f"gear_ai_upstream_{role}_{name}": value for name, value in upstream.stats().items()})
+    return gauges
+
+metrics.register_collector(_collect_cache_metrics)
+
+def _collect_startup_metrics() -> dict:
+    gauges = {"gear_ai_ready": int(_startup["ready"])}
+    if "startup_seconds" in _startup:
+        gauges["gear_ai_startup_seconds"] = _startup["startup_seconds"]
+    return gauges
+
+metrics.register_collector(_collect_startup_metrics)
+
+@app.get("/cache/stats", tags=["Monitoring"])
+async def cache_stats():
+    """Reports hit/miss counters for the semantic answer cache."""
+    if rag_service.answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **rag_service.answer_cache.stats()}
+
+async def _retrieve_context(
+    request: ChatRequest, query_embedding: List[float], route: RouteDecision, batch_memo: Optional[Dict] = None
+) -> List[ContextSource]:
+    """Retrieves the context for a chat request from every available source."""
+    # TODO: Add on-chain and external API context retrieval here
+    context_sources = await rag_service.hybrid_query(
+        query=request.message,
+        embedding=query_embedding,
+        user_id=request.user_id,
+        vehicle_id=request.vehicle_id,
+        top_k=route.top_k,
+    )
+    return _prepare_context(request, context_sources, route, batch_memo)
+
+def _prepare_context(
+    request: ChatRequest, context_sources: List[ContextSource], route: RouteDecision, batch_memo: Optional[Dict] = None
+) -> List[ContextSource]:
+    # Merge overlapping chunks, drop repeats and fit the rest into the prompt's token budget.
+    # Within a batch, vehicles sharing a manual retrieve the same chunks; assemble those once.
+    key = ("context", request.message, route.token_budget, tuple(src.metadata.get("chunk_id") for src in context_sources))
+    if batch_memo is not None and key in batch_memo:
+        return batch_memo[key]
+    context_sources = rag_service.assemble_context(request.message, context_sources, route.token_budget)
+    if batch_memo is not None:
+        batch_memo[key] = context_sources
+
+    if not context_sources:
+        # Handle case where no context is found
+        # We can either let the LLM say it doesn't know, or return a canned response.
+        logger.warning("No context found for query: %r", request.message)
+        # For now, we proceed and let the LLM handle it based on the system prompt.
+    return context_sources
+
+async def _build_chat_response(
+    request: ChatRequest, ai_response_text: str, context_sources: List[ContextSource], route: RouteDecision
+) -> ChatResponse:
+    """Attests the final answer and packages it with its sources."""
+    attestation = await rag_service.attest(
+        query=request.message,
+        response=ai_response_text,
+        context=context_sources
+    )
+
+    return ChatResponse(
+        response_text=ai_response_text,
+        sources=context_sources,
+        attestation=attestation,
+        metadata=route.as_metadata(),
+    )
+
+async def _resolve_context(
+    request: ChatRequest, conversation: Optional[Conversation], batch_memo: Optional[Dict] = None
+) -> Tuple[List[ContextSource], Optional[List[float]], Optional[ChatResponse], RouteDecision]:
+    """
+    Routes the request and finds its context, cheapest path first. Returns (context, query
+    embedding, cached response, route); the embedding is None when the path did not need one.
+    `batch_memo` shares work between the requests of one /chat/batch call.
     """
+    route = rag_service.router.route(request.message)
     try:
+        # Small talk gets a canned reply; nothing to retrieve
+        if route.route == SMALL_TALK:
+            return [], None, None, route
+
+        # Questions about exact codes (P0420, 0W-20) are served from the keyword index without embedding
+        if route.route == LEXICAL:
+            exact_sources = await rag_service.exact_code_context(
+                request.message, request.user_id, request.vehicle_id, top_k=route.top_k
+            )
+            if exact_sources is not None:
+                return _prepare_context(request, exact_sources, route, batch_memo), None, None, route
+            route = rag_service.router.fallback(route)
+
+        # Follow-ups that stay on the thread's last sources reuse them instead of retrieving again
+        if conversation is not None:
+            reused_sources = await rag_service.reusable_context(conversation, request.message)
+            if reused_sources is not None:
+                return reused_sources, None, None, route
+
         # 1. Generate embedding for the user's query
         query_embedding = await rag_service.get_embedding(request.message)
+        route = await rag_service.router.refine(route, query_embedding, rag_service.embed_many, request.message)
+        if route.route == SMALL_TALK:
+            return [], None, None, route
+
+        # Serve near-identical standalone questions about this vehicle straight from the answer cache
+        if rag_service.answer_cache is not None and not _is_follow_up(conversation):
+            with span("answer_cache"):
+                cached_response = rag_service.answer_cache.lookup(request.user_id, request.vehicle_id, query_embedding)
+            if cached_response is not None:
+                cached_response = cached_response.model_copy(update={"metadata": {**route.as_metadata(), "answer_cache": "hit"}})
+                return cached_response.sources, query_embedding, cached_response, route
+
+        # 2. Retrieve relevant context from the vector database and keyword index
+        return await _retrieve_context(request, query_embedding, route, batch_memo), query_embedding, None, route
+    finally:
+        rag_service.router.record(route)
+
+async def _load_conversation(request: ChatRequest) -> Optional[Conversation]:
+    if not request.thread_id:
+        return None
+    return await rag_service.conversations.get(request.user_id, request.thread_id, request.vehicle_id)
+
+def _is_follow_up(conversation: Optional[Conversation]) -> bool:
+    # Answers that depend on earlier turns must not be cached or served as standalone answers
+    return conversation is not None and conversation.has_history
+
+async def _finish_turn(
+    request: ChatRequest, conversation: Optional[Conversation], query_embedding: Optional[List[float]], chat_response: ChatResponse
+) -> None:
+    if rag_service.answer_cache is not None and query_embedding is not None and not _is_follow_up(conversation):
+        rag_service.answer_cache.store(request.user_id, request.vehicle_id, query_embedding, chat_response)
+    if conversation is not None:
+        await rag_service.conversations.append(conversation, request.message, chat_response.response_text, chat_response.sources)
 
-        # 2. Retrieve relevant context from the vector database
-        # TODO: Add on-chain and external API context retrieval here
-        context_sources = await rag_service.query_vector_db(
-            embedding=query_embedding,
-            user_id=request.user_id,
-            vehicle_id=request.vehicle_id
-        )
-
-        if not context_sources:
-            # Handle case where no context is found
-            # We can either let the LLM say it doesn't know, or return a canned response.
-            logger.warning(f"No context found for query: '{request.message}'")
-            # For now, we proceed and let the LLM handle it based on the system prompt.
-        
-        # 3. Generate the final response using the LLM
-        ai_response_text = await rag_service.generate_response(request.message, context_sources)
-
-        # 4. Create the Knowledge Attestation
-        context_hashes = sorted([hashlib.sha256(src.content.encode()).hexdigest() for src in context_sources])
-        timestamp, signature, _ = rag_service.create_attestation(
-            query=request.message,
-            response=ai_response_text,
-            context=context_sources
-        )
-
-        attestation = KnowledgeAttestation(
-            query=request.message,
-            response=ai_response_text,
-            context_hashes=context_hashes,
-            timestamp=timestamp,
-            signature=signature,
-        )
-
-        return ChatResponse(
-            response_text=ai_response_text,
-            sources=context_sources,
-            attestation=attestation,
-        )
+async def _answer_chat(request: ChatRequest, batch_memo: Optional[Dict] = None) -> ChatResponse:
+    """Runs one chat request through the entire RAG and Attestation pipeline."""
+    conversation = await _load_conversation(request)
+    context_sources, query_embedding, cached_response, route = await _resolve_context(request, conversation, batch_memo)
+    if cached_response is not None:
+        await _finish_turn(request, conversation, None, cached_response)
+        return cached_response
 
+    # 3. Generate the final response using the LLM (small talk has a canned reply)
+    ai_response_text = route.canned_response or await rag_service.generate_response(
+        request.message, context_sources, conversation, memo=batch_memo
+    )
+
+    # 4. Create the Knowledge Attestation
+    chat_response = await _build_chat_response(request, ai_response_text, context_sources, route)
+    await _finish_turn(request, conversation, query_embedding, chat_response)
+    return chat_response
+
+def _outgoing_attestation(request: ChatRequest, attestation: KnowledgeAttestation) -> KnowledgeAttestation:
+    # Cached and remembered responses keep the full attestation; only what is sent changes
+    use_reference = settings.ATTESTATION_BY_REFERENCE if request.attestation_by_reference is None else request.attestation_by_reference
+    return by_reference(attestation, request.message) if use_reference else attestation
+
+def _outgoing(request: ChatRequest, chat_response: ChatResponse) -> ChatResponse:
+    attestation = _outgoing_attestation(request, chat_response.attestation)
+    if attestation is chat_response.attestation:
+        return chat_response
+    return chat_response.model_copy(update={"attestation": attestation})
+
+def _json_response(http_request: Request, body: bytes) -> Response:
+    """Sends an encoded JSON body, compressed when it is large and the client accepts it."""
+    body, encoding = compress(body, http_request.headers.get("accept-encoding", ""), settings.RESPONSE_COMPRESSION_MIN_BYTES)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# The response is encoded here so it can be compressed; `response_model` stays for the OpenAPI schema
+@app.post("/chat", response_model=ChatResponse, tags=["AI"])
+async def process_chat_message(request: ChatRequest, http_request: Request):
+    """
+    The main endpoint for processing a user's chat message.
+    This endpoint orchestrates the entire RAG and Attestation pipeline.
+    """
+    try:
+        return _json_response(http_request, _outgoing(request, await _answer_chat(request)).model_dump_json().encode())
+
+    except UpstreamUnavailable as e:
+        # A provider outage is retryable by the client, unlike a bug on our side
+        logger.warning("Chat request failed: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after_header(e))
     except Exception as e:
         logger.exception("An error occurred during chat processing.")
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
+
+async def _prefetch_embeddings(requests: List[ChatRequest]) -> None:
+    """Embeds a batch's distinct messages in one upstream call, so every item finds its embedding in the store."""
+    messages = list(dict.fromkeys(
+        request.message for request in requests
+        if rag_service.router.route(request.message).route not in (SMALL_TALK, LEXICAL)
+    ))
+    if not messages:
+        return
+    try:
+        with span("batch_embedding", distinct=len(messages)):
+            await rag_service.embed_many(messages)
+    except UpstreamUnavailable as e:
+        # Items embed on their own path and report their own failures
+        logger.warning("Batch embedding prefetch failed: %s", e)
+
+@app.post("/chat/batch", tags=["AI"])
+async def process_chat_batch(batch: ChatBatchRequest):
+    """
+    Answers many chat requests in one call, e.g. the same diagnostic question across a fleet.
+    Streams one `ChatBatchResult` per line (NDJSON) as each request completes, each with its
+    own attestation. Distinct messages are embedded together up front, the per-vehicle
+    retrievals run concurrently, and requests that retrieve the same chunks or build the
+    same prompt share one context assembly and one completion.
+    A failed request is reported on its own line without affecting the others.
+    """
+    if len(batch.requests) > settings.CHAT_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {settings.CHAT_BATCH_MAX_SIZE} requests.")
+
+    async def results() -> AsyncIterator[bytes]:
+        await _prefetch_embeddings(batch.requests)
+        semaphore = asyncio.Semaphore(settings.CHAT_BATCH_CONCURRENCY)
+        batch_memo: Dict = {}
+
+        async def answer(index: int, request: ChatRequest) -> ChatBatchResult:
+            async with semaphore:
+                try:
+                    return ChatBatchResult(index=index, response=_outgoing(request, await _answer_chat(request, batch_memo)))
+                except UpstreamUnavailable as e:
+                    return ChatBatchResult(index=index, success=False, status_code=503, detail=str(e))
+                except Exception as e:
+                    logger.exception("An error occurred during batch chat processing.")
+                    return ChatBatchResult(index=index, success=False, status_code=500, detail=f"An internal error occurred: {str(e)}")
+
+        tasks = [asyncio.create_task(answer(index, request)) for index, request in enumerate(batch.requests)]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield (await completed).model_dump_json().encode() + b"\n"
+        finally:
+            # Stop outstanding work if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _retry_after_header(error: UpstreamUnavailable) -> dict:
+    return {"Retry-After": str(math.ceil(error.retry_after))} if error.retry_after else {}
+
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+@app.post("/chat/stream", tags=["AI"])
+async def stream_chat_message(request: ChatRequest):
+    """
+    Streaming variant of /chat using server-sent events.
+    Emits `route` (the routing decision) and `sources` events up front, a `token` event per
+    generated text delta, and the `attestation` as the final event once the full response
+    is known. Failures after the stream has started are reported as an `error` event, with
+    status 503 and a retry_after hint when an upstream provider is unavailable.
+    """
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            conversation = await _load_conversation(request)
+            context_sources, query_embedding, cached_response, route = await _resolve_context(request, conversation)
+            if cached_response is not None:
+                yield _sse_event("route", cached_response.metadata)
+                yield _sse_event("sources", [src.model_dump() for src in cached_response.sources])
+                yield _sse_event("token", {"text": cached_response.response_text})
+                yield _sse_event("attestation", _outgoing_attestation(request, cached_response.attestation).model_dump())
+                await _finish_turn(request, conversation, None, cached_response)
+                return
+
+            yield _sse_event("route", route.as_metadata())
+            yield _sse_event("sources", [src.model_dump() for src in context_sources])
+
+            parts: List[str] = []
+            if route.canned_response:
+                parts.append(route.canned_response)
+                yield _sse_event("token", {"text": route.canned_response})
+            else:
+                async for delta in rag_service.stream_response(request.message, context_sources, conversation):
+                    parts.append(delta)
+                    yield _sse_event("token", {"text": delta})
+
+            ai_response_text = "".join(parts)
+            if not ai_response_text:
+                ai_response_text = "I am unable to provide a response at this time."
+                yield _sse_event("token", {"text": ai_response_text})
+
+            chat_response = await _build_chat_response(request, ai_response_text, context_sources, route)
+            yield _sse_event("attestation", _outgoing_attestation(request, chat_response.attestation).model_dump())
+            await _finish_turn(request, conversation, query_embedding, chat_response)
+
+        except UpstreamUnavailable as e:
+            logger.warning("Streaming chat request failed: %s", e)
+            yield _sse_event("error", {"detail": str(e), "status": 503, "retry_after": e.retry_after})
+        except Exception as e:
+            logger.exception("An error occurred during streaming chat processing.")
+            yield _sse_event("error", {"detail": f"An internal error occurred: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+_IMPORT_FINISHED = time.perf_counter()
@@ -0,0 +1,177 @@
+"""
+Tooling for per-tenant Pinecone namespaces: moves vectors out of the shared namespace
+(where every tenant lived, told apart by user_id/vehicle_id metadata) into one namespace
+per (user_id, vehicle_id), and deletes all of a vehicle's indexed data.
+
+Rollout:
+  1. Deploy with PINECONE_PARTITIONING=namespace and PINECONE_LEGACY_FALLBACK=true (the
+     defaults). Tenants not yet moved are still answered from the shared namespace, and
+     manuals re-ingested from then on move themselves: their new chunks go to the tenant's
+     namespace and the tenant's old vectors for them are deleted from the shared one.
+  2. python migrate_namespaces.py migrate          # every tenant; safe to stop and rerun
+  3. python migrate_namespaces.py status           # exits non-zero while tenant vectors remain
+  4. Set PINECONE_LEGACY_FALLBACK=false.
+
+Also:
+  python migrate_namespaces.py status
+  python migrate_namespaces.py migrate --user-id user-id-123 --vehicle-id vehicle-id-456
+  python migrate_namespaces.py delete --user-id user-id-123 --vehicle-id vehicle-id-456
+"""
+import sys
+import json
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    # Before process_pdf reads its configuration from the environment
+    load_dotenv("../.env")
+
+from process_pdf import (
+    INDEX_GENERATION_DIR, MANIFEST_DIR, get_chunk_store, get_lexical_index, get_vector_store, vector_upstream,
+)
+from src.services.answer_cache import mark_reindexed
+from src.services.ingest_manifest import IngestManifest
+from src.services.vector_store import LEGACY_NAMESPACE, PineconeVectorStore, partition_key, tenant_filter
+
+UPSERT_BATCH_SIZE = 100  # Keeps each request under Pinecone's size limit at 1536 dimensions
+# Shared-namespace vectors that name their tenant; anything else cannot be attributed and stays
+ATTRIBUTABLE_FILTER = {"user_id": {"$exists": True}, "vehicle_id": {"$exists": True}}
+
+
+def pinecone_store() -> PineconeVectorStore:
+    store = get_vector_store()
+    if not isinstance(store, PineconeVectorStore) or store.partitioning != "namespace":
+        raise SystemExit("Namespaces apply to VECTOR_STORE_BACKEND=pinecone with PINECONE_PARTITIONING=namespace")
+    return store
+
+async def tenant_vectors_left(store: PineconeVectorStore, probe: List[float], page_filter: Dict = ATTRIBUTABLE_FILTER, limit: int = 1000) -> int:
+    """Attributable vectors still in the shared namespace, counted up to `limit`."""
+    page = await vector_upstream.call(lambda: store.legacy_page(probe, limit, page_filter, include_values=False))
+    return len(page)
+
+async def status() -> Dict:
+    """
+    Vector counts per layout. `tenant_vectors_left` (counted up to 1000) must be 0 before
+    the legacy fallback is turned off.
+    """
+    store = pinecone_store()
+    stats = await store.index.describe_index_stats()
+    namespaces = stats.get("namespaces") or {}
+    legacy = namespaces.get(LEGACY_NAMESPACE) or {}
+    left = await tenant_vectors_left(store, await store.probe_vector()) if legacy.get("vector_count") else 0
+    return {
+        "dimension": stats.get("dimension"),
+        "total_vectors": stats.get("total_vector_count"),
+        "legacy_vectors": legacy.get("vector_count", 0),
+        "tenant_vectors_left": left,
+        "tenant_namespaces": len([name for name in namespaces if name != LEGACY_NAMESPACE]),
+    }
+
+async def migrate(user_id: Optional[str] = None, vehicle_id: Optional[str] = None, page_size: int = 1000) -> Dict:
+    """
+    Drains the shared namespace a page at a time: each vector is upserted into its tenant's
+    namespace, then deleted from the shared one. A vector lives in exactly one of the two at
+    any time, so queries with the legacy fallback on stay correct throughout, and an
+    interrupted run resumes where it stopped. Vectors of a manual whose manifest no longer
+    lists them (it was re-ingested since) are deleted rather than moved.
+    """
+    store = pinecone_store()
+    probe = await store.probe_vector()
+    page_filter = tenant_filter(user_id, vehicle_id) if user_id else ATTRIBUTABLE_FILTER
+    moved: Dict[Tuple[str, str], int] = defaultdict(int)
+    dropped = 0
+    seen = set()
+    manifests: Dict[Tuple[str, str], Dict[str, IngestManifest]] = {}
+
+    def superseded(tenant: Tuple[str, str], vector: Dict) -> bool:
+        if tenant not in manifests:
+            manifests[tenant] = {manifest.file_name: manifest for manifest in IngestManifest.for_vehicle(MANIFEST_DIR, *tenant)}
+        manifest = manifests[tenant].get(vector["metadata"].get("source_file"))
+        return manifest is not None and vector["id"] not in manifest.chunks
+
+    while True:
+        page = await vector_upstream.call(lambda: store.legacy_page(probe, page_size, page_filter))
+        by_tenant = defaultdict(list)
+        for vector in page:
+            tenant = (vector["metadata"].get("user_id"), vector["metadata"].get("vehicle_id"))
+            if all(tenant):
+                by_tenant[tenant].append(vector)
+        if not by_tenant:
+            # Empty page, or only vectors with blank tenant fields, which status still reports
+            break
+        if seen.issuperset(vector["id"] for vectors in by_tenant.values() for vector in vectors):
+            # Deletes become visible to queries after a short delay
+            await asyncio.sleep(1.0)
+            continue
+
+        for (tenant_user, tenant_vehicle), vectors in by_tenant.items():
+            namespace = partition_key(tenant_user, tenant_vehicle)
+            current = [vector for vector in vectors if not superseded((tenant_user, tenant_vehicle), vector)]
+            for i in range(0, len(current), UPSERT_BATCH_SIZE):
+                batch = current[i:i + UPSERT_BATCH_SIZE]
+                await vector_upstream.call(lambda: store.index.upsert(vectors=batch, namespace=namespace))
+            ids = [vector["id"] for vector in vectors]
+            await vector_upstream.call(lambda: store.index.delete(ids=ids, namespace=LEGACY_NAMESPACE))
+            current_ids = {vector["id"] for vector in current}
+            new = [vector_id for vector_id in ids if vector_id not in seen]
+            seen.update(new)
+            moved[(tenant_user, tenant_vehicle)] += sum(vector_id in current_ids for vector_id in new)
+            dropped += sum(vector_id not in current_ids for vector_id in new)
+        print(f"Moved {sum(moved.values())} vectors for {len(moved)} vehicles so far ({dropped} superseded ones deleted)...")
+
+    for tenant_user, tenant_vehicle in moved:
+        # The manuals are now in the namespace layout; their next ingestion can stay incremental
+        for manifest in IngestManifest.for_vehicle(MANIFEST_DIR, tenant_user, tenant_vehicle):
+            if manifest.layout != store.layout:
+                manifest.layout = store.layout
+                manifest.save()
+
+    left = await tenant_vectors_left(store, probe, page_filter)
+    return {"moved_vectors": sum(moved.values()), "dropped_vectors": dropped, "vehicles": len(moved), "tenant_vectors_left": left}
+
+async def delete_vehicle(user_id: str, vehicle_id: str) -> Dict:
+    """Deletes a vehicle's vectors (both layouts), chunk text, keyword index entries and manifests."""
+    store = get_vector_store()
+    await vector_upstream.call(lambda: store.delete_partition(user_id, vehicle_id))
+    chunks = get_chunk_store().delete_partition(user_id, vehicle_id)
+    get_lexical_index().delete_partition(user_id, vehicle_id)
+    manifests = 0
+    for manifest in IngestManifest.for_vehicle(MANIFEST_DIR, user_id, vehicle_id):
+        manifest.remove()
+        manifests += 1
+    mark_reindexed(INDEX_GENERATION_DIR, user_id, vehicle_id)
+    return {"chunks": chunks, "manifests": manifests}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Per-tenant namespace migration and vehicle deletion.")
+    parser.add_argument("command", choices=["status", "migrate", "delete"])
+    parser.add_argument("--user-id")
+    parser.add_argument("--vehicle-id")
+    parser.add_argument("--page-size", type=int, default=1000, help="Vectors fetched per page (Pinecone allows up to 1000 with values)")
+    args = parser.parse_args()
+    if bool(args.user_id) != bool(args.vehicle_id):
+        parser.error("--user-id and --vehicle-id go together")
+    if args.command == "delete" and not args.user_id:
+        parser.error("delete needs --user-id and --vehicle-id")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.command == "status":
+        result = asyncio.run(status())
+    elif args.command == "migrate":
+        result = asyncio.run(migrate(args.user_id, args.vehicle_id, args.page_size))
+    else:
+        result = asyncio.run(delete_vehicle(args.user_id, args.vehicle_id))
+    print(json.dumps(result, indent=2))
+    if result.get("tenant_vectors_left"):
+        sys.exit(
+            f"{result['tenant_vectors_left']} or more tenant vectors are still in the shared namespace; "
+            "keep PINECONE_LEGACY_FALLBACK on and rerun migrate"
+        )
@@ -10,6 +10,9 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=2000, description="The user's chat message.")
     thread_id: Optional[str] = Field(None, description="The ID of the conversation thread for context.")
     wallet_address: Optional[str] = Field(None, description="The user's Web3 wallet address for on-chain context retrieval.")
+    attestation_by_reference: Optional[bool] = Field(
+        None, description="Return the attestation with hashes of the query and response instead of their text; defaults to the service setting."
+    )
 
 class ContextSource(BaseModel):
     """
@@ -25,12 +28,27 @@ class KnowledgeAttestation(BaseModel):
     A cryptographically signed attestation of the AI's response.
     This object can be stored to provide a verifiable record of the information provided.
     As per oracle_web3 doctrine 2.1: "Trust, but verify with cryptography."
+
+    By reference, `response` is omitted and `response_hash` (sha256 hex) identifies it
+    instead; the signature still covers the full text, which the verifier takes from
+    `ChatResponse.response_text`. Likewise `query` gives way to `query_hash` and is taken
+    from the request, unless the attested query differs from it (an answer served from
+    the cache), in which case `query` is kept.
     """
-    query: str
-    response: str
+    query: Optional[str] = None
+    response: Optional[str] = None
+    query_hash: Optional[str] = None
+    response_hash: Optional[str] = None
     context_hashes: List[str]
     timestamp: str
     signature: str
+    # "single": `signature` covers this response alone.
+    # "merkle_batch": `signature` covers `merkle_root`, and `merkle_proof` links `leaf_hash` to it.
+    mode: str = "single"
+    leaf_hash: Optional[str] = None
+    merkle_root: Optional[str] = None
+    merkle_proof: Optional[List[Dict[str, str]]] = None
+    batch_timestamp: Optional[str] = None
 
 class ChatResponse(BaseModel):
     """
@@ -39,4 +57,22 @@ class ChatResponse(BaseModel):
     success: bool = True
     response_text: str
     sources: List[ContextSource]
-    attestation: KnowledgeAttestation
\ No newline at end of file
+    attestation: KnowledgeAttestation
+    metadata: Dict[str, Any] = Field({}, description="How the response was produced, e.g. the retrieval route taken.")
+
+class ChatBatchRequest(BaseModel):
+    """
+    Many chat requests answered in one call, e.g. the same diagnostic question across a fleet.
+    """
+    requests: List[ChatRequest] = Field(..., min_length=1, description="The chat requests to answer.")
+
+class ChatBatchResult(BaseModel):
+    """
+    One line of the /chat/batch NDJSON stream. Lines arrive in completion order; `index`
+    is the position of the request in the batch.
+    """
+    index: int
+    success: bool = True
+    status_code: int = 200
+    response: Optional[ChatResponse] = None
+    detail: Optional[str] = None
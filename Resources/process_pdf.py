@@ -1,81 +1,406 @@
 import fitz  # PyMuPDF
-import openai
-from pinecone import Pinecone
+import argparse
+import asyncio
 import hashlib
-from typing import List, Dict
+import multiprocessing
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
-load_dotenv("../.env")
+from src.services.answer_cache import mark_reindexed
+from src.services.chunk_store import ChunkStore
+from src.services.clients import create_llm_client
+from src.services.embedding_store import EmbeddingStore
+from src.services.ingest_manifest import IngestManifest
+from src.services.lexical_index import LexicalIndex
+from src.services.resilience import CircuitBreaker, Upstream
+from src.services.vector_store import VectorStore, create_vector_store, partition_key
+
+if __name__ == '__main__':
+    # Only the command-line entry point reads .env (spawned workers inherit its environment);
+    # importers such as the benchmark bring their own
+    load_dotenv("../.env")
 
 # --- Configuration ---
-openai.api_key = os.getenv("OPENAI_API_KEY")
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-pinecone_index = pc.Index(os.getenv("PINECONE_INDEX_NAME", "gear-ai-manuals"))
-EMBEDDING_MODEL = "text-embedding-3-small"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# Must match the chat service; after changing it, re-ingest with --full into a fresh index
+EMBEDDING_DIMENSIONS = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS") or 0) or None
+EMBEDDING_OPTIONS = {"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
 CHUNK_SIZE = 400  # Target words per chunk
 CHUNK_OVERLAP = 50 # Word overlap
+# Content-defined chunking: a boundary falls wherever the hash of the trailing
+# BOUNDARY_WINDOW words hits, clamped to [CHUNK_MIN_WORDS, CHUNK_MAX_WORDS].
+# On average chunks come out at CHUNK_SIZE words.
+CHUNK_MIN_WORDS = CHUNK_SIZE // 2
+CHUNK_MAX_WORDS = CHUNK_SIZE * 2
+BOUNDARY_WINDOW = 8
+BATCH_SIZE = 100  # Chunks per embedding call / upsert
+MAX_IN_FLIGHT_BATCHES = int(os.getenv("INGEST_CONCURRENCY", "4"))
+MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", ".cache/ingest_manifests")
+INDEX_GENERATION_DIR = os.getenv("INDEX_GENERATION_DIR", ".cache/index_generations")
+
+# Stores are opened on first use, so importing this module touches neither disk nor network
+@lru_cache(maxsize=None)
+def get_vector_store() -> VectorStore:
+    return create_vector_store(
+        os.getenv("VECTOR_STORE_BACKEND", "pinecone"),
+        local_dir=os.getenv("LOCAL_VECTOR_STORE_DIR", ".cache/vectors"),
+        pinecone_api_key=os.getenv("PINECONE_API_KEY"),
+        pinecone_index_name=os.getenv("PINECONE_INDEX_NAME", "gear-ai-manuals"),
+        timeout_seconds=60.0,
+        # Must match the chat service, which reads what this writes
+        partitioning=os.getenv("PINECONE_PARTITIONING", "namespace"),
+        legacy_fallback=os.getenv("PINECONE_LEGACY_FALLBACK", "true").lower() == "true",
+    )
+
+@lru_cache(maxsize=None)
+def get_embedding_store() -> EmbeddingStore:
+    return EmbeddingStore(
+        model=EMBEDDING_MODEL,
+        db_path=os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3"),
+        dimensions=EMBEDDING_DIMENSIONS,
+    )
+
+@lru_cache(maxsize=None)
+def get_chunk_store() -> ChunkStore:
+    return ChunkStore(os.getenv("CHUNK_STORE_PATH", ".cache/chunks.sqlite3"))
+
+@lru_cache(maxsize=None)
+def get_lexical_index() -> LexicalIndex:
+    return LexicalIndex(os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical.sqlite3"))
+
+# Ingestion runs in the background, so it rides out provider hiccups with more and longer
+# retries than chat requests; a batch that still fails stops the run, which resumes from
+# the manifest on the next one.
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "6"))
+llm_upstream = Upstream(
+    LLM_BACKEND, max_attempts=INGEST_MAX_ATTEMPTS, backoff_base_seconds=1.0, backoff_max_seconds=30.0,
+    breaker=CircuitBreaker(failure_threshold=INGEST_MAX_ATTEMPTS * 2, reset_seconds=60.0),
+)
+vector_upstream = Upstream(
+    os.getenv("VECTOR_STORE_BACKEND", "pinecone"), max_attempts=INGEST_MAX_ATTEMPTS, backoff_base_seconds=1.0,
+    backoff_max_seconds=30.0, breaker=CircuitBreaker(failure_threshold=INGEST_MAX_ATTEMPTS * 2, reset_seconds=60.0),
+)
+
+async def embed_texts(openai_client, texts: List[str]) -> List[List[float]]:
+    """Embeds texts, only calling the API for texts not already in the embedding store."""
+    embedding_store = get_embedding_store()
+    embeddings = embedding_store.get_many(texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        res = await llm_upstream.call(lambda: openai_client.embeddings.create(
+            input=missing_texts, model=EMBEDDING_MODEL, **EMBEDDING_OPTIONS
+        ))
+        fresh = [record.embedding for record in sorted(res.data, key=lambda record: record.index)]
+        embedding_store.put_many(missing_texts, fresh)
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+    return embeddings
+
+# --- Streaming Extraction & Chunking ---
+
+class IngestStats:
+    """Counters for a single ingestion run."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.pages = 0
+        self.words = 0
+        self.chunks = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.seconds = 0.0
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**vars(self), "pages_per_sec": round(self.pages_per_sec, 2)}
+
+def iter_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yields (page_number, text) one page at a time."""
+    with fitz.open(file_path) as doc:
+        for page in doc:
+            yield page.number + 1, page.get_text()
+
+def iter_words(pages: Iterable[Tuple[int, str]], stats: Optional[IngestStats] = None) -> Iterator[Tuple[str, int]]:
+    """Yields (word, page_number) so chunks can record the pages they span."""
+    for page_number, page_text in pages:
+        words = page_text.split()
+        if stats is not None:
+            stats.pages += 1
+            stats.words += len(words)
+        for word in words:
+            yield word, page_number
+
+def _is_boundary(window: Iterable[str]) -> bool:
+    return zlib.crc32(" ".join(window).encode()) % (CHUNK_SIZE - CHUNK_MIN_WORDS) == 0
+
+def _make_chunk(words: List[str], pages: List[Optional[int]], start_word: int, file_name: str, id_prefix: str = "") -> Dict:
+    text = " ".join(words)
+    chunk_hash = hashlib.sha256(text.encode()).hexdigest()
+    metadata = {"source_file": file_name, "start_word": start_word, "chunk_hash": chunk_hash}
+    if pages[0] is not None:
+        metadata["page_number"] = pages[0]
+        metadata["page_end"] = pages[-1]
+    return {
+        "id": f"{id_prefix}{file_name}#{chunk_hash[:16]}",
+        "text": text,
+        "metadata": metadata
+    }
+
+def iter_chunks(words: Iterable[Tuple[str, Optional[int]]], file_name: str, id_prefix: str = "") -> Iterator[Dict]:
+    """
+    Splits a stream of words into overlapping chunks with metadata.
+    Boundaries depend only on the surrounding words rather than fixed offsets, so a local
+    edit changes the chunks around it without shifting every later boundary. Chunk ids
+    are derived from the chunk content for the same reason, after `id_prefix`.
+    Only the chunk being built is held in memory.
+    """
+    seen_ids = set()
+    window = deque(maxlen=BOUNDARY_WINDOW)
+    tail: List[str] = []     # Last CHUNK_OVERLAP words before the current chunk
+    tail_pages: List[Optional[int]] = []
+    current: List[str] = []
+    current_pages: List[Optional[int]] = []
+    position = 0
+
+    def emit() -> Optional[Dict]:
+        chunk = _make_chunk(tail + current, tail_pages + current_pages, position - len(current) - len(tail), file_name, id_prefix)
+        if chunk["id"] in seen_ids:
+            # Repeated boilerplate produces the same vector; index it once
+            return None
+        seen_ids.add(chunk["id"])
+        return chunk
+
+    for word, page_number in words:
+        window.append(word)
+        current.append(word)
+        current_pages.append(page_number)
+        position += 1
+        length = len(current)
+        if length >= CHUNK_MAX_WORDS or (length >= CHUNK_MIN_WORDS and _is_boundary(window)):
+            chunk = emit()
+            if chunk is not None:
+                yield chunk
+            tail = (tail + current)[-CHUNK_OVERLAP:]
+            tail_pages = (tail_pages + current_pages)[-CHUNK_OVERLAP:]
+            current = []
+            current_pages = []
+
+    if current:
+        chunk = emit()
+        if chunk is not None:
+            yield chunk
 
 def chunk_text(text: str, file_name: str) -> List[Dict]:
     """Splits text into overlapping chunks with metadata."""
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), CHUNK_SIZE - CHUNK_OVERLAP):
-        chunk_words = words[i:i + CHUNK_SIZE]
-        chunk_text = " ".join(chunk_words)
-        chunk_hash = hashlib.sha256(chunk_text.encode()).hexdigest()
-        chunks.append({
-            "id": f"{file_name}-{i}",
-            "text": chunk_text,
-            "metadata": {"source_file": file_name, "start_word": i, "chunk_hash": chunk_hash}
-        })
-    return chunks
-
-def process_pdf(file_path: str, user_id: str, vehicle_id: str):
-    """Full pipeline: extract, chunk, embed, and upsert a PDF."""
-    print(f"Processing {file_path}...")
-    doc = fitz.open(file_path)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text()
+    return list(iter_chunks(((word, None) for word in text.split()), file_name))
 
-    print(f"Extracted {len(full_text.split())} words.")
-    
+def _legacy_chunk_ids(file_name: str, word_count: int) -> List[str]:
+    """Ids written by the old fixed-offset chunker, which had no manifest to diff against."""
+    return [f"{file_name}-{i}" for i in range(0, word_count, CHUNK_SIZE - CHUNK_OVERLAP)]
+
+def _next_batch(chunks: Iterator[Dict], size: int) -> List[Dict]:
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == size:
+            break
+    return batch
+
+# --- Ingestion Pipeline ---
+
+async def ingest_pdf(
+    file_path: str,
+    user_id: str,
+    vehicle_id: str,
+    incremental: bool = True,
+    max_in_flight: int = MAX_IN_FLIGHT_BATCHES,
+) -> IngestStats:
+    """
+    Streams a PDF through extract -> chunk -> embed batch -> upsert.
+    Up to `max_in_flight` batches are embedded and upserted concurrently while the next
+    batch is extracted, so memory stays bounded by the batch size rather than the manual.
+    In incremental mode only chunks missing from the manual's manifest are embedded and
+    upserted; in either mode vectors for chunks that no longer exist are deleted.
+    Upstream calls are retried; if a batch still fails, the batches already in flight are
+    allowed to finish and be checkpointed, so rerunning the same command resumes after them.
+    """
+    started = time.perf_counter()
+    stats = IngestStats(file_path)
     file_name = os.path.basename(file_path)
-    chunks = chunk_text(full_text, file_name)
-    print(f"Created {len(chunks)} chunks.")
-
-    # Generate embeddings in batches
-    batch_size = 100
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i + batch_size]
-        texts_to_embed = [chunk["text"] for chunk in batch_chunks]
-        
-        print(f"Generating embeddings for batch {i//batch_size + 1}...")
-        res = openai.embeddings.create(input=texts_to_embed, model=EMBEDDING_MODEL)
-        embeddings = [record.embedding for record in res.data]
-
-        # Prepare vectors for Pinecone
-        vectors_to_upsert = []
-        for j, chunk in enumerate(batch_chunks):
-            vector_metadata = {
-                "user_id": user_id,
-                "vehicle_id": vehicle_id,
-                **chunk["metadata"]
-            }
-            vectors_to_upsert.append({
-                "id": chunk["id"],
-                "values": embeddings[j],
-                "metadata": vector_metadata
-            })
-        
-        print(f"Upserting {len(vectors_to_upsert)} vectors to Pinecone...")
-        pinecone_index.upsert(vectors=vectors_to_upsert)
-
-    print(f"Successfully processed and indexed {file_path}.")
+    print(f"Processing {file_path}...")
+    vector_store, chunk_store, lexical_index = get_vector_store(), get_chunk_store(), get_lexical_index()
+
+    manifest = IngestManifest.load(MANIFEST_DIR, file_name, user_id, vehicle_id)
+    is_first_run = manifest is None
+    if is_first_run:
+        manifest = IngestManifest.empty(MANIFEST_DIR, file_name, user_id, vehicle_id)
+        manifest.layout = vector_store.layout
+    previous_ids = set(manifest.chunks)
+    current_ids = set()
+    # A manual indexed in another layout (e.g. before per-tenant namespaces) is upserted in
+    # full into the current one, then removed from the old shared space
+    relayout = not is_first_run and (manifest.layout or "metadata") != vector_store.layout
+    if relayout:
+        print(f"Moving {file_path} from the {manifest.layout or 'metadata'} layout to {vector_store.layout}.")
+        incremental = False
+
+    # Every tenant shares one namespace in the metadata layout, where two vehicles with the
+    # same manual would otherwise write the same ids
+    id_prefix = f"{partition_key(user_id, vehicle_id)}:" if vector_store.layout == "metadata" else ""
+
+    # The client's connection pool belongs to this run's event loop
+    openai_client = create_llm_client(LLM_BACKEND, api_key=os.getenv("OPENAI_API_KEY"), timeout_seconds=60.0)
+
+    async def embed_and_upsert(batch_chunks: List[Dict]) -> None:
+        embeddings = await embed_texts(openai_client, [chunk["text"] for chunk in batch_chunks])
+        vectors_to_upsert = [
+            {"id": chunk["id"], "values": embedding, "metadata": chunk["metadata"]}
+            for chunk, embedding in zip(batch_chunks, embeddings)
+        ]
+        await vector_upstream.call(lambda: vector_store.upsert(user_id, vehicle_id, vectors_to_upsert))
+
+        # Record progress per batch so an interrupted run resumes where it stopped
+        for chunk in batch_chunks:
+            manifest.chunks[chunk["id"]] = chunk["metadata"]["chunk_hash"]
+        manifest.save()
+        stats.upserted += len(batch_chunks)
+
+    in_flight: set = set()
+    try:
+        # PyMuPDF is not thread-safe, so every extraction step runs on the same dedicated thread
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=1) as extractor:
+            chunks = iter_chunks(iter_words(iter_pages(file_path), stats), file_name, id_prefix)
+            while True:
+                batch = await loop.run_in_executor(extractor, _next_batch, chunks, BATCH_SIZE)
+                if not batch:
+                    break
+                stats.chunks += len(batch)
+                current_ids.update(chunk["id"] for chunk in batch)
+                # Always refresh the local text store and keyword index; they are cheap and
+                # backfill chunks that were indexed before they existed
+                chunk_store.put_many(user_id, vehicle_id, batch)
+                lexical_index.put_many(user_id, vehicle_id, batch)
+                batch = [chunk for chunk in batch if not incremental or chunk["id"] not in manifest.chunks]
+                if not batch:
+                    continue
+
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                in_flight.add(asyncio.create_task(embed_and_upsert(batch)))
+
+            if in_flight:
+                await asyncio.gather(*in_flight)
+    except BaseException:
+        # Let the other in-flight batches finish and reach the manifest before giving up
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        print(f"Stopped indexing {file_path} after {stats.upserted} chunks; rerun to resume.")
+        raise
+    finally:
+        await openai_client.close()
+
+    if relayout:
+        # The old layout's copies are removed from the shared namespace here rather than
+        # as orphans of the current layout, where they never were
+        if vector_store.layout == "namespace":
+            old_ids = sorted(previous_ids)
+            stats.deleted += await vector_upstream.call(lambda: vector_store.delete_legacy(user_id, vehicle_id, old_ids))
+        manifest.layout = vector_store.layout
+
+    if is_first_run:
+        # Vectors from the old fixed-offset chunker, if this tenant has any, in the shared space
+        legacy_ids = _legacy_chunk_ids(file_name, stats.words)
+        stats.deleted += await vector_upstream.call(lambda: vector_store.delete_legacy(user_id, vehicle_id, legacy_ids))
+
+    # Delete orphans only after their replacements are live
+    orphaned_ids = sorted(previous_ids - current_ids)
+    delete_batch_size = 1000
+    for i in range(0, len(orphaned_ids), delete_batch_size):
+        batch_ids = orphaned_ids[i:i + delete_batch_size]
+        if not relayout:
+            await vector_upstream.call(lambda: vector_store.delete(user_id, vehicle_id, batch_ids))
+            stats.deleted += len(batch_ids)
+        chunk_store.delete_many(user_id, vehicle_id, batch_ids)
+        lexical_index.delete_many(user_id, vehicle_id, batch_ids)
+        for vector_id in batch_ids:
+            manifest.chunks.pop(vector_id, None)
+    manifest.save()
+
+    if stats.upserted or stats.deleted:
+        # Cached chat answers for this vehicle were built from the old index
+        mark_reindexed(INDEX_GENERATION_DIR, user_id, vehicle_id)
+
+    stats.seconds = time.perf_counter() - started
+    print(
+        f"Indexed {file_path}: {stats.pages} pages, {stats.chunks} chunks, "
+        f"{stats.upserted} upserted, {stats.deleted} deleted in {stats.seconds:.1f}s "
+        f"({stats.pages_per_sec:.1f} pages/sec)."
+    )
+    return stats
+
+def process_pdf(file_path: str, user_id: str, vehicle_id: str, incremental: bool = True) -> Dict:
+    """Full pipeline: extract, chunk, embed, and upsert a PDF."""
+    return asyncio.run(ingest_pdf(file_path, user_id, vehicle_id, incremental)).as_dict()
+
+def process_many(jobs: List[Tuple[str, str, str]], workers: int = os.cpu_count() or 1, incremental: bool = True) -> Dict:
+    """
+    Ingests many PDFs across a process pool, one manual per worker process, so the
+    CPU-bound PyMuPDF extraction scales with cores. Returns aggregate throughput.
+    """
+    started = time.perf_counter()
+    results = []
+    failed = []
+    # Spawned workers build their own API clients instead of inheriting this process's sockets
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(process_pdf, file_path, user_id, vehicle_id, incremental) for file_path, user_id, vehicle_id in jobs]
+        for (file_path, _, _), future in zip(jobs, futures):
+            # One manual failing does not stop the others; it resumes from its manifest on the next run
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Failed to ingest {file_path}: {e}")
+                failed.append(file_path)
+
+    seconds = time.perf_counter() - started
+    pages = sum(result["pages"] for result in results)
+    summary = {
+        "files": len(results),
+        "pages": pages,
+        "chunks": sum(result["chunks"] for result in results),
+        "upserted": sum(result["upserted"] for result in results),
+        "deleted": sum(result["deleted"] for result in results),
+        "seconds": round(seconds, 2),
+        "pages_per_sec": round(pages / seconds, 2) if seconds else 0.0,
+        "failed": failed,
+    }
+    print(f"Ingested {summary['files']} files, {pages} pages at {summary['pages_per_sec']} pages/sec.")
+    return summary
 
 if __name__ == '__main__':
-    # This is an example of how the script would be run
-    # In production, this would be a background worker task.
-    # process_pdf("path/to/your/manual.pdf", "user-id-123", "vehicle-id-456")
-    print("PDF Processing Script is ready.")
\ No newline at end of file
+    # Background worker entry point, e.g.:
+    # python process_pdf.py --user-id user-id-123 --vehicle-id vehicle-id-456 manual1.pdf manual2.pdf
+    parser = argparse.ArgumentParser(description="Index vehicle manuals into the vector database.")
+    parser.add_argument("files", nargs="+", help="PDF files to ingest")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--vehicle-id", required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for parallel PDFs")
+    parser.add_argument("--full", action="store_true", help="Re-upsert every chunk instead of only changed ones")
+    args = parser.parse_args()
+
+    jobs = [(file_path, args.user_id, args.vehicle_id) for file_path in args.files]
+    summary = process_many(jobs, workers=min(args.workers, len(jobs)), incremental=not args.full)
+    if summary["failed"]:
+        raise SystemExit(1)
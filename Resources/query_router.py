@@ -0,0 +1,210 @@
+import re
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.services.lexical_index import find_codes
+from src.telemetry import metrics
+
+SMALL_TALK = "small_talk"
+LEXICAL = "lexical"
+STANDARD = "standard"
+COMPLEX = "complex"
+
+route_decisions_total = metrics.counter("gear_ai_route_decisions_total", "Query router decisions, by route and reason")
+
+# Filler that may follow a small-talk phrase ("thanks so much!", "hi there :)"); anything
+# else in the message makes it a question, however short
+_FILLER = r"(there|again|so much|very much|a lot|all|guys|everyone|mate|man|buddy|then|now|for now|for (the|your) help)"
+
+
+def _small_talk_rule(phrases: str) -> "re.Pattern":
+    # The whole message: the phrase ("ok, got it" repeats it), optional filler, then only punctuation or emoji
+    return re.compile(rf"^\W*({phrases})(\W+({phrases}|{_FILLER}))*\W*$", re.IGNORECASE)
+
+
+_SMALL_TALK_RULES = [
+    ("greeting", _small_talk_rule(r"hi|hello|hey|yo|hiya|good (morning|afternoon|evening)")),
+    ("thanks", _small_talk_rule(r"thanks|thank you|thx|ty|cheers|much appreciated")),
+    ("farewell", _small_talk_rule(r"bye|goodbye|see you|see ya|later|good night")),
+    ("acknowledgement", _small_talk_rule(r"ok|okay|k|cool|great|nice|got it|perfect|awesome|sounds good")),
+]
+# Messages naming a part of the car are never small talk, whatever the classifier thinks
+_VEHICLE_TERM_RE = re.compile(
+    r"\b(car|vehicle|truck|model|engine|oil|tires?|tyres?|brakes?|battery|light|lamp|code|fluid|coolant|filter|"
+    r"transmission|warning|fuse|wipers?|pressure|service|maintenance|mileage|miles|spark|belt|alternator|radiator|"
+    r"headlights?|dashboard|gauge|exhaust|suspension|steering|clutch|gear|recall|tpms|abs)\b",
+    re.IGNORECASE,
+)
+# Small talk rules only apply to short messages; "thanks, and what oil does it take?" is a question
+_SMALL_TALK_MAX_WORDS = 5
+_QUESTION_WORD_RE = re.compile(r"\b(what|how|why|where|when|which|who|can|should|does|is|are)\b", re.IGNORECASE)
+_COMPLEX_RE = re.compile(
+    r"\b(compare|comparison|difference|differences|versus|vs\.?|step[- ]by[- ]step|walk me through|"
+    r"explain why|pros and cons|troubleshoot|diagnose|all the)\b",
+    re.IGNORECASE,
+)
+_COMPLEX_MIN_WORDS = 30
+
+CANNED_RESPONSES = {
+    "greeting": "Hi! I'm Gear AI. Ask me anything about your vehicle: maintenance, specs, warning lights or diagnostic codes.",
+    "thanks": "You're welcome! Let me know if there's anything else I can help with for your vehicle.",
+    "farewell": "Goodbye, and drive safely!",
+    "acknowledgement": "Great. Is there anything else you'd like to know about your vehicle?",
+    "classifier": "I'm Gear AI, your vehicle assistant. Ask me about maintenance, specs, warning lights or diagnostic codes.",
+}
+
+# Seed examples for the nearest-centroid classifier; embedded once and kept in the embedding store
+EXEMPLARS: Dict[str, List[str]] = {
+    SMALL_TALK: [
+        "hi there", "hello, how are you", "thank you so much", "thanks for the help", "good morning",
+        "who are you", "bye for now", "ok cool", "you're awesome", "nice to meet you",
+    ],
+    STANDARD: [
+        "what oil does my car take", "what is the recommended tire pressure", "how do I reset the maintenance light",
+        "where is the fuse box", "what does the check engine light mean", "how often should I rotate my tires",
+        "what is the towing capacity", "which coolant should I use",
+    ],
+    COMPLEX: [
+        "compare the maintenance schedule for severe and normal driving conditions and explain the differences",
+        "why does my car vibrate when braking at highway speed and what should I check first",
+        "walk me through replacing the cabin air filter step by step",
+        "list all the fluids that need changing at 60000 miles with their capacities and specifications",
+        "my engine is overheating and the coolant level keeps dropping, what could be causing it",
+    ],
+}
+
+
+class RouteDecision:
+    """The path chosen for a message, and why. Recorded in the response metadata."""
+    __slots__ = ("route", "reason", "top_k", "token_budget")
+
+    def __init__(self, route: str, reason: str, top_k: int = 0, token_budget: int = 0):
+        self.route = route
+        self.reason = reason
+        self.top_k = top_k
+        self.token_budget = token_budget
+
+    @property
+    def canned_response(self) -> Optional[str]:
+        return CANNED_RESPONSES.get(self.reason.split(":", 1)[-1]) if self.route == SMALL_TALK else None
+
+    def as_metadata(self) -> Dict:
+        metadata = {"route": self.route, "route_reason": self.reason}
+        if self.top_k:
+            metadata["top_k"] = self.top_k
+        return metadata
+
+
+class QueryRouter:
+    """
+    Picks a retrieval path per message. Rules run first and need no model calls:
+    small talk gets a canned reply, exact codes go to the keyword index, and long or
+    multi-part questions get a deeper retrieval. Messages no rule claims are embedded
+    as usual, and a nearest-centroid classifier over the exemplar embeddings can still
+    divert them to small talk or the complex path before the vector query.
+    """
+
+    def __init__(
+        self,
+        standard_top_k: int,
+        complex_top_k: int,
+        standard_token_budget: int,
+        complex_token_budget: int,
+        classifier_margin: float = 0.05,
+        use_classifier: bool = True,
+    ):
+        self.standard_top_k = standard_top_k
+        self.complex_top_k = complex_top_k
+        self.standard_token_budget = standard_token_budget
+        self.complex_token_budget = complex_token_budget
+        self.classifier_margin = classifier_margin
+        self.use_classifier = use_classifier
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._building: Optional[asyncio.Future] = None
+
+    def route(self, message: str) -> RouteDecision:
+        """Rule-based routing; needs no embedding."""
+        text = message.strip()
+        words = text.split()
+        if find_codes(text):
+            return self._decide(LEXICAL, "rule:exact_code")
+        if len(words) <= _SMALL_TALK_MAX_WORDS and not _QUESTION_WORD_RE.search(text) and not _VEHICLE_TERM_RE.search(text):
+            for name, rule in _SMALL_TALK_RULES:
+                if rule.match(text):
+                    return self._decide(SMALL_TALK, f"rule:{name}")
+        if len(words) >= _COMPLEX_MIN_WORDS or text.count("?") > 1 or _COMPLEX_RE.search(text):
+            return self._decide(COMPLEX, "rule:complex")
+        return self._decide(STANDARD, "default")
+
+    async def refine(
+        self,
+        decision: RouteDecision,
+        embedding: List[float],
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+        message: str = "",
+    ) -> RouteDecision:
+        """
+        Lets the classifier override a default decision once the query embedding is known.
+        It never turns a message about the car (`message`) into small talk.
+        """
+        if not self.use_classifier or decision.reason != "default":
+            return decision
+        if self._centroids is None:
+            await self._ensure_centroids(embed_many)
+        scores = self._centroids @ _normalize(np.asarray(embedding, dtype=np.float32))
+        order = np.argsort(-scores)
+        best, runner_up = int(order[0]), int(order[1])
+        label = self._labels[best]
+        if label == STANDARD or scores[best] - scores[runner_up] < self.classifier_margin:
+            return decision
+        if label == SMALL_TALK and _VEHICLE_TERM_RE.search(message):
+            return decision
+        return self._decide(label, "classifier")
+
+    async def warmup(self, embed_many: Callable[[List[str]], Awaitable[List[List[float]]]]) -> None:
+        """Embeds the exemplars ahead of the first request that needs the classifier."""
+        if self.use_classifier and self._centroids is None:
+            await self._ensure_centroids(embed_many)
+
+    def fallback(self, decision: RouteDecision) -> RouteDecision:
+        """The standard path, for a lexical decision whose codes the keyword index does not contain."""
+        return self._decide(STANDARD, f"{decision.reason}:no_match")
+
+    @staticmethod
+    def record(decision: RouteDecision) -> None:
+        route_decisions_total.inc(route=decision.route, reason=decision.reason)
+
+    def _decide(self, route: str, reason: str) -> RouteDecision:
+        if route == COMPLEX:
+            return RouteDecision(route, reason, self.complex_top_k, self.complex_token_budget)
+        if route == SMALL_TALK:
+            return RouteDecision(route, reason)
+        return RouteDecision(route, reason, self.standard_top_k, self.standard_token_budget)
+
+    async def _ensure_centroids(self, embed_many) -> None:
+        # Requests arriving before the first build finishes wait for it instead of starting their own
+        if self._building is None:
+            self._building = asyncio.ensure_future(self._build_centroids(embed_many))
+        try:
+            await asyncio.shield(self._building)
+        except Exception:
+            self._building = None
+            raise
+
+    async def _build_centroids(self, embed_many) -> None:
+        labels = list(EXEMPLARS)
+        centroids = []
+        for label in labels:
+            vectors = np.asarray(await embed_many(EXEMPLARS[label]), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            centroids.append(_normalize(vectors.mean(axis=0)))
+        self._labels = labels
+        self._centroids = np.stack(centroids)
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -1,57 +1,332 @@
-import openai
-from pinecone import Pinecone
-from typing import List, Tuple
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
 import hashlib
-import datetime
-from eth_account import Account
-from eth_account.messages import encode_defunct
+import json
+import logging
+import struct
+import time
 
 from src.config import settings
-from src.models import ContextSource
+from src.models import ContextSource, KnowledgeAttestation
+from src.services.answer_cache import SemanticAnswerCache
+from src.services.attestation import AttestationSigner, MerkleAttestationBatcher, hash_context
+from src.services.chunk_store import ChunkStore
+from src.services.clients import create_llm_client
+from src.services.coalesce import SingleFlight
+from src.services.context_assembly import assemble_context, count_tokens
+from src.services.conversation_store import Conversation, ConversationStore, create_conversation_backend
+from src.services.embedding_batcher import EmbeddingBatcher
+from src.services.embedding_store import EmbeddingStore
+from src.services.lexical_index import LexicalIndex, find_codes, reciprocal_rank_fusion
+from src.services.query_router import QueryRouter
+from src.services.resilience import CircuitBreaker, Upstream
+from src.services.vector_store import VectorStore, create_vector_store
+from src.telemetry import record_tokens, span
+
+logger = logging.getLogger(__name__)
 
 # --- Initialize Clients ---
-openai.api_key = settings.OPENAI_API_KEY
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-pinecone_index = pc.Index(settings.PINECONE_INDEX_NAME)
+# Built on first use rather than at import; resolving the Pinecone index is a network call
+@lru_cache(maxsize=None)
+def default_llm_client() -> Any:
+    return create_llm_client(
+        settings.LLM_BACKEND,
+        api_key=settings.OPENAI_API_KEY,
+        timeout_seconds=settings.OPENAI_TIMEOUT_SECONDS,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry_seconds=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+@lru_cache(maxsize=None)
+def default_vector_store() -> VectorStore:
+    return create_vector_store(
+        settings.VECTOR_STORE_BACKEND,
+        local_dir=settings.LOCAL_VECTOR_STORE_DIR,
+        pinecone_api_key=settings.PINECONE_API_KEY,
+        pinecone_index_name=settings.PINECONE_INDEX_NAME,
+        max_concurrency=settings.PINECONE_MAX_CONCURRENCY,
+        timeout_seconds=settings.PINECONE_TIMEOUT_SECONDS,
+        quantization=settings.VECTOR_QUANTIZATION,
+        rerank_factor=settings.VECTOR_RERANK_FACTOR,
+        partitioning=settings.PINECONE_PARTITIONING,
+        legacy_fallback=settings.PINECONE_LEGACY_FALLBACK,
+    )
+
+def _upstream(name: str, hedge_after_ms: float = 0.0) -> Upstream:
+    return Upstream(
+        name,
+        max_attempts=settings.UPSTREAM_MAX_ATTEMPTS,
+        backoff_base_seconds=settings.UPSTREAM_BACKOFF_BASE_MS / 1000,
+        backoff_max_seconds=settings.UPSTREAM_BACKOFF_MAX_MS / 1000,
+        hedge_after_seconds=hedge_after_ms / 1000,
+        breaker=CircuitBreaker(settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD, settings.CIRCUIT_BREAKER_RESET_SECONDS),
+    )
 
 class RagService:
     """
     Orchestrates the entire Retrieval-Augmented Generation (RAG) pipeline.
     """
 
+    def __init__(self, llm_client: Optional[Any] = None, vector_store: Optional[VectorStore] = None):
+        # Both default to the configured module clients, built on first use; alternatives can be injected for testing
+        self._llm_client = llm_client
+        self._vector_store = vector_store
+        self.answer_cache = SemanticAnswerCache(
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            generation_dir=settings.INDEX_GENERATION_DIR,
+        ) if settings.ANSWER_CACHE_ENABLED else None
+        self.embedding_store = EmbeddingStore(
+            model=settings.OPENAI_EMBEDDING_MODEL,
+            db_path=settings.EMBEDDING_CACHE_PATH,
+            max_memory_entries=settings.EMBEDDING_CACHE_MEMORY_ENTRIES,
+            dimensions=settings.OPENAI_EMBEDDING_DIMENSIONS,
+        )
+        self.chunk_store = ChunkStore(settings.CHUNK_STORE_PATH)
+        self.lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH) if settings.HYBRID_RETRIEVAL_ENABLED else None
+        self.router = QueryRouter(
+            standard_top_k=settings.RETRIEVAL_TOP_K,
+            complex_top_k=settings.COMPLEX_TOP_K,
+            standard_token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            complex_token_budget=settings.COMPLEX_CONTEXT_TOKEN_BUDGET,
+            classifier_margin=settings.ROUTER_CLASSIFIER_MARGIN,
+            use_classifier=settings.ROUTER_CLASSIFIER_ENABLED,
+        )
+        self.conversations = ConversationStore(
+            backend=create_conversation_backend(settings.CONVERSATION_BACKEND, settings.CONVERSATION_DB_PATH),
+            max_memory_threads=settings.CONVERSATION_MEMORY_THREADS,
+            ttl_seconds=settings.CONVERSATION_TTL_SECONDS,
+            recent_turns=settings.CONVERSATION_RECENT_TURNS,
+            summary_token_budget=settings.CONVERSATION_SUMMARY_TOKEN_BUDGET,
+        )
+        self.signer = AttestationSigner(settings.ATTESTATION_PRIVATE_KEY)
+        self.attestation_batcher = MerkleAttestationBatcher(
+            self.signer,
+            interval_seconds=settings.ATTESTATION_BATCH_INTERVAL_MS / 1000,
+            max_batch_size=settings.ATTESTATION_BATCH_MAX_SIZE,
+        ) if settings.ATTESTATION_MODE == "merkle_batch" else None
+        # Retry, rate-limit and circuit breaker policy per dependency; embedding and vector queries are hedged
+        self.llm_upstream = _upstream(settings.LLM_BACKEND, settings.UPSTREAM_HEDGE_AFTER_MS)
+        self.vector_upstream = _upstream(settings.VECTOR_STORE_BACKEND, settings.UPSTREAM_HEDGE_AFTER_MS)
+        # Concurrent identical upstream calls (e.g. a burst of the same recall question) share one call
+        self.embedding_flight = SingleFlight("embedding")
+        self.vector_query_flight = SingleFlight("vector_query")
+        self.generation_flight = SingleFlight("generation")
+        self.embedding_batcher = EmbeddingBatcher(
+            self._embed_upstream,
+            window_seconds=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        ) if settings.EMBEDDING_BATCH_WINDOW_MS > 0 else None
+
+    @property
+    def llm_client(self) -> Any:
+        if self._llm_client is None:
+            self._llm_client = default_llm_client()
+        return self._llm_client
+
+    @llm_client.setter
+    def llm_client(self, client: Any) -> None:
+        self._llm_client = client
+
+    @property
+    def vector_store(self) -> VectorStore:
+        if self._vector_store is None:
+            self._vector_store = default_vector_store()
+        return self._vector_store
+
+    @vector_store.setter
+    def vector_store(self, store: VectorStore) -> None:
+        self._vector_store = store
+
+    async def warmup(self) -> Dict[str, Any]:
+        """
+        Builds the clients, opens their connections and primes the router's exemplar
+        embeddings, so the first chat request pays none of it. A failing step is logged and
+        reported rather than raised; requests will retry that dependency on their own.
+        Returns the seconds each step took.
+        """
+        async def warm_vector_store() -> None:
+            # Resolving the Pinecone index host blocks; keep it off the event loop
+            store = await asyncio.to_thread(lambda: self.vector_store)
+            await store.warmup()
+
+        steps = {
+            "vector_store": warm_vector_store,
+            "llm": lambda: self.router.warmup(self.embed_many),
+        }
+        report: Dict[str, Any] = {}
+        for name, step in steps.items():
+            started = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                logger.warning("Warmup step %s failed: %s", name, e)
+                report[f"{name}_error"] = str(e)
+            report[f"{name}_seconds"] = round(time.perf_counter() - started, 3)
+        return report
+
+    async def close(self) -> None:
+        """Closes the LLM client's connection pool, if one was opened."""
+        if self._llm_client is not None:
+            await self._llm_client.close()
+
     async def get_embedding(self, text: str) -> List[float]:
         """Generates a vector embedding for a given text."""
-        response = await openai.embeddings.create(
-            input=[text],
-            model=settings.OPENAI_EMBEDDING_MODEL
-        )
-        return response.data[0].embedding
+        with span("embedding", chars=len(text)) as details:
+            # SQLite reads stay off the event loop, like the writes
+            cached = await asyncio.to_thread(self.embedding_store.get, text)
+            details["cached"] = cached is not None
+            if cached is not None:
+                return cached
+
+            embedding, details["coalesced"] = await self._coalesce(
+                self.embedding_flight, text, lambda: self._embed_one(text)
+            )
+            return embedding
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several texts in one upstream call, skipping any already in the embedding store."""
+        embeddings = await asyncio.to_thread(self.embedding_store.get_many, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fresh = await self._embed_upstream([texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+        return embeddings
+
+    async def _embed_one(self, text: str) -> List[float]:
+        if self.embedding_batcher is not None:
+            return await self.embedding_batcher.embed(text)
+        return (await self._embed_upstream([text]))[0]
+
+    async def _embed_upstream(self, texts: List[str]) -> List[List[float]]:
+        dimensions = {"dimensions": settings.OPENAI_EMBEDDING_DIMENSIONS} if settings.OPENAI_EMBEDDING_DIMENSIONS else {}
+        response = await self.llm_upstream.call(lambda: self.llm_client.embeddings.create(
+            input=texts,
+            model=settings.OPENAI_EMBEDDING_MODEL,
+            **dimensions
+        ), hedge=True)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_tokens("embedding", prompt_tokens=usage.prompt_tokens)
+        embeddings = [record.embedding for record in sorted(response.data, key=lambda record: record.index)]
+        # The SQLite commit stays off the event loop
+        await asyncio.to_thread(self.embedding_store.put_many, texts, embeddings)
+        return embeddings
 
     async def query_vector_db(self, embedding: List[float], user_id: str, vehicle_id: str, top_k: int = 5) -> List[ContextSource]:
-        """Queries the Pinecone vector database to find relevant context."""
-        response = pinecone_index.query(
-            vector=embedding,
-            top_k=top_k,
-            filter={
-                "user_id": {"$eq": user_id},
-                "vehicle_id": {"$eq": vehicle_id}
-            },
-            include_metadata=True
-        )
-        
+        """Queries the vector database to find relevant context."""
+        matches = await self._vector_matches(embedding, user_id, vehicle_id, top_k)
+        return await self._to_sources(user_id, vehicle_id, matches)
+
+    async def hybrid_query(self, query: str, embedding: List[float], user_id: str, vehicle_id: str, top_k: int = 5) -> List[ContextSource]:
+        """Fuses vector and BM25 keyword matches with reciprocal rank fusion."""
+        matches = await self._vector_matches(embedding, user_id, vehicle_id, top_k)
+        if self.lexical_index is not None:
+            lexical_matches = await self.lexical_search(query, user_id, vehicle_id, top_k)
+            matches = reciprocal_rank_fusion([matches, lexical_matches])[:top_k]
+        return await self._to_sources(user_id, vehicle_id, matches)
+
+    async def exact_code_context(self, query: str, user_id: str, vehicle_id: str, top_k: int = 5) -> Optional[List[ContextSource]]:
+        """
+        For queries about exact codes (DTCs, fluid grades, part numbers), returns the chunks
+        containing every code, skipping the embedding call and vector query. Returns None
+        when the query has no codes or the keyword index has no chunk containing them.
+        """
+        if self.lexical_index is None or not settings.EXACT_CODE_SHORTCUT:
+            return None
+        codes = find_codes(query)
+        if not codes:
+            return None
+        matches = await self.lexical_search(" ".join(codes), user_id, vehicle_id, top_k, require_all=True)
+        if not matches:
+            return None
+        return await self._to_sources(user_id, vehicle_id, matches)
+
+    async def reusable_context(self, conversation: Conversation, query: str) -> Optional[List[ContextSource]]:
+        """
+        Returns the context the thread's last answer was built from if a follow-up stays on
+        it: the query's keyword matches all fall inside that context, or the query has no
+        keyword matches at all ("what about the rear ones?"). Otherwise returns None.
+        """
+        if not conversation.sources or self.lexical_index is None:
+            return None
+        prior_ids = set()
+        for src in conversation.sources:
+            prior_ids.add(src.metadata.get("chunk_id"))
+            prior_ids.update(src.metadata.get("merged_chunk_ids") or [])
+        matches = await self.lexical_search(query, conversation.user_id, conversation.vehicle_id, top_k=3)
+        if all(match["id"] in prior_ids for match in matches):
+            return conversation.sources
+        return None
+
+    async def lexical_search(self, query: str, user_id: str, vehicle_id: str, top_k: int, require_all: bool = False) -> List[dict]:
+        with span("lexical_query", top_k=top_k) as details:
+            matches = await asyncio.to_thread(self.lexical_index.search, user_id, vehicle_id, query, top_k, require_all=require_all)
+            details["matches"] = len(matches)
+        return matches
+
+    async def _vector_matches(self, embedding: List[float], user_id: str, vehicle_id: str, top_k: int) -> List[dict]:
+        with span("vector_query", top_k=top_k) as details:
+            key = (user_id, vehicle_id, top_k, hashlib.sha256(struct.pack(f"{len(embedding)}f", *embedding)).digest())
+            matches, details["coalesced"] = await self._coalesce(
+                self.vector_query_flight, key, lambda: self.vector_upstream.call(
+                    lambda: self.vector_store.query(user_id, vehicle_id, embedding, top_k), hedge=True
+                )
+            )
+            details["matches"] = len(matches)
+        return matches
+
+    async def _to_sources(self, user_id: str, vehicle_id: str, matches: List[dict]) -> List[ContextSource]:
+        # Chunk text lives in the local chunk store; fetch it for every match in one lookup
+        stored_chunks = await asyncio.to_thread(self.chunk_store.get_many, user_id, vehicle_id, [match.get('id') for match in matches])
+
         sources: List[ContextSource] = []
-        for match in response.get('matches', []):
+        for match in matches:
             metadata = match.get('metadata', {})
+            chunk = stored_chunks.get(match.get('id'))
+            if chunk is not None:
+                content, page, page_end = chunk["text"], chunk["page_start"], chunk["page_end"]
+            else:
+                content, page, page_end = metadata.get("text", ""), metadata.get("page_number"), metadata.get("page_end")
             sources.append(ContextSource(
                 source_type="manual",
                 source_name=metadata.get("source_file", "Unknown Manual"),
-                content=metadata.get("text", ""),
-                metadata={"page": metadata.get("page_number"), "score": match.get("score")}
+                content=content,
+                metadata={
+                    "page": page,
+                    "page_end": page_end,
+                    "chunk_id": match.get('id'),
+                    "score": match.get("score"),
+                    "start_word": metadata.get("start_word"),
+                }
             ))
         return sources
 
-    async def generate_response(self, query: str, context: List[ContextSource]) -> str:
-        """Generates a final response from the LLM using the provided context."""
+    def assemble_context(self, query: str, sources: List[ContextSource], token_budget: Optional[int] = None) -> List[ContextSource]:
+        """Trims retrieved chunks to the context that goes into the prompt (see context_assembly)."""
+        with span("context_assembly", candidates=len(sources)) as details:
+            assembled = assemble_context(
+                query, sources, token_budget or settings.CONTEXT_TOKEN_BUDGET, use_rerank=settings.CONTEXT_RERANK
+            )
+            details.update(
+                kept=len(assembled),
+                tokens_in=sum(count_tokens(src.content) for src in sources),
+                tokens_out=sum(src.metadata.get("tokens", 0) for src in assembled),
+            )
+        return assembled
+
+    async def _coalesce(self, flight: SingleFlight, key, call) -> Tuple[Any, bool]:
+        if not settings.COALESCING_ENABLED:
+            return await call(), False
+        return await flight.do(key, call)
+
+    def _build_messages(self, query: str, context: List[ContextSource], conversation: Optional[Conversation] = None) -> List[dict]:
+        """Builds the system and user prompts for a query and its retrieved context, after any thread history."""
         
         system_prompt = """
         You are Gear AI, an expert automotive assistant. Your knowledge is absolute but confined to the context provided.
@@ -74,36 +349,109 @@ class RagService:
         {query}
         """
 
-        response = await openai.chat.completions.create(
-            model=settings.OPENAI_CHAT_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.2,
-        )
+        messages = [{"role": "system", "content": system_prompt}]
+        if conversation is not None:
+            if conversation.summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{conversation.summary}"})
+            messages += conversation.turns
+        messages.append({"role": "user", "content": user_prompt})
+        return messages
+
+    async def generate_response(
+        self,
+        query: str,
+        context: List[ContextSource],
+        conversation: Optional[Conversation] = None,
+        memo: Optional[Dict] = None,
+    ) -> str:
+        """
+        Generates a final response from the LLM using the provided context. `memo`, shared
+        across a batch, reuses the completion for a prompt that already ran in that batch.
+        """
+        messages = self._build_messages(query, context, conversation)
+        with span("generation", prompt_bytes=sum(len(message["content"]) for message in messages)) as details:
+            key = hashlib.sha256(json.dumps([settings.OPENAI_CHAT_MODEL, messages]).encode()).digest()
+            if memo is not None and key in memo:
+                details["memoized"] = True
+                return memo[key].choices[0].message.content or "I am unable to provide a response at this time."
+            response, details["coalesced"] = await self._coalesce(
+                self.generation_flight, key, lambda: self.llm_upstream.call(
+                    lambda: self.llm_client.chat.completions.create(
+                        model=settings.OPENAI_CHAT_MODEL,
+                        messages=messages,
+                        temperature=0.2,
+                    )
+                )
+            )
+            usage = getattr(response, "usage", None)
+            # Tokens are only spent once per coalesced group
+            if usage is not None and not details["coalesced"]:
+                record_tokens("generation", usage.prompt_tokens, usage.completion_tokens)
+                details.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            if memo is not None:
+                memo[key] = response
         return response.choices[0].message.content or "I am unable to provide a response at this time."
 
-    def create_attestation(self, query: str, response: str, context: List[ContextSource]) -> Tuple[str, str, str]:
+    async def stream_response(self, query: str, context: List[ContextSource], conversation: Optional[Conversation] = None) -> AsyncIterator[str]:
+        """Generates the same response as `generate_response`, yielding text deltas as the model produces them."""
+        messages = self._build_messages(query, context, conversation)
+        with span("generation_stream", prompt_bytes=sum(len(message["content"]) for message in messages)) as details:
+            started = time.perf_counter()
+            # Only opening the stream is retried; once tokens have been sent, a failure ends the stream
+            stream = await self.llm_upstream.call(lambda: self.llm_client.chat.completions.create(
+                model=settings.OPENAI_CHAT_MODEL,
+                messages=messages,
+                temperature=0.2,
+                stream=True,
+                stream_options={"include_usage": True},
+            ))
+            deltas = 0
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    record_tokens("generation", usage.prompt_tokens, usage.completion_tokens)
+                    details.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    deltas += 1
+                    if deltas == 1:
+                        details["first_token_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                    yield chunk.choices[0].delta.content
+            details["deltas"] = deltas
+
+    def create_attestation(self, query: str, response: str, context_hashes: List[str]) -> Tuple[str, str, str]:
         """
         Creates a cryptographic signature of the query, response, and context.
         This is the core of the Knowledge Attestation mechanism.
         """
-        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        
-        context_hashes = sorted([hashlib.sha256(src.content.encode()).hexdigest() for src in context])
-        
-        message_to_sign = f"""
-        Gear AI Knowledge Attestation
-        Timestamp: {timestamp}
-        Query: {query}
-        Response: {response}
-        Context Hashes: {','.join(context_hashes)}
-        """
-        
-        message_hash = encode_defunct(text=message_to_sign)
-        signed_message = Account.from_key(settings.ATTESTATION_PRIVATE_KEY).sign_message(message_hash)
-        
-        return timestamp, signed_message.signature.hex(), message_to_sign
+        return self.signer.sign(query, response, context_hashes)
+
+    async def attest(self, query: str, response: str, context: List[ContextSource]) -> KnowledgeAttestation:
+        """Produces the attestation for a response, either signed alone or as part of a Merkle batch."""
+        with span("attestation", mode=settings.ATTESTATION_MODE):
+            context_hashes = hash_context(context)
+            if self.attestation_batcher is not None:
+                return await self.attestation_batcher.attest(query, response, context_hashes)
+
+            timestamp, signature, _ = await asyncio.to_thread(self.create_attestation, query, response, context_hashes)
+        return KnowledgeAttestation(
+            query=query,
+            response=response,
+            context_hashes=context_hashes,
+            timestamp=timestamp,
+            signature=signature,
+        )
+
+@lru_cache(maxsize=None)
+def get_rag_service() -> RagService:
+    return RagService()
+
+class _LazyRagService:
+    """Stands in for the module's RagService, which is constructed on first use."""
+
+    def __getattr__(self, name: str):
+        return getattr(get_rag_service(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_rag_service(), name, value)
 
-rag_service = RagService()
\ No newline at end of file
+rag_service = _LazyRagService()
\ No newline at end of file
@@ -0,0 +1,209 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+upstream_events_total = metrics.counter(
+    "gear_ai_upstream_events_total",
+    "Upstream call events (retry, throttled, hedge, hedge_won, breaker_open, rejected, failure), by dependency",
+)
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream dependency failed after retries, or its circuit breaker is open."""
+
+    def __init__(self, dependency: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{dependency} unavailable: {message}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    # openai errors carry `status_code`, Pinecone's ApiException carries `status`
+    code = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    return code if isinstance(code, int) else None
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, dropped connections, rate limits and 5xx responses are worth retrying."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    code = status_code(exc)
+    if code is not None:
+        return code in _RETRYABLE_STATUS
+    # Client libraries wrap transport failures in their own types (APITimeoutError, APIConnectionError, ...)
+    return any("Timeout" in cls.__name__ or "Connection" in cls.__name__ for cls in type(exc).__mro__)
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Reads a server's Retry-After hint (seconds, or OpenAI's retry-after-ms) from an error response."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(exc, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_seconds`; then lets a single probe through (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Lets another call probe when this one ended without a verdict, e.g. it was cancelled."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class Upstream:
+    """
+    Shared call policy for one dependency (OpenAI, Pinecone):
+
+    - Retries retryable errors with exponential backoff and full jitter.
+    - On a rate limit, honours the server's Retry-After for every caller, not just the one that hit it.
+    - Optionally hedges idempotent calls: if the first attempt has not answered after
+      `hedge_after_seconds`, a second one is started and whichever finishes first wins.
+    - Counts failures in a circuit breaker so a dead dependency fails fast instead of
+      tying up every request for the full retry budget.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        backoff_base_seconds: float = 0.1,
+        backoff_max_seconds: float = 2.0,
+        hedge_after_seconds: float = 0.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self._throttled_until = 0.0
+
+    async def call(self, make_call: Callable[[], Awaitable[Any]], hedge: bool = False) -> Any:
+        """Runs `make_call()` under the policy. `make_call` must start a fresh request each time it is called."""
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                upstream_events_total.inc(dependency=self.name, event="rejected")
+                raise UpstreamUnavailable(self.name, "circuit breaker open", retry_after=self.breaker.retry_after())
+
+            try:
+                throttle = self._throttled_until - time.monotonic()
+                if throttle > 0:
+                    upstream_events_total.inc(dependency=self.name, event="throttled")
+                    await asyncio.sleep(throttle)
+
+                if hedge and self.hedge_after_seconds > 0:
+                    result = await self._hedged(make_call)
+                else:
+                    result = await make_call()
+            except asyncio.CancelledError:
+                # A client disconnect or a losing hedge says nothing about the dependency's health
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The request itself was bad; the dependency is healthy
+                    self.breaker.record_success()
+                    raise
+                was_open = self.breaker.state != "closed"
+                self.breaker.record_failure()
+                if not was_open and self.breaker.state != "closed":
+                    upstream_events_total.inc(dependency=self.name, event="breaker_open")
+                    logger.warning("Circuit breaker for %s opened after %d failures", self.name, self.breaker.failures)
+
+                if attempt == self.max_attempts:
+                    upstream_events_total.inc(dependency=self.name, event="failure")
+                    raise UpstreamUnavailable(self.name, f"{type(e).__name__}: {e}", retry_after_seconds(e)) from e
+
+                delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (attempt - 1)))
+                server_delay = retry_after_seconds(e)
+                if server_delay is not None:
+                    delay = max(delay, server_delay)
+                    self._throttled_until = max(self._throttled_until, time.monotonic() + server_delay)
+                upstream_events_total.inc(dependency=self.name, event="retry")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def _hedged(self, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        first = asyncio.ensure_future(make_call())
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after_seconds)
+        if done:
+            return first.result()
+
+        upstream_events_total.inc(dependency=self.name, event="hedge")
+        second = asyncio.ensure_future(make_call())
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            upstream_events_total.inc(dependency=self.name, event="hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, float]:
+        return {"breaker_open": 0 if self.breaker.state == "closed" else 1, "consecutive_failures": self.breaker.failures}
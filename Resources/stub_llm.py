@@ -0,0 +1,95 @@
+import re
+import zlib
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w[\w\-]*")
+
+
+def hashing_embedding(text: str, dimensions: int) -> List[float]:
+    """
+    Deterministic bag-of-words embedding (the hashing trick): texts sharing words
+    land close together, which is enough to exercise retrieval end to end offline.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in _TOKEN_RE.findall(text.lower()):
+        h = zlib.crc32(token.encode())
+        vector[h % dimensions] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class _StubEmbeddings:
+    def __init__(self, client: "StubLLMClient"):
+        self._client = client
+
+    async def create(self, input: List[str], model: str, **kwargs) -> SimpleNamespace:
+        await asyncio.sleep(self._client.latency_seconds)
+        dimensions = kwargs.get("dimensions") or self._client.dimensions
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=hashing_embedding(text, dimensions))
+            for i, text in enumerate(input)
+        ])
+
+
+class _StubStream:
+    def __init__(self, tokens: List[str], tokens_per_second: float):
+        self._tokens = tokens
+        self._delay = 1 / tokens_per_second if tokens_per_second else 0.0
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for token in self._tokens:
+            await asyncio.sleep(self._delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=token))])
+
+
+class _StubCompletions:
+    def __init__(self, client: "StubLLMClient"):
+        self._client = client
+
+    async def create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        await asyncio.sleep(self._client.latency_seconds)
+        answer = self._client.answer(messages)
+        tokens = [token + " " for token in answer.split()]
+        if stream:
+            return _StubStream(tokens, self._client.tokens_per_second)
+        if self._client.tokens_per_second:
+            await asyncio.sleep(len(tokens) / self._client.tokens_per_second)
+        prompt_tokens = sum(len(message["content"].split()) for message in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(index=0, message=SimpleNamespace(content=answer))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens)),
+        )
+
+
+class StubLLMClient:
+    """
+    Offline stand-in for the parts of the AsyncOpenAI client the service uses:
+    `embeddings.create` and `chat.completions.create` (including streaming).
+    Answers quote the start of the first context block, so responses stay grounded
+    in whatever retrieval returned.
+    """
+
+    def __init__(self, dimensions: int = 256, latency_seconds: float = 0.0, tokens_per_second: float = 0.0):
+        self.dimensions = dimensions
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.embeddings = _StubEmbeddings(self)
+        self.chat = SimpleNamespace(completions=_StubCompletions(self))
+
+    def answer(self, messages: List[dict]) -> str:
+        prompt = messages[-1]["content"]
+        match = re.search(r"Content: (.+)", prompt)
+        if not match:
+            return "The information is not available in my current knowledge base."
+        excerpt = " ".join(match.group(1).split()[:40])
+        return f"According to the manual: {excerpt}"
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,197 @@
+import time
+import uuid
+import random
+import bisect
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Latency buckets in seconds, from 0.5ms (cache hits) to 30s (slow completions)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Observing is a bisect and two additions, cheap enough
+    to record every request; p50/p95/p99 are estimated from the buckets on demand.
+    """
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """Estimates a quantile by linear interpolation inside the bucket that contains it."""
+        series = self._series.get(_label_key(labels))
+        if series is None:
+            return None
+        return self._quantile(series[0], q)
+
+    def _quantile(self, counts: List[int], q: float) -> Optional[float]:
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': str(bound)})} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        # Pre-computed percentiles for dashboards that don't run histogram_quantile()
+        quantile_name = f"{self.name}_quantile"
+        lines += [f"# HELP {quantile_name} Estimated {self.description.lower()} percentiles", f"# TYPE {quantile_name} gauge"]
+        for key, (counts, _) in self._series.items():
+            for q in (0.5, 0.95, 0.99):
+                value = self._quantile(counts, q)
+                if value is not None:
+                    lines.append(f"{quantile_name}{_format_labels(key, {'quantile': str(q)})} {value:.6f}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List = []
+
+    def counter(self, name: str, description: str) -> Counter:
+        metric = Counter(name, description)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect) -> None:
+        """Adds a callable returning {metric_name: value} gauges, read at scrape time."""
+        self._collectors.append(collect)
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collect in self._collectors:
+            for name, value in collect().items():
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+stage_latency = metrics.histogram("gear_ai_stage_latency_seconds", "Latency of each RAG pipeline stage in seconds")
+request_latency = metrics.histogram("gear_ai_http_request_duration_seconds", "HTTP request latency in seconds")
+tokens_total = metrics.counter("gear_ai_llm_tokens_total", "LLM tokens consumed, by stage and kind")
+bytes_total = metrics.counter("gear_ai_http_bytes_total", "HTTP payload bytes, by direction")
+
+
+# --- Request Tracing ---
+
+class Trace:
+    """Per-request trace. Detailed spans are only kept when the request was sampled."""
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Dict] = []
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("gear_ai_trace", default=None)
+
+def start_trace(trace_id: Optional[str] = None, sample_rate: float = 0.0) -> Trace:
+    trace = Trace(trace_id or uuid.uuid4().hex, random.random() < sample_rate)
+    _current_trace.set(trace)
+    return trace
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Dict]:
+    """
+    Times a pipeline stage into the stage latency histogram. Yields a dict that the stage
+    can add attributes to (token counts, result sizes); these are kept on sampled traces.
+    """
+    details: Dict = dict(attributes)
+    started = time.perf_counter()
+    try:
+        yield details
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_latency.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None and trace.sampled:
+            trace.spans.append({"stage": stage, "ms": round(elapsed * 1000, 3), **details})
+
+def record_tokens(stage: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    if prompt_tokens:
+        tokens_total.inc(prompt_tokens, stage=stage, kind="prompt")
+    if completion_tokens:
+        tokens_total.inc(completion_tokens, stage=stage, kind="completion")
+
+def finish_trace(trace: Trace, method: str, path: str, status_code: int, elapsed: float) -> None:
+    if trace.sampled:
+        logger.info(
+            "trace %s %s %s -> %s in %.1fms spans=%s",
+            trace.trace_id, method, path, status_code, elapsed * 1000, trace.spans,
+        )
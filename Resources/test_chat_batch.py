@@ -0,0 +1,54 @@
+import json
+import asyncio
+
+import httpx
+
+from src import main
+from src.services.resilience import UpstreamUnavailable
+
+
+def test_batch_streams_each_result_on_its_own_line_in_completion_order(monkeypatch):
+    answer_chat = main._answer_chat
+
+    async def flaky_answer_chat(request, batch_memo=None):
+        if request.vehicle_id == "slow":
+            await asyncio.sleep(0.2)
+        elif request.vehicle_id == "down":
+            raise UpstreamUnavailable("openai", "circuit breaker open")
+        elif request.vehicle_id == "broken":
+            raise RuntimeError("boom")
+        return await answer_chat(request, batch_memo)
+
+    monkeypatch.setattr(main, "_answer_chat", flaky_answer_chat)
+    requests = [
+        {"user_id": "fleet", "vehicle_id": vehicle_id, "message": "What engine oil does my car take?"}
+        for vehicle_id in ("slow", "down", "ok", "broken")
+    ]
+
+    async def post_batch():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/chat/batch", json={"requests": requests})
+
+    response = asyncio.run(post_batch())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+    # The slow success arrives last; a failure does not hold up or fail the others
+    assert lines[-1]["index"] == 0
+    by_index = {line["index"]: line for line in lines}
+    for index in (0, 2):
+        assert by_index[index]["success"] is True
+        assert by_index[index]["status_code"] == 200
+        assert by_index[index]["detail"] is None
+        assert by_index[index]["response"]["attestation"]["signature"]
+    assert by_index[1]["success"] is False
+    assert by_index[1]["status_code"] == 503
+    assert by_index[1]["response"] is None
+    assert "circuit breaker open" in by_index[1]["detail"]
+    assert by_index[3]["success"] is False
+    assert by_index[3]["status_code"] == 500
+    assert by_index[3]["response"] is None
+    assert "boom" in by_index[3]["detail"]
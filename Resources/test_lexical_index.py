@@ -0,0 +1,20 @@
+from src.services.lexical_index import find_codes
+
+
+def test_find_codes_matches_exact_codes():
+    assert find_codes("What does P0420 mean?") == ["P0420"]
+    assert find_codes("Can I use 0W-20 or 5W30?") == ["0W-20", "5W30"]
+    assert find_codes("Is 90915-YZZD1 the right filter?") == ["90915-YZZD1"]
+    assert find_codes("Where do I order 90919-01253 and 15400-PLM-A02?") == ["90919-01253", "15400-PLM-A02"]
+    assert find_codes("Does MZ690072 fit?") == ["MZ690072"]
+
+def test_find_codes_ignores_model_names_and_years():
+    for text in (
+        "how do I reset the TPMS on my RAV4",
+        "What oil does my F-150 take?",
+        "Is the CX-5 all wheel drive?",
+        "Tire pressure for a 328i",
+        "Does the Model3 need coolant?",
+        "Recalls for 2019-2021 models with a 12V battery",
+    ):
+        assert find_codes(text) == [], text
@@ -0,0 +1,141 @@
+import asyncio
+import random
+
+import fitz  # PyMuPDF
+
+import migrate_namespaces
+import process_pdf
+from src.services.vector_store import LEGACY_NAMESPACE, PineconeVectorStore, partition_key
+
+USER, VEHICLE = "user-1", "vehicle-1"
+OTHER_USER, OTHER_VEHICLE = "user-2", "vehicle-2"
+
+
+class FakeIndex:
+    """In-memory stand-in for the async Pinecone index: namespaces of id -> vector."""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.namespaces = {}
+
+    def ids(self, namespace: str):
+        return set(self.namespaces.get(namespace, {}))
+
+    async def describe_index_stats(self):
+        return {
+            "dimension": self.dimension,
+            "total_vector_count": sum(len(vectors) for vectors in self.namespaces.values()),
+            "namespaces": {name: {"vector_count": len(vectors)} for name, vectors in self.namespaces.items() if vectors},
+        }
+
+    async def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        def matches(metadata):
+            return all(
+                key in metadata if "$exists" in condition else metadata.get(key) == condition["$eq"]
+                for key, condition in (filter or {}).items()
+            )
+        found = [stored for stored in self.namespaces.get(namespace, {}).values() if matches(stored["metadata"])]
+        return {"matches": [{**stored, "score": 0.0} for stored in found[:top_k]]}
+
+    async def upsert(self, vectors, namespace):
+        for vector in vectors:
+            self.namespaces.setdefault(namespace, {})[vector["id"]] = dict(vector)
+
+    async def delete(self, ids=None, namespace="", delete_all=False):
+        stored = self.namespaces.get(namespace, {})
+        for vector_id in (list(stored) if delete_all else ids):
+            stored.pop(vector_id, None)
+
+    async def fetch(self, ids, namespace):
+        stored = self.namespaces.get(namespace, {})
+        return {"vectors": {vector_id: stored[vector_id] for vector_id in ids if vector_id in stored}}
+
+
+def _manual(path: str) -> None:
+    rng = random.Random(3)
+    doc = fitz.open()
+    for _ in range(4):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), " ".join(f"word{rng.randrange(3000)}" for _ in range(450)), fontsize=7)
+    doc.save(path)
+    doc.close()
+
+def _legacy_vector(vector_id: str, user_id: str, vehicle_id: str, source_file: str, dimension: int) -> dict:
+    return {
+        "id": vector_id,
+        "values": [1.0] + [0.0] * (dimension - 1),
+        "metadata": {"user_id": user_id, "vehicle_id": vehicle_id, "source_file": source_file},
+    }
+
+
+def test_reingested_manual_leaves_no_legacy_vectors_for_migration(tmp_path, monkeypatch):
+    async def scenario():
+        manual = str(tmp_path / "manual.pdf")
+        _manual(manual)
+        dimension = len((await process_pdf.embed_texts(process_pdf.create_llm_client("stub"), ["probe"]))[0])
+        index = FakeIndex(dimension)
+        store = PineconeVectorStore(index, "namespace", legacy_fallback=True)
+        monkeypatch.setattr(process_pdf, "get_vector_store", lambda: store)
+        monkeypatch.setattr(migrate_namespaces, "get_vector_store", lambda: store)
+
+        # Before namespaces: the old chunker's vectors for this manual, and another tenant's manual
+        words = sum(len(text.split()) for _, text in process_pdf.iter_pages(manual))
+        legacy_ids = process_pdf._legacy_chunk_ids("manual.pdf", words)
+        await index.upsert([_legacy_vector(vector_id, USER, VEHICLE, "manual.pdf", dimension) for vector_id in legacy_ids], LEGACY_NAMESPACE)
+        await index.upsert([_legacy_vector("other.pdf-0", OTHER_USER, OTHER_VEHICLE, "other.pdf", dimension)], LEGACY_NAMESPACE)
+
+        stats = await process_pdf.ingest_pdf(manual, USER, VEHICLE)
+        namespace = partition_key(USER, VEHICLE)
+        assert stats.deleted == len(legacy_ids)
+        assert index.ids(LEGACY_NAMESPACE) == {"other.pdf-0"}
+        assert len(index.ids(namespace)) == stats.upserted == stats.chunks
+        assert all(vector_id.startswith("manual.pdf#") for vector_id in index.ids(namespace))
+
+        # Re-ingesting finds nothing to delete and leaves cached answers alone
+        stats = await process_pdf.ingest_pdf(manual, USER, VEHICLE)
+        assert (stats.upserted, stats.deleted) == (0, 0)
+
+        # A legacy copy the manifest has superseded is dropped rather than moved
+        await index.upsert([_legacy_vector(legacy_ids[0], USER, VEHICLE, "manual.pdf", dimension)], LEGACY_NAMESPACE)
+        chunk_ids = index.ids(namespace)
+        result = await migrate_namespaces.migrate()
+        assert result["dropped_vectors"] == 1
+        assert result["moved_vectors"] == 1
+        assert result["tenant_vectors_left"] == 0
+        assert index.ids(namespace) == chunk_ids
+        assert index.ids(partition_key(OTHER_USER, OTHER_VEHICLE)) == {"other.pdf-0"}
+        assert index.ids(LEGACY_NAMESPACE) == set()
+
+    asyncio.run(scenario())
+
+def test_legacy_ids_of_another_tenant_are_not_deleted():
+    async def scenario():
+        index = FakeIndex(4)
+        store = PineconeVectorStore(index, "namespace", legacy_fallback=True)
+        await index.upsert([_legacy_vector("manual.pdf-0", OTHER_USER, OTHER_VEHICLE, "manual.pdf", 4)], LEGACY_NAMESPACE)
+        assert await store.delete_legacy(USER, VEHICLE, ["manual.pdf-0", "manual.pdf-350"]) == 0
+        assert index.ids(LEGACY_NAMESPACE) == {"manual.pdf-0"}
+
+    asyncio.run(scenario())
+
+def test_tenants_sharing_a_manual_keep_their_own_vectors_in_the_metadata_layout(tmp_path, monkeypatch):
+    async def scenario():
+        manual = str(tmp_path / "manual.pdf")
+        _manual(manual)
+        dimension = len((await process_pdf.embed_texts(process_pdf.create_llm_client("stub"), ["probe"]))[0])
+        index = FakeIndex(dimension)
+        store = PineconeVectorStore(index, "metadata")
+        monkeypatch.setattr(process_pdf, "get_vector_store", lambda: store)
+
+        mine = await process_pdf.ingest_pdf(manual, USER, VEHICLE)
+        theirs = await process_pdf.ingest_pdf(manual, OTHER_USER, OTHER_VEHICLE)
+        assert mine.upserted == theirs.upserted == mine.chunks
+        assert len(index.ids(LEGACY_NAMESPACE)) == mine.chunks + theirs.chunks
+        their_ids = {vector_id for vector_id in index.ids(LEGACY_NAMESPACE) if vector_id.startswith(partition_key(OTHER_USER, OTHER_VEHICLE))}
+        assert len(their_ids) == theirs.chunks
+
+        # Deleting by the other tenant's ids, or the same ids unprefixed, leaves their vectors alone
+        await store.delete(USER, VEHICLE, sorted(their_ids) + [vector_id.split(":", 1)[1] for vector_id in their_ids])
+        assert their_ids <= index.ids(LEGACY_NAMESPACE)
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+
+from src.services.query_router import LEXICAL, SMALL_TALK, STANDARD, QueryRouter, RouteDecision
+
+
+def _router() -> QueryRouter:
+    return QueryRouter(standard_top_k=5, complex_top_k=10, standard_token_budget=1500, complex_token_budget=3000)
+
+
+def test_route_answers_whole_message_small_talk():
+    router = _router()
+    for text, reason in (
+        ("thanks!", "rule:thanks"),
+        ("hi there 👋", "rule:greeting"),
+        ("ok, got it", "rule:acknowledgement"),
+        ("Thank you so much :)", "rule:thanks"),
+        ("bye for now", "rule:farewell"),
+    ):
+        decision = router.route(text)
+        assert (decision.route, decision.reason) == (SMALL_TALK, reason), text
+
+def test_route_never_short_circuits_questions_that_open_with_small_talk():
+    router = _router()
+    for text in (
+        "later model battery size?",
+        "hello, check engine light flashing",
+        "great, P0420 again",
+        "thanks, oil capacity?",
+        "ok 5W-30 or 0W-20",
+        "hey wipers squeak",
+    ):
+        assert router.route(text).route != SMALL_TALK, text
+    assert router.route("great, P0420 again").route == LEXICAL
+
+def test_refine_keeps_vehicle_questions_out_of_small_talk():
+    router = _router()
+    # A classifier whose only confident answer is small talk
+    router._labels = [SMALL_TALK, STANDARD]
+    router._centroids = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+
+    async def embed_many(texts):
+        raise AssertionError("centroids are already built")
+
+    async def refine(message):
+        return await router.refine(RouteDecision(STANDARD, "default"), [1.0, 0.0], embed_many, message)
+
+    assert asyncio.run(refine("brakes grinding")).route == STANDARD
+    assert asyncio.run(refine("you rock")).route == SMALL_TALK
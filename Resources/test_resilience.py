@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from src.services.resilience import CircuitBreaker, Upstream, UpstreamUnavailable
+
+
+def _open_upstream() -> Upstream:
+    # One attempt and a breaker that opens on the first failure and half-opens almost at once
+    return Upstream("test", max_attempts=1, breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0.01))
+
+async def _fail():
+    raise ConnectionError("down")
+
+async def _ok():
+    return "ok"
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    async def scenario():
+        upstream = _open_upstream()
+        with pytest.raises(UpstreamUnavailable):
+            await upstream.call(_fail)
+        await asyncio.sleep(0.02)
+        assert upstream.breaker.state == "half_open"
+
+        probe = asyncio.ensure_future(upstream.call(lambda: asyncio.sleep(60)))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The next call is let through as the probe, and closes the breaker
+        assert await upstream.call(_ok) == "ok"
+        assert upstream.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_half_open_breaker_admits_one_probe_at_a_time():
+    async def scenario():
+        upstream = _open_upstream()
+        with pytest.raises(UpstreamUnavailable):
+            await upstream.call(_fail)
+        await asyncio.sleep(0.02)
+
+        probe = asyncio.ensure_future(upstream.call(lambda: asyncio.sleep(0.05, result="ok")))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamUnavailable, match="circuit breaker open"):
+            await upstream.call(_ok)
+        assert await probe == "ok"
+        assert upstream.breaker.state == "closed"
+
+    asyncio.run(scenario())
@@ -0,0 +1,490 @@
+import os
+import json
+import shutil
+import hashlib
+import asyncio
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.services.clients import AsyncPineconeIndex
+
+
+class VectorStore:
+    """
+    Storage interface for chunk vectors, partitioned by (user_id, vehicle_id).
+    Matches are returned as {"id", "score", "metadata"} dicts, best first.
+    `layout` names how partitions are stored, so ingestion can tell when it changed.
+    """
+
+    layout = "namespace"
+
+    async def upsert(self, user_id: str, vehicle_id: str, vectors: Sequence[Dict]) -> None:
+        raise NotImplementedError
+
+    async def query(self, user_id: str, vehicle_id: str, vector: List[float], top_k: int) -> List[Dict]:
+        raise NotImplementedError
+
+    async def delete(self, user_id: str, vehicle_id: str, ids: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    async def delete_partition(self, user_id: str, vehicle_id: str) -> None:
+        """Deletes every vector of a (user_id, vehicle_id) partition."""
+        raise NotImplementedError
+
+    async def delete_legacy(self, user_id: str, vehicle_id: str, ids: Sequence[str]) -> int:
+        """
+        Deletes those of `ids` in the shared pre-namespace space that belong to this tenant
+        and returns how many there were. Stores without a shared space have none.
+        """
+        return 0
+
+    async def warmup(self) -> None:
+        """Opens connections ahead of the first query. Nothing to do for in-process stores."""
+
+
+def partition_key(user_id: str, vehicle_id: str) -> str:
+    """Opaque, stable name of a tenant's partition: its Pinecone namespace or local directory."""
+    return hashlib.sha256(f"{user_id}:{vehicle_id}".encode()).hexdigest()[:32]
+
+def tenant_filter(user_id: str, vehicle_id: str) -> Dict:
+    return {"user_id": {"$eq": user_id}, "vehicle_id": {"$eq": vehicle_id}}
+
+def _fetched_metadata(response) -> Dict[str, Dict]:
+    """Vector id -> metadata from a fetch response (the SDK's response object or a plain dict)."""
+    vectors = response.get("vectors") if isinstance(response, dict) else getattr(response, "vectors", None)
+    return {
+        vector_id: (vector.get("metadata") if isinstance(vector, dict) else getattr(vector, "metadata", None)) or {}
+        for vector_id, vector in (vectors or {}).items()
+    }
+
+# Where every tenant's vectors lived before namespaces, told apart by metadata filters
+LEGACY_NAMESPACE = ""
+PARTITIONINGS = ("namespace", "metadata")
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Hosted Pinecone index. With "namespace" partitioning each (user_id, vehicle_id) gets its
+    own namespace, so a query only searches that tenant's vectors and deleting a vehicle is a
+    single call. "metadata" is the older layout: one shared namespace, filtered per query.
+
+    `legacy_fallback` serves tenants not yet moved by migrate_namespaces.py: a query whose
+    namespace has no matches is retried against the shared namespace with a metadata filter.
+    """
+
+    def __init__(self, index: AsyncPineconeIndex, partitioning: str = "namespace", legacy_fallback: bool = False):
+        if partitioning not in PARTITIONINGS:
+            raise ValueError(f"Unknown Pinecone partitioning: {partitioning!r}")
+        self.index = index
+        self.partitioning = self.layout = partitioning
+        self.legacy_fallback = legacy_fallback
+
+    def _namespace(self, user_id: str, vehicle_id: str) -> str:
+        return partition_key(user_id, vehicle_id) if self.partitioning == "namespace" else LEGACY_NAMESPACE
+
+    async def upsert(self, user_id: str, vehicle_id: str, vectors: Sequence[Dict]) -> None:
+        # Tenant ids stay in the metadata so vectors remain attributable (and filterable) in any layout
+        await self.index.upsert(vectors=[
+            {**vector, "metadata": {"user_id": user_id, "vehicle_id": vehicle_id, **vector.get("metadata", {})}}
+            for vector in vectors
+        ], namespace=self._namespace(user_id, vehicle_id))
+
+    async def query(self, user_id: str, vehicle_id: str, vector: List[float], top_k: int) -> List[Dict]:
+        if self.partitioning == "metadata":
+            return await self._query(LEGACY_NAMESPACE, vector, top_k, tenant_filter(user_id, vehicle_id))
+        matches = await self._query(self._namespace(user_id, vehicle_id), vector, top_k)
+        if not matches and self.legacy_fallback:
+            matches = await self._query(LEGACY_NAMESPACE, vector, top_k, tenant_filter(user_id, vehicle_id))
+        return matches
+
+    async def _query(self, namespace: str, vector: List[float], top_k: int, filter: Optional[Dict] = None) -> List[Dict]:
+        response = await self.index.query(
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            filter=filter,
+            include_metadata=True
+        )
+        return [
+            {"id": match.get("id"), "score": match.get("score"), "metadata": match.get("metadata") or {}}
+            for match in response.get("matches", [])
+        ]
+
+    async def delete(self, user_id: str, vehicle_id: str, ids: Sequence[str]) -> None:
+        if self.partitioning == "metadata":
+            # Only this tenant's vectors, whoever else wrote the same ids
+            await self.delete_legacy(user_id, vehicle_id, ids)
+            return
+        await self.index.delete(ids=list(ids), namespace=self._namespace(user_id, vehicle_id))
+
+    async def delete_legacy(self, user_id: str, vehicle_id: str, ids: Sequence[str]) -> int:
+        # Ids in the shared namespace are not tenant-scoped; another vehicle's manual may use the same ones
+        owned = []
+        ids = list(ids)
+        for i in range(0, len(ids), 100):
+            response = await self.index.fetch(ids=ids[i:i + 100], namespace=LEGACY_NAMESPACE)
+            owned += [
+                vector_id for vector_id, metadata in _fetched_metadata(response).items()
+                if metadata.get("user_id") == user_id and metadata.get("vehicle_id") == vehicle_id
+            ]
+        for i in range(0, len(owned), 1000):
+            await self.index.delete(ids=owned[i:i + 1000], namespace=LEGACY_NAMESPACE)
+        return len(owned)
+
+    async def delete_partition(self, user_id: str, vehicle_id: str) -> None:
+        if self.partitioning == "namespace":
+            await self.index.delete(delete_all=True, namespace=self._namespace(user_id, vehicle_id))
+        if self.partitioning == "metadata" or self.legacy_fallback:
+            # The shared namespace can only be emptied of one tenant by id, a page at a time
+            probe, deleted = await self.probe_vector(), set()
+            while True:
+                page = await self.legacy_page(probe, filter=tenant_filter(user_id, vehicle_id), include_values=False)
+                if not page:
+                    break
+                ids = [vector["id"] for vector in page]
+                if deleted.issuperset(ids):
+                    # Deletes become visible to queries after a short delay
+                    await asyncio.sleep(1.0)
+                deleted.update(ids)
+                await self.index.delete(ids=ids, namespace=LEGACY_NAMESPACE)
+
+    async def legacy_page(
+        self, probe: List[float], page_size: int = 1000, filter: Optional[Dict] = None, include_values: bool = True
+    ) -> List[Dict]:
+        """Up to `page_size` vectors (id, values, metadata) from the shared namespace, for moving or deleting."""
+        response = await self.index.query(
+            vector=probe,
+            top_k=page_size,
+            namespace=LEGACY_NAMESPACE,
+            filter=filter,
+            include_values=include_values,
+            include_metadata=True
+        )
+        return [
+            {"id": match.get("id"), "values": match.get("values"), "metadata": match.get("metadata") or {}}
+            for match in response.get("matches", [])
+        ]
+
+    async def probe_vector(self) -> List[float]:
+        """Any valid query vector for the index; paging through a namespace needs one."""
+        dimension = (await self.index.describe_index_stats()).get("dimension")
+        return [1.0] + [0.0] * (dimension - 1)
+
+    async def warmup(self) -> None:
+        await self.index.describe_index_stats()
+
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+
+class _Snapshot:
+    """One version of a partition, never modified once built; queries read whichever is current."""
+    __slots__ = ("ids", "metadata", "matrix", "codes", "scales", "center")
+
+    def __init__(
+        self,
+        ids: List[str],
+        metadata: List[Dict],
+        matrix: np.ndarray,
+        codes: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None,
+        center: Optional[np.ndarray] = None,
+    ):
+        self.ids = ids
+        self.metadata = metadata
+        self.matrix = matrix
+        self.codes = codes
+        self.scales = scales
+        self.center = center
+
+
+class _LocalPartition:
+    """
+    One tenant's vectors: a float32 matrix of unit rows plus parallel id and metadata lists.
+    With quantization, compact codes of the rows are kept in memory for a coarse search and
+    the float32 matrix stays memory-mapped, read only for the shortlist it reranks.
+
+    Writes build a new `_Snapshot` and swap it in with one assignment, so a query on the
+    event loop never sees a write (on a worker thread) half applied.
+    """
+
+    def __init__(self, directory: str, quantization: str = "none", rerank_factor: int = 25):
+        self.directory = directory
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.current = _Snapshot([], [], np.zeros((0, 0), dtype=np.float32))
+        self.loaded_mtime_ns = -1
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    def refresh(self) -> None:
+        """Reloads from disk if another process (e.g. the ingestion script) rewrote the partition."""
+        try:
+            mtime_ns = os.stat(self._index_path).st_mtime_ns
+        except FileNotFoundError:
+            if self.loaded_mtime_ns != -1:
+                # Deleted by another process
+                self.current = _Snapshot([], [], np.zeros((0, 0), dtype=np.float32))
+                self.loaded_mtime_ns = -1
+            return
+        if mtime_ns == self.loaded_mtime_ns:
+            return
+        with open(self._index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.current = self._snapshot(index["ids"], index["metadata"], np.load(self._vectors_path, mmap_mode="r"))
+        self.loaded_mtime_ns = mtime_ns
+
+    def stale(self) -> bool:
+        """Whether `refresh` would reload; one stat call, cheap enough for the event loop."""
+        try:
+            return os.stat(self._index_path).st_mtime_ns != self.loaded_mtime_ns
+        except FileNotFoundError:
+            return self.loaded_mtime_ns != -1
+
+    def save(self, ids: List[str], metadata: List[Dict], matrix: np.ndarray) -> None:
+        # Vectors first, then the index whose mtime readers watch, each swapped in atomically
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_vectors = f"{self._vectors_path}.tmp.npy"
+        np.save(tmp_vectors, matrix)
+        os.replace(tmp_vectors, self._vectors_path)
+        tmp_index = f"{self._index_path}.tmp"
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadata": metadata}, f)
+        os.replace(tmp_index, self._index_path)
+        self.current = self._snapshot(ids, metadata, np.load(self._vectors_path, mmap_mode="r"))
+        self.loaded_mtime_ns = os.stat(self._index_path).st_mtime_ns
+
+    def _snapshot(self, ids: List[str], metadata: List[Dict], matrix: np.ndarray) -> _Snapshot:
+        # Codes are derived from the vectors on load rather than stored, so the ingestion
+        # script and the service can run with different settings
+        if not len(ids):
+            return _Snapshot(ids, metadata, matrix)
+        if self.quantization == "int8":
+            codes, scales = _int8_codes(matrix)
+            return _Snapshot(ids, metadata, matrix, codes, scales)
+        if self.quantization == "binary":
+            # Embeddings share a common direction; signs relative to the mean carry far more information
+            center = np.asarray(matrix.mean(axis=0), dtype=np.float32)
+            return _Snapshot(ids, metadata, matrix, _binary_codes(matrix, center), center=center)
+        return _Snapshot(ids, metadata, matrix)
+
+    def upsert(self, vectors: Sequence[Dict]) -> None:
+        current = self.current
+        rows = _normalize_rows(np.asarray([vector["values"] for vector in vectors], dtype=np.float32))
+        if len(current.ids) and current.matrix.shape[1] != rows.shape[1]:
+            raise ValueError(
+                f"Partition {self.directory} holds {current.matrix.shape[1]}-dim vectors, got {rows.shape[1]}; "
+                "delete it and re-ingest after changing the embedding dimensions"
+            )
+        ids, metadata = list(current.ids), list(current.metadata)
+        positions = {vector_id: i for i, vector_id in enumerate(ids)}
+        matrix = np.array(current.matrix) if len(ids) else np.zeros((0, rows.shape[1]), dtype=np.float32)
+        appended = []
+        for vector, row in zip(vectors, rows):
+            position = positions.get(vector["id"])
+            if position is None:
+                positions[vector["id"]] = len(ids)
+                ids.append(vector["id"])
+                metadata.append(vector.get("metadata", {}))
+                appended.append(row)
+            else:
+                matrix[position] = row
+                metadata[position] = vector.get("metadata", {})
+        if appended:
+            matrix = np.vstack([matrix, np.stack(appended)])
+        self.save(ids, metadata, matrix)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        current = self.current
+        doomed = set(ids)
+        keep = [i for i, vector_id in enumerate(current.ids) if vector_id not in doomed]
+        if len(keep) == len(current.ids):
+            return
+        matrix = np.array(current.matrix[keep]) if keep else np.zeros((0, current.matrix.shape[1]), dtype=np.float32)
+        self.save([current.ids[i] for i in keep], [current.metadata[i] for i in keep], matrix)
+
+    def query(self, vector: List[float], top_k: int) -> List[Dict]:
+        current = self.current
+        if not current.ids:
+            return []
+        query = _normalize_rows(np.asarray([vector], dtype=np.float32))[0]
+        if current.codes is None:
+            scores = current.matrix @ query
+            best = _top(scores, top_k)
+            return [
+                {"id": current.ids[i], "score": float(scores[i]), "metadata": current.metadata[i]}
+                for i in best
+            ]
+
+        # Coarse pass over the codes, then exact cosine for the shortlist only
+        if self.quantization == "int8":
+            coarse = _int8_scores(current.codes, current.scales, query)
+        else:
+            coarse = -_hamming(current.codes, _binary_codes(query[None, :], current.center))
+        shortlist = np.sort(_top(coarse, top_k * self.rerank_factor))
+        scores = current.matrix[shortlist] @ query
+        return [
+            {"id": current.ids[shortlist[i]], "score": float(scores[i]), "metadata": current.metadata[shortlist[i]]}
+            for i in _top(scores, top_k)
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        current = self.current
+        code_bytes = 0 if current.codes is None else current.codes.nbytes + (0 if current.scales is None else current.scales.nbytes)
+        return {"vectors": len(current.ids), "vector_bytes": current.matrix.nbytes, "code_bytes": code_bytes}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k)[:k]
+        return best[np.argsort(-scores[best])]
+    return np.argsort(-scores)
+
+def _int8_codes(matrix: np.ndarray, block_rows: int = 4096):
+    """Symmetric int8 codes with one float32 scale per row (row ~= codes * scale)."""
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        peak = np.abs(block).max(axis=1)
+        peak[peak == 0] = 1.0
+        scales[start:start + block_rows] = peak / 127
+        codes[start:start + block_rows] = np.rint(block / (peak / 127)[:, None])
+    return codes, scales
+
+def _int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray, block_rows: int = 256) -> np.ndarray:
+    # Widened a cache-sized block at a time: as fast as the float32 product, without a float copy of the index
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), block_rows):
+        scores[start:start + block_rows] = codes[start:start + block_rows].astype(np.float32) @ query
+    return scores * scales
+
+def _binary_codes(matrix: np.ndarray, center: np.ndarray, block_rows: int = 4096) -> np.ndarray:
+    """One bit per dimension (above or below `center`), packed 8 to a byte."""
+    codes = np.empty((len(matrix), (matrix.shape[1] + 7) // 8), dtype=np.uint8)
+    for start in range(0, len(matrix), block_rows):
+        codes[start:start + block_rows] = np.packbits(np.asarray(matrix[start:start + block_rows]) > center, axis=1)
+    return codes
+
+# Set bits per byte value; np.bitwise_count needs NumPy 2
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def _hamming(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    return _POPCOUNT[codes ^ query_code].sum(axis=1, dtype=np.int32)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store for small per-vehicle corpora. Each (user_id, vehicle_id)
+    partition is a memory-mapped float32 matrix on disk, searched with one batched
+    dot product (cosine similarity) and a partial sort for the top k.
+
+    `quantization` ("int8" or "binary") searches compact in-memory codes first and
+    reranks the best `top_k * rerank_factor` rows exactly; scores are always exact cosines.
+    """
+
+    def __init__(self, directory: str, quantization: str = "none", rerank_factor: int = 25):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization!r}")
+        self.directory = directory
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self._partitions: Dict[str, _LocalPartition] = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, user_id: str, vehicle_id: str) -> _LocalPartition:
+        key = partition_key(user_id, vehicle_id)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _LocalPartition(
+                os.path.join(self.directory, key), self.quantization, self.rerank_factor
+            )
+        partition.refresh()
+        return partition
+
+    def _refreshed(self, user_id: str, vehicle_id: str) -> _LocalPartition:
+        # Runs on a worker thread: loading a partition and building its codes is too slow for the loop
+        with self._lock:
+            return self._partition(user_id, vehicle_id)
+
+    def _write(self, user_id: str, vehicle_id: str, method: str, payload: Sequence) -> None:
+        # Runs on a worker thread; the lock serializes concurrent batches into one partition
+        with self._lock:
+            getattr(self._partition(user_id, vehicle_id), method)(payload)
+
+    async def upsert(self, user_id: str, vehicle_id: str, vectors: Sequence[Dict]) -> None:
+        if vectors:
+            await asyncio.to_thread(self._write, user_id, vehicle_id, "upsert", vectors)
+
+    async def query(self, user_id: str, vehicle_id: str, vector: List[float], top_k: int) -> List[Dict]:
+        # Typical partitions take well under a millisecond to search, so only a (re)load leaves the loop
+        partition = self._partitions.get(partition_key(user_id, vehicle_id))
+        if partition is None or partition.stale():
+            partition = await asyncio.to_thread(self._refreshed, user_id, vehicle_id)
+        return partition.query(vector, top_k)
+
+    async def delete(self, user_id: str, vehicle_id: str, ids: Sequence[str]) -> None:
+        if ids:
+            await asyncio.to_thread(self._write, user_id, vehicle_id, "delete", ids)
+
+    async def delete_partition(self, user_id: str, vehicle_id: str) -> None:
+        await asyncio.to_thread(self._drop, partition_key(user_id, vehicle_id))
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            self._partitions.pop(key, None)
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Vector count and bytes of full-precision vectors and of in-memory codes, over loaded partitions."""
+        totals = {"partitions": len(self._partitions), "vectors": 0, "vector_bytes": 0, "code_bytes": 0}
+        for partition in list(self._partitions.values()):
+            for name, value in partition.stats().items():
+                totals[name] += value
+        return totals
+
+
+def create_vector_store(
+    backend: str,
+    local_dir: str = ".cache/vectors",
+    pinecone_api_key: Optional[str] = None,
+    pinecone_index_name: str = "gear-ai-manuals",
+    max_concurrency: int = 16,
+    timeout_seconds: float = 10.0,
+    quantization: str = "none",
+    rerank_factor: int = 25,
+    partitioning: str = "namespace",
+    legacy_fallback: bool = False,
+) -> VectorStore:
+    """
+    Builds the configured backend: "pinecone" (hosted) or "local" (on-disk, in-process).
+    `quantization` applies to the local store; Pinecone manages its own index format.
+    `partitioning` and `legacy_fallback` apply to Pinecone; the local store always keeps
+    one directory per tenant.
+    """
+    if backend == "local":
+        return LocalVectorStore(local_dir, quantization, rerank_factor)
+    if backend == "pinecone":
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=pinecone_api_key)
+        return PineconeVectorStore(AsyncPineconeIndex(
+            pc.Index(pinecone_index_name, pool_threads=max_concurrency),
+            max_concurrency=max_concurrency,
+            timeout_seconds=timeout_seconds,
+        ), partitioning, legacy_fallback)
+    raise ValueError(f"Unknown vector store backend: {backend!r}")
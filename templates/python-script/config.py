@@ -29,14 +29,30 @@ class Config:
     # Environment-specific settings
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # Logs go to stderr and LOG_FILE (empty to disable), written by a background thread.
+    # The file rotates at LOG_MAX_BYTES, or on LOG_ROTATE_WHEN (e.g. "midnight") if set.
+    LOG_FILE: Optional[str] = os.getenv("LOG_FILE", "app.log") or None
+    LOG_JSON: bool = os.getenv("LOG_JSON", "False").lower() == "true"
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LOG_ROTATE_WHEN: Optional[str] = os.getenv("LOG_ROTATE_WHEN") or None
     
     # API settings (example)
     API_KEY: Optional[str] = os.getenv("API_KEY")
     API_URL: str = os.getenv("API_URL", "https://api.example.com")
     
     # Processing settings
+    # Input is read in chunks of CHUNK_SIZE bytes (cut at line ends unless LINE_ALIGNED
+    # is false); BATCH_SIZE chunks make one unit of work for a worker, retried up to
+    # MAX_RETRIES times if the transform fails. Files of MMAP_THRESHOLD bytes or more
+    # are memory-mapped. WORKERS > 1 runs batches on a process pool (0 = one per CPU).
     BATCH_SIZE: int = int(os.getenv("BATCH_SIZE", "100"))
     MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", str(64 * 1024)))
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    LINE_ALIGNED: bool = os.getenv("LINE_ALIGNED", "True").lower() == "true"
+    MMAP_THRESHOLD: int = int(os.getenv("MMAP_THRESHOLD", str(64 * 1024 * 1024)))
+    TRANSFORM: str = os.getenv("TRANSFORM", "engine:uppercase")
     
     @classmethod
     def ensure_directories(cls) -> None:
@@ -0,0 +1,274 @@
+"""
+Streaming processing engine.
+
+Reads an input file in chunks, runs each batch of chunks through a transform
+(in-process or across a process pool) and writes the results in input order,
+holding only a bounded number of batches in memory at a time.
+"""
+
+import importlib
+import logging
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Deque, Iterable, Iterator, List, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# A transform maps one chunk of input bytes to output bytes. To run across a process
+# pool it must be picklable, i.e. a module-level function.
+Transform = Callable[[bytes], bytes]
+
+
+def uppercase(chunk: bytes) -> bytes:
+    """
+    Example transform: upper-case the text of a chunk.
+
+    Bytes that are not valid UTF-8 (e.g. a character split by a fixed-size chunk
+    boundary) pass through unchanged.
+    """
+    return chunk.decode('utf-8', 'surrogateescape').upper().encode('utf-8', 'surrogateescape')
+
+
+def load_transform(spec: str) -> Transform:
+    """
+    Resolve a transform from a "module:function" string.
+
+    Args:
+        spec: Import path of the transform, e.g. "engine:uppercase"
+
+    Returns:
+        The transform function
+    """
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise ValueError(f"Transform must be given as module:function, got {spec!r}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+@dataclass
+class EngineStats:
+    """Counters for one engine run."""
+
+    bytes_in: int = 0
+    bytes_out: int = 0
+    chunks: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_in / self.seconds if self.seconds else 0.0
+
+
+# --- Reading ---
+
+def iter_chunks(
+    input_path: str,
+    chunk_size: int,
+    line_aligned: bool = True,
+    mmap_threshold: int = 64 * 1024 * 1024,
+) -> Iterator[bytes]:
+    """
+    Yield the contents of a file in chunks of about `chunk_size` bytes.
+
+    Line-aligned chunks end after a newline, so no line is split between two chunks
+    (a line longer than `chunk_size` becomes a chunk of its own). Files of at least
+    `mmap_threshold` bytes are memory-mapped rather than read through a buffer.
+
+    Args:
+        input_path: Path to the input file
+        chunk_size: Target chunk size in bytes
+        line_aligned: Whether to cut chunks at line boundaries
+        mmap_threshold: Minimum file size in bytes for memory-mapping
+
+    Yields:
+        Chunks of the file, in order
+    """
+    size = os.path.getsize(input_path)
+    if size == 0:
+        return
+    if size >= mmap_threshold:
+        yield from _iter_mmap_chunks(input_path, chunk_size, line_aligned)
+    else:
+        yield from _iter_buffered_chunks(input_path, chunk_size, line_aligned)
+
+
+def _iter_mmap_chunks(input_path: str, chunk_size: int, line_aligned: bool) -> Iterator[bytes]:
+    with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        size = len(mapped)
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if line_aligned and end < size:
+                newline = mapped.rfind(b'\n', start, end)
+                if newline == -1:
+                    newline = mapped.find(b'\n', end)
+                end = size if newline == -1 else newline + 1
+            yield mapped[start:end]
+            start = end
+
+
+def _iter_buffered_chunks(input_path: str, chunk_size: int, line_aligned: bool) -> Iterator[bytes]:
+    # Pieces of an unfinished line, joined once its newline arrives so long lines cost linear time
+    pending: List[bytes] = []
+    with open(input_path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            if line_aligned:
+                newline = block.rfind(b'\n')
+                if newline == -1:
+                    pending.append(block)
+                    continue
+                pending.append(block[:newline + 1])
+                data = b''.join(pending)
+                pending = [block[newline + 1:]] if newline + 1 < len(block) else []
+                yield data
+            else:
+                yield block
+    if pending:
+        yield b''.join(pending)
+
+
+def iter_batches(chunks: Iterable[bytes], batch_size: int) -> Iterator[List[bytes]]:
+    """
+    Group chunks into lists of up to `batch_size`.
+
+    Args:
+        chunks: Chunks to group
+        batch_size: Maximum chunks per batch
+
+    Yields:
+        Batches of chunks, in order
+    """
+    batch: List[bytes] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- Processing ---
+
+def run_batch(transform: Transform, batch: List[bytes], max_retries: int) -> Tuple[bytes, int]:
+    """
+    Apply a transform to every chunk of a batch, retrying the batch if it fails.
+
+    Args:
+        transform: Transform to apply
+        batch: Chunks to transform
+        max_retries: Retries after the first failed attempt
+
+    Returns:
+        (transformed chunks joined together, number of retries used)
+    """
+    attempt = 0
+    while True:
+        try:
+            return b''.join(transform(chunk) for chunk in batch), attempt
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            logger.warning("Transform failed on attempt %d of %d; retrying", attempt + 1, max_retries + 1, exc_info=True)
+            time.sleep(min(0.1 * 2 ** attempt, 5.0))
+            attempt += 1
+
+
+def process_stream(
+    chunks: Iterable[bytes],
+    output: BinaryIO,
+    transform: Transform = uppercase,
+    batch_size: int = 100,
+    workers: int = 1,
+    max_retries: int = 3,
+) -> EngineStats:
+    """
+    Transform a stream of chunks and write the results to `output` in input order.
+
+    With `workers` > 1, batches run on a process pool. At most two batches per worker
+    are in flight at a time, so memory stays bounded however large the input is.
+
+    Args:
+        chunks: Input chunks, e.g. from iter_chunks
+        output: Binary file-like object to write results to
+        transform: Transform applied to each chunk
+        batch_size: Chunks per batch (the unit of work sent to a worker)
+        workers: Worker processes; 1 runs in-process
+        max_retries: Retries for a batch whose transform fails
+
+    Returns:
+        Run statistics
+    """
+    stats = EngineStats()
+    started = time.perf_counter()
+
+    def write(data: bytes, retries: int) -> None:
+        output.write(data)
+        stats.bytes_out += len(data)
+        stats.retries += retries
+
+    def counted(batches: Iterable[List[bytes]]) -> Iterator[List[bytes]]:
+        for batch in batches:
+            stats.batches += 1
+            stats.chunks += len(batch)
+            stats.bytes_in += sum(len(chunk) for chunk in batch)
+            yield batch
+
+    batches = counted(iter_batches(chunks, batch_size))
+    if workers <= 1:
+        for batch in batches:
+            write(*run_batch(transform, batch, max_retries))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending: Deque[Future] = deque()
+            for batch in batches:
+                if len(pending) >= 2 * workers:
+                    write(*pending.popleft().result())
+                pending.append(pool.submit(run_batch, transform, batch, max_retries))
+            while pending:
+                write(*pending.popleft().result())
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def process_file(
+    input_path: str,
+    output: BinaryIO,
+    transform: Transform = uppercase,
+    chunk_size: int = 1024 * 1024,
+    batch_size: int = 100,
+    workers: int = 1,
+    max_retries: int = 3,
+    line_aligned: bool = True,
+    mmap_threshold: int = 64 * 1024 * 1024,
+) -> EngineStats:
+    """
+    Stream a file through a transform into `output`.
+
+    Args:
+        input_path: Path to the input file
+        output: Binary file-like object to write results to
+        transform: Transform applied to each chunk
+        chunk_size: Target chunk size in bytes
+        batch_size: Chunks per batch
+        workers: Worker processes; 1 runs in-process
+        max_retries: Retries for a batch whose transform fails
+        line_aligned: Whether to cut chunks at line boundaries
+        mmap_threshold: Minimum file size in bytes for memory-mapping
+
+    Returns:
+        Run statistics
+    """
+    chunks = iter_chunks(input_path, chunk_size, line_aligned, mmap_threshold)
+    return process_stream(chunks, output, transform, batch_size, workers, max_retries)
@@ -8,16 +8,20 @@ This script demonstrates a well-structured Python application with:
 - Error handling
 - Type hints
 - Documentation
+- Streaming, chunked processing across multiple cores (see engine.py)
 """
 
 import argparse
+import contextlib
 import logging
+import os
 import sys
 from typing import Optional
 from pathlib import Path
 
 from config import Config
-from utils import setup_logging, validate_file
+from engine import load_transform, process_file, uppercase
+from utils import format_size, setup_logging, validate_file
 
 
 # Configure logging
@@ -46,7 +50,14 @@ def main(args: argparse.Namespace) -> int:
         # Your main logic here
         logger.info("Processing data...")
         
-        result = process_data(args.input, args.output)
+        result = process_data(
+            args.input,
+            args.output,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            transform_spec=args.transform,
+            line_aligned=not args.fixed_size,
+        )
         
         logger.info(f"Script completed successfully. Result: {result}")
         return 0
@@ -56,37 +67,68 @@ def main(args: argparse.Namespace) -> int:
         return 1
 
 
-def process_data(input_path: Optional[str], output_path: Optional[str]) -> str:
+def process_data(
+    input_path: Optional[str],
+    output_path: Optional[str],
+    workers: int = Config.WORKERS,
+    chunk_size: int = Config.CHUNK_SIZE,
+    transform_spec: str = Config.TRANSFORM,
+    line_aligned: bool = Config.LINE_ALIGNED,
+) -> str:
     """
     Process data from input file and write to output file.
     
+    The input is streamed through the transform in chunks, so memory use does not
+    grow with the input size.
+    
     Args:
         input_path: Path to input file (optional)
         output_path: Path to output file (optional)
+        workers: Worker processes (1 = in-process, 0 = one per CPU)
+        chunk_size: Chunk size in bytes
+        transform_spec: Transform to apply, as "module:function"
+        line_aligned: Whether to cut chunks at line boundaries
         
     Returns:
         Status message
     """
-    if input_path:
-        logger.info(f"Reading from: {input_path}")
-        with open(input_path, 'r') as f:
-            data = f.read()
-            logger.debug(f"Read {len(data)} characters")
-    else:
-        data = "Sample data"
+    if not input_path:
         logger.info("Using sample data")
+        # Process the data (example: convert to uppercase)
+        processed_data = uppercase(b"Sample data")
+        if output_path:
+            logger.info(f"Writing to: {output_path}")
+            with open(output_path, 'wb') as output:
+                output.write(processed_data)
+            return f"Data written to {output_path}"
+        print(processed_data.decode())
+        return "Data printed to console"
     
-    # Process the data (example: convert to uppercase)
-    processed_data = data.upper()
+    transform = load_transform(transform_spec)
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Reading from: {input_path} ({workers} worker(s), {format_size(chunk_size)} chunks)")
     
     if output_path:
         logger.info(f"Writing to: {output_path}")
-        with open(output_path, 'w') as f:
-            f.write(processed_data)
-        return f"Data written to {output_path}"
-    else:
-        print(processed_data)
-        return "Data printed to console"
+    with open(output_path, 'wb') if output_path else contextlib.nullcontext(sys.stdout.buffer) as output:
+        stats = process_file(
+            input_path,
+            output,
+            transform=transform,
+            chunk_size=chunk_size,
+            batch_size=Config.BATCH_SIZE,
+            workers=workers,
+            max_retries=Config.MAX_RETRIES,
+            line_aligned=line_aligned,
+            mmap_threshold=Config.MMAP_THRESHOLD,
+        )
+        output.flush()
+    
+    logger.info(
+        f"Processed {format_size(stats.bytes_in)} in {stats.chunks} chunks ({stats.batches} batches, "
+        f"{stats.retries} retries) in {stats.seconds:.2f}s: {format_size(stats.bytes_per_second)}/s"
+    )
+    return f"Data written to {output_path}" if output_path else "Data printed to console"
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -113,6 +155,33 @@ def parse_arguments() -> argparse.Namespace:
         help='Output file path'
     )
     
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=Config.WORKERS,
+        help='Worker processes (1 = in-process, 0 = one per CPU)'
+    )
+    
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=Config.CHUNK_SIZE,
+        help='Chunk size in bytes'
+    )
+    
+    parser.add_argument(
+        '--transform',
+        type=str,
+        default=Config.TRANSFORM,
+        help='Transform applied to each chunk, as module:function'
+    )
+    
+    parser.add_argument(
+        '--fixed-size',
+        action='store_true',
+        help='Cut chunks at exact byte offsets instead of line boundaries'
+    )
+    
     parser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -134,7 +203,14 @@ if __name__ == '__main__':
     
     # Setup logging
     log_level = logging.DEBUG if args.verbose else logging.INFO
-    setup_logging(log_level)
+    setup_logging(
+        log_level,
+        log_file=Config.LOG_FILE,
+        json_output=Config.LOG_JSON,
+        max_bytes=Config.LOG_MAX_BYTES,
+        backup_count=Config.LOG_BACKUP_COUNT,
+        rotate_when=Config.LOG_ROTATE_WHEN,
+    )
     
     # Run main function and exit with status code
     sys.exit(main(args))
@@ -4,28 +4,150 @@ Utility functions for the script.
 Common helper functions and utilities.
 """
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
 
-def setup_logging(level: int = logging.INFO) -> None:
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted; the listener thread formats and writes them."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Drop the record rather than stall processing behind a slow disk
+            pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    log_file: Optional[str] = 'app.log',
+    json_output: bool = False,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: Optional[str] = None,
+    sample_rates: Optional[Dict[str, float]] = None,
+    queue_size: int = 10000,
+) -> None:
     """
     Configure logging for the application.
-    
+
+    Log calls only put the record on a bounded queue; a background thread formats it
+    and writes it to stderr (stdout is left for data output) and to `log_file`. The
+    log file rotates at `max_bytes`, or on a schedule when `rotate_when` is set.
+
     Args:
         level: Logging level (e.g., logging.INFO, logging.DEBUG)
+        log_file: Log file path, or None to log to stderr only
+        json_output: Whether to write one JSON object per line
+        max_bytes: Size at which the log file rotates
+        backup_count: Rotated log files to keep
+        rotate_when: TimedRotatingFileHandler interval (e.g. "midnight") instead of size
+        sample_rates: Fraction of each named logger's sub-WARNING records to keep
+        queue_size: Records held before new ones are dropped
     """
-    logging.basicConfig(
-        level=level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler('app.log')
-        ]
-    )
+    global _listener
+    stop_logging()
+
+    if json_output:
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S',
+        )
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        if rotate_when:
+            handlers.append(logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    for name, rate in (sample_rates or {}).items():
+        sampled_logger = logging.getLogger(name)
+        sampled_logger.filters = [f for f in sampled_logger.filters if not isinstance(f, SamplingFilter)]
+        if rate < 1.0:
+            sampled_logger.addFilter(SamplingFilter(rate))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the background log writer, if running."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _log_directly_after_fork() -> None:
+    # A forked worker (e.g. the engine's process pool) inherits the queue but not the
+    # listener thread, so it writes through the handlers itself
+    global _listener
+    if _listener is not None:
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in _listener.handlers:
+            root.addHandler(handler)
+        _listener = None
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_log_directly_after_fork)
 
 
 def validate_file(file_path: str) -> bool: